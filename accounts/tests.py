@@ -1,3 +1,43 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from apps.orgs.models import Company, Membership, Role
+from apps.orgs.testing import FIXTURE_SIZES, TEST_STORAGES, Budget, QueryBudgetMixin, seed_company, url_names
+
+User = get_user_model()
+
+
+class MembershipListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='user', email='user@example.com', password='pass')
+        role = Role.objects.get(slug='member')
+        for i in range(3):
+            company = Company.objects.create(name=f'Company {i}', owner=cls.user, creator=cls.user)
+            Membership.objects.create(user=cls.user, company=company, role=role)
+
+    def test_membership_list_json_pages(self):
+        self.client.force_login(self.user)
+        url = reverse('orgs_membership_list')
+        data = self.client.get(url, {'format': 'json', 'per_page': 2}).json()
+        self.assertEqual([m['company']['name'] for m in data['results']], ['Company 0', 'Company 1'])
+        data = self.client.get(url, {'format': 'json', 'after': data['next']}).json()
+        self.assertEqual([m['role'] for m in data['results']], ['Member'])
+        self.assertIsNone(data['next'])
+
+
+ACCOUNTS_QUERY_BUDGETS = {
+    'profile': Budget(2),
+    'orgs_membership_list': Budget(3),
+}
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class AccountsQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixtures = [seed_company(size) for size in FIXTURE_SIZES]
+
+    def test_every_accounts_url_is_within_budget(self):
+        self.assertViewBudgets(ACCOUNTS_QUERY_BUDGETS, self.fixtures, names=url_names('accounts.urls'))
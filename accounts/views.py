@@ -1,10 +1,27 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render
+from apps.orgs.decorators import login_required as async_login_required
+from apps.orgs.pagination import apaginate_keyset, wants_json, keyset_json_response
+from apps.orgs.viewcache import cache_per_user
 
 @login_required
 def profile(request):
     return render(request, 'account/profile.html')
 
-def membership_list(request):
-    memberships = request.user.memberships.all()
-    return render(request, 'account/membership_list.html', {'memberships': memberships})    
\ No newline at end of file
+@async_login_required
+@cache_per_user()
+async def membership_list(request):
+    memberships = await apaginate_keyset(
+        request,
+        request.user.memberships.select_related('company', 'role'),
+        ('date_joined', 'id'),
+    )
+    if wants_json(request):
+        return keyset_json_response(memberships, lambda m: {
+            'id': m.id,
+            'date_joined': m.date_joined,
+            'company': {'id': m.company_id, 'name': m.company.name},
+            'role': m.role.name if m.role else None,
+        })
+    return await sync_to_async(render)(request, 'account/membership_list.html', {'memberships': memberships})
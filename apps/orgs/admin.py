@@ -4,9 +4,16 @@ from django.contrib import admin
 # admin.py
 from django import forms
 from invitations.admin import InvitationAdmin
-from .models import CompanyInvitation,Company,Membership,Role
+from .models import CompanyInvitation,Company,Membership,Role,InvitationOutbox
 
-admin.site.register(Membership)
+class MembershipAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'company', 'role', 'date_joined')
+    # __str__ reads user, role and company
+    list_select_related = ('user', 'role', 'company')
+    raw_id_fields = ('user', 'company')
+
+
+admin.site.register(Membership, MembershipAdmin)
 
 class CompanyAdminForm(forms.ModelForm):
     class Meta:
@@ -16,10 +23,20 @@ class CompanyAdminForm(forms.ModelForm):
 
 class CompanyAdmin(admin.ModelAdmin):
     form = CompanyAdminForm
-    list_display = ('name', 'owner')
+    list_display = ('name', 'owner', 'member_count', 'unaccepted_invitation_count')
     search_fields = ['name']
 
 
 admin.site.register(Company, CompanyAdmin)
 
 admin.site.register(Role)
+
+
+class InvitationOutboxAdmin(admin.ModelAdmin):
+    list_display = ('invitation', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    list_select_related = ('invitation',)
+    raw_id_fields = ('invitation',)
+
+
+admin.site.register(InvitationOutbox, InvitationOutboxAdmin)
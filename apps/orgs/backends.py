@@ -0,0 +1,44 @@
+from django.contrib.auth.backends import BaseBackend
+
+from .models import Company, Membership
+
+
+class CompanyPermissionBackend(BaseBackend):
+    """
+    Object permissions scoped to a company.
+
+    ``user.has_perm("orgs.change_company", company)`` is answered from the
+    permissions of the user's role in that company. All of a user's
+    memberships, roles and permissions are loaded in a single query on first
+    use and kept on the user object as ``{company_id: frozenset(perms)}``,
+    so any number of checks across companies cost no further queries.
+    """
+
+    cache_attr = "_company_perm_cache"
+
+    def get_company_permissions(self, user_obj):
+        if not hasattr(user_obj, self.cache_attr):
+            perms = {}
+            rows = Membership.objects.filter(user=user_obj).values_list(
+                "company_id",
+                "role__permissions__content_type__app_label",
+                "role__permissions__codename",
+            )
+            for company_id, app_label, codename in rows:
+                company_perms = perms.setdefault(company_id, set())
+                if codename:
+                    company_perms.add(f"{app_label}.{codename}")
+            setattr(
+                user_obj,
+                self.cache_attr,
+                {company_id: frozenset(p) for company_id, p in perms.items()},
+            )
+        return getattr(user_obj, self.cache_attr)
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or not isinstance(obj, Company):
+            return set()
+        return set(self.get_company_permissions(user_obj).get(obj.pk, ()))
+
+    def has_perm(self, user_obj, perm, obj=None):
+        return perm in self.get_all_permissions(user_obj, obj)
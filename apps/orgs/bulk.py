@@ -0,0 +1,185 @@
+import csv
+import io
+import re
+import secrets
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone, translation
+from invitations.adapters import get_invitations_adapter
+from invitations.app_settings import app_settings
+
+from . import counters
+from .models import CompanyInvitation, InvitationOutbox
+
+BULK_CHUNK_SIZE = 1000
+# Most addresses the bulk invite page handles within the request; about 3 s
+# of work. Bigger lists go through `manage.py bulk_invite`.
+INLINE_MAX_ROWS = getattr(settings, 'ORGS_BULK_INVITE_MAX_ROWS', 5000)
+
+INVITED = "invited"
+INVALID = "invalid"
+DUPLICATE = "duplicate"
+ALREADY_INVITED = "already_invited"
+ALREADY_ACCEPTED = "already_accepted"
+
+_SEPARATORS = re.compile(r"[\s,;]+")
+
+
+def emails_from_text(text):
+    """Addresses pasted as free text, separated by commas, semicolons or whitespace."""
+    return [value for value in _SEPARATORS.split(text) if value]
+
+
+def emails_from_csv(stream):
+    """
+    Addresses from a CSV file (bytes or text stream).
+
+    Uses the ``email`` column when the first row is a header naming one,
+    otherwise the first column of every row.
+    """
+    if isinstance(stream.read(0), bytes):
+        stream = io.TextIOWrapper(stream, encoding="utf-8-sig", errors="replace")
+    reader = csv.reader(stream)
+    column = 0
+    for line_no, row in enumerate(reader):
+        if not row:
+            continue
+        if line_no == 0:
+            header = [value.strip().lower() for value in row]
+            if "email" in header:
+                column = header.index("email")
+                continue
+        if column < len(row) and row[column].strip():
+            yield row[column]
+
+
+def normalize_email(value):
+    email = get_invitations_adapter().clean_email(value.strip()).lower()
+    validate_email(email)
+    return email
+
+
+class BulkInviteResult:
+    def __init__(self):
+        self.rows = []
+
+    def add(self, email, status):
+        self.rows.append((email, status))
+
+    def count(self, status):
+        return sum(1 for _, row_status in self.rows if row_status == status)
+
+    @property
+    def invited(self):
+        return self.count(INVITED)
+
+    @property
+    def rejected(self):
+        """The rows that weren't invited, in input order."""
+        return [(email, status) for email, status in self.rows if status != INVITED]
+
+    def summary(self):
+        counts = {}
+        for _, status in self.rows:
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def bulk_invite(company, inviter, emails, absolute_url, site_name, chunk_size=BULK_CHUNK_SIZE):
+    """
+    Invite many addresses to `company` at once.
+
+    Addresses are normalised and de-duplicated, then handled in chunks: one
+    ``email__in`` query finds existing invitations, the new ones are inserted
+    with ``bulk_create`` and their e-mails are queued in the outbox in the
+    same way. `absolute_url` turns a path into a full URL (for example
+    ``request.build_absolute_uri``). Returns a :class:`BulkInviteResult`
+    with a status for every input row, in input order.
+    """
+    result = BulkInviteResult()
+    seen = set()
+    pending = []
+    for value in emails:
+        try:
+            email = normalize_email(value)
+        except ValidationError:
+            result.add(value.strip(), INVALID)
+            continue
+        if email in seen:
+            result.add(email, DUPLICATE)
+            continue
+        seen.add(email)
+        # placeholder, resolved chunk by chunk below
+        result.add(email, None)
+        pending.append(len(result.rows) - 1)
+
+    language = translation.get_language()
+    for chunk in _chunks(pending, chunk_size):
+        statuses = _invite_chunk(
+            company, inviter, [result.rows[i][0] for i in chunk], absolute_url, site_name, language
+        )
+        for i in chunk:
+            email = result.rows[i][0]
+            result.rows[i] = (email, statuses[email])
+    return result
+
+
+def _invite_chunk(company, inviter, emails, absolute_url, site_name, language):
+    statuses = {}
+    # one invitation per (company, address), see CompanyInvitation.Meta
+    existing = CompanyInvitation.objects.for_emails(emails).filter(company=company).values_list("email", "accepted")
+    for email, accepted in existing:
+        statuses[email.lower()] = ALREADY_ACCEPTED if accepted else ALREADY_INVITED
+
+    now = timezone.now()
+    invitations = [
+        CompanyInvitation(
+            company=company,
+            email=email,
+            # 64 lowercase characters like CompanyInvitation.create's keys
+            # (hex rather than its [a-z0-9]), much cheaper to generate
+            key=secrets.token_hex(32),
+            inviter=inviter,
+            sent=now,
+        )
+        for email in emails
+        if email not in statuses
+    ]
+    # reverse() once; only the key differs between invite URLs
+    url_template = absolute_url(reverse(app_settings.CONFIRMATION_URL_NAME, args=["__key__"]))
+    with transaction.atomic():
+        # a concurrent invite for the same address just loses the race
+        CompanyInvitation.objects.bulk_create(invitations, ignore_conflicts=True)
+        created = CompanyInvitation.objects.filter(key__in=[i.key for i in invitations]).values_list("id", "email", "key")
+        outbox = []
+        for invitation_id, email, key in created:
+            statuses[email] = INVITED
+            outbox.append(
+                InvitationOutbox(
+                    invitation_id=invitation_id,
+                    language=language,
+                    context={
+                        "invite_url": url_template.replace("__key__", key),
+                        "site_name": site_name,
+                        "email": email,
+                        "key": key,
+                    },
+                )
+            )
+        InvitationOutbox.objects.bulk_create(outbox)
+        if outbox:
+            # bulk_create sends no post_save
+            counters.adjust({company.pk: (0, len(outbox))}, owner_ids=[company.owner_id])
+
+    for invitation in invitations:
+        statuses.setdefault(invitation.email, ALREADY_INVITED)
+    return statuses
@@ -0,0 +1,156 @@
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from . import viewcache
+from .models import Company, CompanyInvitation, Membership
+
+_suspended = contextvars.ContextVar("orgs_counters_suspended", default=False)
+_cascade = contextvars.ContextVar("orgs_counters_cascade", default=None)
+
+
+def adjust(deltas, owner_ids=None):
+    """
+    Apply ``{company_id: (members, pending)}`` deltas to the counter columns.
+
+    Uses ``F()`` expressions so concurrent writers don't lose updates, and
+    issues one UPDATE per distinct delta pair rather than one per company.
+    Decrements stop at zero, so a counter that drifted low can't violate
+    the column's constraint; ``manage.py recount`` repairs it.
+    The companies' owners get their cached pages dropped; pass `owner_ids`
+    when the caller already knows them to skip looking them up.
+    """
+    groups = defaultdict(list)
+    for company_id, delta in deltas.items():
+        if delta != (0, 0):
+            groups[delta].append(company_id)
+    for (members, pending), company_ids in groups.items():
+        changes = {}
+        if members:
+            changes["member_count"] = _shifted("member_count", members)
+        if pending:
+            changes["unaccepted_invitation_count"] = _shifted("unaccepted_invitation_count", pending)
+        Company.objects.filter(pk__in=company_ids).update(**changes)
+    if groups:
+        # the owners' company lists show these counts
+        if owner_ids is None:
+            changed = [company_id for company_ids in groups.values() for company_id in company_ids]
+            owner_ids = Company.objects.filter(pk__in=changed).values_list("owner_id", flat=True)
+        viewcache.invalidate_users(*owner_ids)
+
+
+def _shifted(field, delta):
+    return F(field) + delta if delta > 0 else Greatest(F(field) + delta, 0)
+
+
+def adjust_one(company_id, members=0, pending=0):
+    if is_suspended():
+        return
+    cascade = _current_cascade()
+    if cascade is not None:
+        cascade.add(company_id, members, pending)
+    else:
+        adjust({company_id: (members, pending)})
+
+
+def is_suspended():
+    return _suspended.get()
+
+
+@contextmanager
+def suspended():
+    """
+    Skip the per-row signal updates, for bulk paths that adjust the
+    counters themselves with one aggregated :func:`adjust` call.
+    """
+    token = _suspended.set(True)
+    try:
+        yield
+    finally:
+        _suspended.reset(token)
+
+
+class _Cascade:
+    """The counter deltas of one ``Model.delete()`` or ``QuerySet.delete()`` call."""
+
+    def __init__(self, block):
+        # the deletion's atomic block: once it's gone, so is the deletion
+        self.block = block
+        self.roots = set()
+        self.dropped = set()
+        self.deltas = defaultdict(lambda: (0, 0))
+
+    def add(self, company_id, members, pending):
+        current = self.deltas[company_id]
+        self.deltas[company_id] = (current[0] + members, current[1] + pending)
+
+
+def _current_cascade():
+    cascade = _cascade.get()
+    if cascade is not None and cascade.block not in transaction.get_connection().atomic_blocks:
+        # that deletion raised before finishing, and its deltas were rolled
+        # back with it
+        _cascade.set(None)
+        return None
+    return cascade
+
+
+def begin_cascade(instance, company_id=None):
+    """
+    Start collecting the per-row counter updates of a deletion, from the
+    ``pre_delete`` signal of every row it deletes (users, companies, and
+    the memberships and invitations deleted with them or on their own).
+    Django sends every ``pre_delete`` before deleting anything and the
+    dependants' ``post_delete`` before their parents', so all the rows of
+    one ``delete()`` call are counted into one batch that
+    :func:`end_cascade` applies with a single :func:`adjust`. Pass the
+    `company_id` of a company being deleted to drop its own deltas.
+    """
+    cascade = _current_cascade()
+    if cascade is None:
+        cascade = _Cascade(transaction.get_connection().atomic_blocks[-1])
+        _cascade.set(cascade)
+    cascade.roots.add((instance._meta.label, instance.pk))
+    if company_id is not None:
+        cascade.dropped.add(company_id)
+
+
+def end_cascade(instance):
+    """Apply the batch once the last model that started it is deleted."""
+    cascade = _current_cascade()
+    if cascade is None:
+        return
+    cascade.roots.discard((instance._meta.label, instance.pk))
+    if not cascade.roots:
+        _cascade.set(None)
+        adjust({
+            company_id: delta for company_id, delta in cascade.deltas.items()
+            if company_id not in cascade.dropped
+        })
+
+
+def _count(queryset):
+    counted = queryset.filter(company=OuterRef("pk")).order_by().values("company").annotate(n=Count("pk")).values("n")
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def recount(companies=None):
+    """
+    Recompute the counters from the membership and invitation tables for
+    `companies` (a Company queryset, default all) and fix the rows that
+    drifted. Returns the number of companies corrected.
+    """
+    if companies is None:
+        companies = Company.objects.all()
+    members = _count(Membership.objects.all())
+    pending = _count(CompanyInvitation.objects.filter(accepted=False))
+    drifted = companies.annotate(actual_members=members, actual_pending=pending).filter(
+        ~Q(member_count=F("actual_members")) | ~Q(unaccepted_invitation_count=F("actual_pending"))
+    )
+    return Company.objects.filter(pk__in=drifted.values("pk")).update(
+        member_count=members, unaccepted_invitation_count=pending,
+    )
@@ -1,31 +1,89 @@
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.contrib.auth import REDIRECT_FIELD_NAME
+from django.contrib.auth.decorators import login_required as sync_login_required
+from django.contrib.auth.views import redirect_to_login
 from django.http import HttpResponseForbidden
-from apps.orgs.models import Membership,Company
-from django.contrib.auth.decorators import login_required
+from apps.orgs.models import Membership
+
+
+def login_required(view_func):
+    """
+    Django's login_required, which only supports async views from 5.1 on;
+    async views get a check on ``request.auser()`` instead. Drop this once
+    on 5.1.
+    """
+    if not iscoroutinefunction(view_func):
+        return sync_login_required(view_func)
+
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        # resolved once here so views and templates don't load it lazily,
+        # which the async context doesn't allow
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), redirect_field_name=REDIRECT_FIELD_NAME)
+        return await view_func(request, *args, **kwargs)
+    return _wrapped_view
+
+
+def _membership_query(request, company_id):
+    return Membership.objects.select_related('company', 'role').filter(user=request.user, company_id=company_id)
+
+
+def resolve_membership(request, company_id):
+    """
+    Return the current user's membership in `company_id`, or None.
 
-def role_required(role_name):
+    The membership is fetched once per request together with its company and
+    role and attached to the request as `request.membership`, so decorators,
+    views and templates can all reuse it without further queries.
+    """
+    memberships = request.__dict__.setdefault('_memberships', {})
+    company_id = int(company_id)
+    if company_id not in memberships:
+        memberships[company_id] = _membership_query(request, company_id).first()
+    request.membership = memberships[company_id]
+    return request.membership
+
+
+async def aresolve_membership(request, company_id):
+    """Async :func:`resolve_membership`."""
+    memberships = request.__dict__.setdefault('_memberships', {})
+    company_id = int(company_id)
+    if company_id not in memberships:
+        memberships[company_id] = await _membership_query(request, company_id).afirst()
+    request.membership = memberships[company_id]
+    return request.membership
+
+
+def role_required(role_slug):
     def decorator(view_func):
         @login_required
         def _wrapped_view(request, *args, **kwargs):
-            user = request.user
             company_id = kwargs.get('company_id')  # Assuming tenant is passed as a keyword argument to the view
-            company = Company.objects.get(id=company_id)
-            try:
-                membership = Membership.objects.get(user=user, company=company)
-                if membership.role.name != role_name:
-                    return HttpResponseForbidden()
-            except Membership.DoesNotExist:
+            membership = resolve_membership(request, company_id)
+            if membership is None or membership.role is None or membership.role.slug != role_slug:
                 return HttpResponseForbidden()
             return view_func(request, *args, **kwargs)
         return _wrapped_view
     return decorator
 
 def company_member_required(view_func):
+    if iscoroutinefunction(view_func):
+        @login_required
+        @wraps(view_func)
+        async def _wrapped_view(request, *args, **kwargs):
+            if await aresolve_membership(request, kwargs.get('company_id')) is None:
+                return HttpResponseForbidden()
+            return await view_func(request, *args, **kwargs)
+        return _wrapped_view
+
     @login_required
     def _wrapped_view(request, *args, **kwargs):
         company_id = kwargs.get('company_id')  # Assuming company_id is passed as a keyword argument to the view
-        try:
-            membership = Membership.objects.get(user=request.user, company_id=company_id)
-        except Membership.DoesNotExist:
+        if resolve_membership(request, company_id) is None:
             return HttpResponseForbidden()
         return view_func(request, *args, **kwargs)
-    return _wrapped_view
\ No newline at end of file
+    return _wrapped_view
@@ -1,4 +1,7 @@
+import datetime
+
 from django import forms
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.utils.translation import gettext_lazy as _
 from .models import Company
@@ -6,15 +9,31 @@ from invitations.forms import CleanEmailMixin
 from invitations.exceptions import AlreadyAccepted, AlreadyInvited, UserRegisteredEmail
 from invitations.utils import get_invitation_model
 from invitations.adapters import get_invitations_adapter
+from invitations.app_settings import app_settings
+from .bulk import INLINE_MAX_ROWS, emails_from_csv, emails_from_text
 
 
 Invitation = get_invitation_model()
 
 class CustomCleanEmailMixin:
-    def validate_invitation(self, email):
-        if Invitation.objects.all_valid().filter(email__iexact=email, accepted=False):
+    errors_messages = {
+        "already_invited": _("This e-mail address has already been" " invited."),
+        "already_accepted": _(
+            "This e-mail address has already" " accepted an invite.",
+        ),
+        # "email_in_use": _("An active user is using this e-mail address"),
+    }
+
+    def validate_invitation(self, email, company=None):
+        # one indexed query for both checks
+        invitations = Invitation.objects.for_email(email)
+        if company is not None:
+            invitations = invitations.filter(company=company)
+        invitations = list(invitations.values('accepted', 'sent'))
+        sent_threshold = timezone.now() - datetime.timedelta(days=app_settings.INVITATION_EXPIRY)
+        if any(not i['accepted'] and (i['sent'] is None or i['sent'] >= sent_threshold) for i in invitations):
             raise AlreadyInvited
-        elif Invitation.objects.filter(email__iexact=email, accepted=True):
+        elif any(i['accepted'] for i in invitations):
             raise AlreadyAccepted
         # elif get_user_model().objects.filter(email__iexact=email):
         #     raise UserRegisteredEmail
@@ -23,24 +42,24 @@ class CustomCleanEmailMixin:
 
     def clean_email(self):
         email = self.cleaned_data["email"]
-        email = get_invitations_adapter().clean_email(email)
-
-        errors = {
-            "already_invited": _("This e-mail address has already been" " invited."),
-            "already_accepted": _(
-                "This e-mail address has already" " accepted an invite.",
-            ),
-            # "email_in_use": _("An active user is using this e-mail address"),
-        }
+        return get_invitations_adapter().clean_email(email)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        email = cleaned_data.get("email")
+        company = cleaned_data.get("company")
+        if not email or not company:
+            return cleaned_data
+        # invitations are per company, so this needs the cleaned company
         try:
-            self.validate_invitation(email)
+            self.validate_invitation(email, company)
         except AlreadyInvited:
-            raise forms.ValidationError(errors["already_invited"])
+            self.add_error("email", self.errors_messages["already_invited"])
         except AlreadyAccepted:
-            raise forms.ValidationError(errors["already_accepted"])
+            self.add_error("email", self.errors_messages["already_accepted"])
         # except UserRegisteredEmail:
-        #     raise forms.ValidationError(errors["email_in_use"])
-        return email
+        #     self.add_error("email", self.errors_messages["email_in_use"])
+        return cleaned_data
 
 class CompanyInvitationForm(CustomCleanEmailMixin, forms.ModelForm):
     email = forms.EmailField(
@@ -75,6 +94,44 @@ class CompanyInvitationForm(CustomCleanEmailMixin, forms.ModelForm):
         instance.send_invitation(self.request)
         return instance
 
+class BulkInvitationForm(forms.Form):
+    company = forms.ModelChoiceField(queryset=Company.objects.none())
+    emails = forms.CharField(
+        label=_("E-mail addresses"),
+        required=False,
+        widget=forms.Textarea(attrs={"rows": 6}),
+        help_text=_("Separated by commas, semicolons or new lines."),
+    )
+    csv_file = forms.FileField(
+        label=_("CSV file"),
+        required=False,
+        help_text=_("One address per row, or a column named \"email\"."),
+    )
+
+    def __init__(self, *args, **kwargs):
+        self.inviter = kwargs.pop('inviter')
+        super().__init__(*args, **kwargs)
+        self.fields['company'].queryset = Company.objects.filter(owner=self.inviter)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('emails') and not cleaned_data.get('csv_file'):
+            raise forms.ValidationError(_("Paste some addresses or upload a CSV file."))
+        emails = emails_from_text(cleaned_data.get('emails') or '')
+        if cleaned_data.get('csv_file'):
+            emails.extend(emails_from_csv(cleaned_data['csv_file']))
+        if len(emails) > INLINE_MAX_ROWS:
+            raise forms.ValidationError(
+                _("%(count)d addresses is more than the %(max)d this page can invite at once. "
+                  "Split the list, or ask an administrator to run `manage.py bulk_invite` with the file."),
+                params={'count': len(emails), 'max': INLINE_MAX_ROWS},
+            )
+        self._emails = emails
+        return cleaned_data
+
+    def get_emails(self):
+        return self._emails
+
 class InvitationAdminAddForm(forms.ModelForm, CleanEmailMixin):
     email = forms.EmailField(
         label=_("E-mail"),
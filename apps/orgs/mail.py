@@ -0,0 +1,290 @@
+import copy
+import datetime
+import itertools
+import json
+import logging
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone, translation
+from django.utils.html import escape
+from invitations import signals
+from invitations.adapters import get_invitations_adapter
+
+from .models import InvitationOutbox
+
+logger = logging.getLogger(__name__)
+
+EMAIL_TEMPLATE = "invitations/email/email_invite"
+
+OUTBOX_MAX_ATTEMPTS = getattr(settings, "ORGS_OUTBOX_MAX_ATTEMPTS", 6)
+# first retry after BASE seconds, doubling up to MAX
+OUTBOX_BACKOFF_BASE = getattr(settings, "ORGS_OUTBOX_BACKOFF_BASE", 30)
+OUTBOX_BACKOFF_MAX = getattr(settings, "ORGS_OUTBOX_BACKOFF_MAX", 60 * 60)
+# how long a claimed row stays invisible to other workers
+OUTBOX_LEASE = getattr(settings, "ORGS_OUTBOX_LEASE", 5 * 60)
+# company/inviter/language combinations kept pre-rendered, see InvitationRenderer
+RENDER_CACHE_SIZE = getattr(settings, "ORGS_INVITE_RENDER_CACHE_SIZE", 512)
+# messages sent over one connection before it is recycled
+MAILER_MAX_MESSAGES = getattr(settings, "ORGS_MAILER_MAX_MESSAGES", 100)
+
+
+class InvitationMailer:
+    """
+    Send many messages over one mail connection.
+
+    The connection is opened lazily, recycled after `max_messages` (servers
+    commonly cap messages per session) and dropped after any error so the
+    next message starts on a fresh one. Use as a context manager::
+
+        with InvitationMailer() as mailer:
+            for message in messages:
+                mailer.send(message)
+    """
+
+    def __init__(self, max_messages=None, **connection_kwargs):
+        self.max_messages = max_messages or MAILER_MAX_MESSAGES
+        self.connection_kwargs = connection_kwargs
+        self.connection = None
+        self.sent_on_connection = 0
+        self.connections_opened = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        self.connection = get_connection(**self.connection_kwargs)
+        self.connection.open()
+        self.connections_opened += 1
+        self.sent_on_connection = 0
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                # the server may already have hung up, nothing left to clean up
+                pass
+            self.connection = None
+
+    def send(self, message):
+        if self.connection is None:
+            self.open()
+        message.connection = self.connection
+        try:
+            message.send()
+        except Exception:
+            self.close()
+            raise
+        self.sent_on_connection += 1
+        if self.sent_on_connection >= self.max_messages:
+            self.close()
+
+
+def backoff_delay(attempts):
+    return min(OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1), OUTBOX_BACKOFF_MAX)
+
+
+def claim_due(batch_size, now=None):
+    """
+    Claim up to `batch_size` due rows for this worker.
+
+    Claimed rows get their attempt counted and their next attempt pushed past
+    the lease, so concurrent workers skip them and a crashed worker's rows are
+    retried once the lease runs out. The transaction is held only for the
+    claim, never while talking to the mail server.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        rows = list(
+            InvitationOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status=InvitationOutbox.Status.PENDING, next_attempt_at__lte=now)
+            .order_by("next_attempt_at", "id")[:batch_size]
+        )
+        ids = [row.pk for row in rows]
+        InvitationOutbox.objects.filter(pk__in=ids).update(
+            attempts=F("attempts") + 1,
+            next_attempt_at=now + datetime.timedelta(seconds=OUTBOX_LEASE),
+        )
+    return list(
+        InvitationOutbox.objects.filter(pk__in=ids)
+        .select_related("invitation__inviter")
+        .order_by("next_attempt_at", "id")
+    )
+
+
+def render_message(row, context=None):
+    context = dict(row.context if context is None else context)
+    context["inviter"] = row.invitation.inviter
+    with translation.override(row.language):
+        return get_invitations_adapter().render_mail(EMAIL_TEMPLATE, row.invitation.email, context)
+
+
+class InvitationRenderer:
+    """
+    Render invitation e-mails from cached, pre-rendered fragments.
+
+    Only the invite URL, address and key differ between the recipients of
+    one company, inviter and language. The subject and bodies are rendered
+    once per such combination with placeholders for those fields, and each
+    recipient's message is made by substituting them.
+
+    When a combination is first seen, the message is rendered in full for the
+    recipient and for probe values containing characters that HTML escaping
+    changes. For each part (subject, body, alternatives) that settles which
+    fields the template autoescapes, so substituted values are escaped
+    exactly where a full render would escape them. Templates that transform
+    the fields in any other way (filters, conditionals) match no choice and are
+    always rendered in full instead.
+    """
+
+    PER_RECIPIENT_FIELDS = ("invite_url", "email", "key")
+    PROBE = "o'brien&<b>\"x\""
+    UNCACHEABLE = object()
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or RENDER_CACHE_SIZE
+        self._cache = OrderedDict()
+
+    def cache_key(self, row):
+        shared = {k: v for k, v in row.context.items() if k not in self.PER_RECIPIENT_FIELDS}
+        return (
+            row.invitation.company_id,
+            row.invitation.inviter_id,
+            row.language,
+            json.dumps(shared, sort_keys=True, default=str),
+        )
+
+    @staticmethod
+    def placeholder(field):
+        return f"__rokkad_{field}__"
+
+    @staticmethod
+    def parts(message):
+        return [message.subject, message.body] + [content for content, _ in getattr(message, "alternatives", [])]
+
+    def values(self, row):
+        # what render_message() puts in the context
+        return {field: str(row.context.get(field, "")) for field in self.PER_RECIPIENT_FIELDS}
+
+    def fill(self, text, values, autoescape):
+        for field, value in values.items():
+            text = text.replace(self.placeholder(field), escape(value) if autoescape[field] else value)
+        return text
+
+    def autoescaping(self, template, samples):
+        """
+        Per part of `template`, which fields must be escaped to reproduce
+        every ``(values, full render)`` in `samples`; None if no choice does.
+        """
+        choices = [
+            dict(zip(self.PER_RECIPIENT_FIELDS, flags))
+            for flags in itertools.product((False, True), repeat=len(self.PER_RECIPIENT_FIELDS))
+        ]
+        modes = []
+        for i, text in enumerate(self.parts(template)):
+            for autoescape in choices:
+                if all(self.fill(text, values, autoescape) == self.parts(full)[i] for values, full in samples):
+                    modes.append(autoescape)
+                    break
+            else:
+                return None
+        return modes
+
+    def interpolate(self, template, modes, row):
+        values = self.values(row)
+        # deep, so cc, headers and attachments aren't shared between messages
+        message = copy.deepcopy(template)
+        message.to = [row.invitation.email]
+        parts = [self.fill(text, values, autoescape) for text, autoescape in zip(self.parts(template), modes)]
+        message.subject, message.body = parts[:2]
+        if hasattr(template, "alternatives"):
+            message.alternatives = [
+                (content, mimetype) for content, (_, mimetype) in zip(parts[2:], template.alternatives)
+            ]
+        return message
+
+    def render(self, row):
+        key = self.cache_key(row)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            if cached is self.UNCACHEABLE:
+                return render_message(row)
+            return self.interpolate(*cached, row)
+
+        placeholders = {field: self.placeholder(field) for field in self.PER_RECIPIENT_FIELDS}
+        template = render_message(row, dict(row.context, **placeholders))
+        message = render_message(row)
+        probe = {field: f"{field}-{self.PROBE}" for field in self.PER_RECIPIENT_FIELDS}
+        modes = self.autoescaping(template, [
+            (self.values(row), message),
+            (probe, render_message(row, dict(row.context, **probe))),
+        ])
+        self._cache[key] = self.UNCACHEABLE if modes is None else (template, modes)
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return message
+
+
+# lives as long as the worker process; rendered fragments don't go stale
+# unless the templates change, which needs a restart anyway
+renderer = InvitationRenderer()
+
+
+def deliver(row, mailer):
+    mailer.send(renderer.render(row))
+
+
+def mark_sent(row, now=None):
+    row.status = InvitationOutbox.Status.SENT
+    row.sent_at = now or timezone.now()
+    row.last_error = ""
+    row.save(update_fields=["status", "sent_at", "last_error"])
+    signals.invite_url_sent.send(
+        sender=row.invitation.__class__,
+        instance=row.invitation,
+        invite_url_sent=row.context.get("invite_url"),
+        inviter=row.invitation.inviter,
+    )
+
+
+def mark_failed(row, error, now=None):
+    now = now or timezone.now()
+    row.last_error = f"{error.__class__.__name__}: {error}"
+    if row.attempts >= OUTBOX_MAX_ATTEMPTS:
+        row.status = InvitationOutbox.Status.FAILED
+    else:
+        row.next_attempt_at = now + datetime.timedelta(seconds=backoff_delay(row.attempts))
+    row.save(update_fields=["status", "next_attempt_at", "last_error"])
+
+
+def process_outbox(batch_size=100, now=None):
+    """Send one batch of due invitation e-mails; returns (sent, failed)."""
+    now = now or timezone.now()
+    sent = failed = 0
+    rows = claim_due(batch_size, now=now)
+    if not rows:
+        return sent, failed
+    # one connection (one TLS handshake) for many messages
+    with InvitationMailer() as mailer:
+        for row in rows:
+            try:
+                deliver(row, mailer)
+            except Exception as exc:
+                failed += 1
+                logger.warning(
+                    "invitations.outbox.failed id=%s attempt=%s error=%r", row.pk, row.attempts, str(exc),
+                    extra={'outbox_id': row.pk, 'attempt': row.attempts},
+                )
+                mark_failed(row, exc, now=now)
+            else:
+                sent += 1
+                mark_sent(row)
+    return sent, failed
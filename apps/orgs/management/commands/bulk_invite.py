@@ -0,0 +1,63 @@
+import csv
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.sites.models import Site
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.orgs.bulk import BULK_CHUNK_SIZE, bulk_invite, emails_from_csv
+from apps.orgs.models import Company
+
+
+class Command(BaseCommand):
+    help = (
+        "Invite every address in a CSV file (or '-' for stdin) to a company. "
+        "Writes one 'email,status' line per input row."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("company_id", type=int)
+        parser.add_argument("path", help="CSV file with an 'email' column or one address per row, '-' for stdin.")
+        parser.add_argument("--inviter", help="E-mail of the inviting user, defaults to the company owner.")
+        parser.add_argument(
+            "--base-url",
+            help="Scheme and host for invite links, defaults to https://<current site domain>.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=BULK_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            company = Company.objects.select_related("owner").get(pk=options["company_id"])
+        except Company.DoesNotExist:
+            raise CommandError(f"Company {options['company_id']} does not exist.")
+        inviter = company.owner
+        if options["inviter"]:
+            try:
+                inviter = get_user_model().objects.get(email__iexact=options["inviter"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No user with e-mail {options['inviter']}.")
+
+        site = Site.objects.get_current()
+        base_url = (options["base_url"] or f"https://{site.domain}").rstrip("/")
+
+        started = time.monotonic()
+        if options["path"] == "-":
+            emails = list(emails_from_csv(sys.stdin))
+        else:
+            with open(options["path"], newline="", encoding="utf-8-sig") as stream:
+                emails = list(emails_from_csv(stream))
+        result = bulk_invite(
+            company,
+            inviter,
+            emails,
+            absolute_url=lambda path: base_url + path,
+            site_name=site.name,
+            chunk_size=options["chunk_size"],
+        )
+
+        writer = csv.writer(self.stdout)
+        writer.writerow(["email", "status"])
+        writer.writerows(result.rows)
+        summary = ", ".join(f"{status}: {count}" for status, count in result.summary().items())
+        self.stderr.write(f"{len(result.rows)} rows in {time.monotonic() - started:.2f}s ({summary})")
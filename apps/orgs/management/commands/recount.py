@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from apps.orgs import counters
+from apps.orgs.models import Company
+
+
+class Command(BaseCommand):
+    help = "Recompute Company.member_count and unaccepted_invitation_count and fix any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("company_ids", nargs="*", type=int, help="Only these companies (default: all).")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Companies recounted per UPDATE.")
+
+    def handle(self, *args, company_ids, batch_size, **options):
+        companies = Company.objects.order_by("pk")
+        if company_ids:
+            companies = companies.filter(pk__in=company_ids)
+        ids = list(companies.values_list("pk", flat=True))
+        fixed = 0
+        for start in range(0, len(ids), batch_size):
+            fixed += counters.recount(Company.objects.filter(pk__in=ids[start:start + batch_size]))
+        self.stdout.write(f"Recounted {len(ids)} companies, fixed {fixed}.")
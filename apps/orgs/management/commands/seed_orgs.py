@@ -0,0 +1,256 @@
+import datetime
+import itertools
+import random
+import re
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import NOT_PROVIDED
+from django.utils import timezone
+from invitations.app_settings import app_settings
+
+from apps.orgs import counters
+from apps.orgs.models import Company, CompanyInvitation, Membership
+from apps.orgs.roles import ADMIN, MEMBER, OWNER, registry
+
+User = get_user_model()
+
+# share of invitations in each state
+INVITATION_STATES = (
+    ("pending", 0.5),
+    ("accepted", 0.3),
+    ("expired", 0.15),
+    ("unsent", 0.05),
+)
+# share of non-owner memberships with the admin role
+ADMIN_SHARE = 0.05
+# how far back memberships' date_joined go: owners joined their company at
+# some point in it, members at some point after the owner
+MEMBERSHIP_SPAN = datetime.timedelta(days=730)
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while chunk := list(itertools.islice(rows, size)):
+        yield chunk
+
+
+def power_law(total, count, alpha, cap):
+    """
+    Split `total` into `count` sizes proportional to rank ** -alpha, each at
+    least 1 and at most `cap`: a few huge tenants and a long tail of small
+    ones.
+    """
+    weights = [rank ** -alpha for rank in range(1, count + 1)]
+    scale = total / sum(weights)
+    return [max(1, min(cap, round(weight * scale))) for weight in weights]
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with synthetic users, companies, memberships and "
+        "invitations for benchmarks and scaling tests. Company sizes follow a "
+        "power law; rows are inserted in chunks with the secondary indexes "
+        "dropped and rebuilt at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10_000)
+        parser.add_argument("--companies", type=int, default=1_000)
+        parser.add_argument("--memberships", type=int, default=100_000, help="Approximate total, owners included.")
+        parser.add_argument("--invitations", type=int, default=100_000)
+        parser.add_argument(
+            "--invitees",
+            type=int,
+            default=0,
+            help="Extra users, each with one pending invitation to accept.",
+        )
+        parser.add_argument("--alpha", type=float, default=1.1, help="Power-law exponent of company sizes.")
+        parser.add_argument("--chunk-size", type=int, default=10_000, help="Rows per INSERT transaction.")
+        parser.add_argument("--prefix", default="seed", help="Prefix of generated usernames, names and keys.")
+        parser.add_argument("--password", help="Password for every user (default: unusable).")
+        parser.add_argument("--seed", type=int, help="Random seed, for a reproducible data set.")
+        parser.add_argument(
+            "--keep-indexes",
+            action="store_true",
+            help="Don't drop the secondary indexes during the load.",
+        )
+
+    def handle(self, *args, **options):
+        if options["users"] < 1 or options["companies"] < 1:
+            raise CommandError("--users and --companies must be at least 1.")
+        if User.objects.filter(username__startswith=f"{options['prefix']}-user-").exists():
+            raise CommandError(f"Data with prefix {options['prefix']!r} exists already, pick another --prefix.")
+        if not options["keep_indexes"] and connection.in_atomic_block:
+            raise CommandError("Indexes can't be dropped inside a transaction, use --keep-indexes.")
+        self.random = random.Random(options["seed"])
+        self.chunk_size = options["chunk_size"]
+        self.prefix = options["prefix"]
+        # invitation keys end up in URLs matching \w+
+        self.key_prefix = re.sub(r"\W", "_", self.prefix)
+
+        started = time.monotonic()
+        with self.deferred_indexes(Membership, CompanyInvitation, enabled=not options["keep_indexes"]):
+            user_ids = self.create_users(options["users"], options["password"])
+            companies = self.create_companies(options["companies"], user_ids)
+            sizes = power_law(options["memberships"], len(companies), options["alpha"], len(user_ids))
+            self.create_memberships(companies, sizes, user_ids)
+            sizes = power_law(options["invitations"], len(companies), options["alpha"], options["invitations"])
+            self.create_invitations(companies, sizes)
+            self.create_invitees(options["invitees"], options["password"], companies)
+        self.step("counters", lambda: counters.recount(Company.objects.filter(pk__in=[pk for pk, _ in companies])))
+        self.stdout.write(f"Done in {time.monotonic() - started:.1f}s.")
+
+    def step(self, name, func):
+        started = time.monotonic()
+        result = func()
+        self.stdout.write(f"{name}: {time.monotonic() - started:.1f}s")
+        return result
+
+    def report(self, model, count, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"{model._meta.model_name}: {count} rows in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f}/s)")
+
+    def bulk_create(self, model, objs):
+        started = time.monotonic()
+        count = 0
+        for chunk in chunked(objs, self.chunk_size):
+            with transaction.atomic():
+                model.objects.bulk_create(chunk, batch_size=self.chunk_size)
+            count += len(chunk)
+        self.report(model, count, started)
+
+    def insert(self, model, fields, rows):
+        """
+        INSERT `rows`, tuples of database values for `fields`, with
+        executemany(). Skips the per-object work of bulk_create, which is
+        most of its cost at millions of rows; the caller provides every
+        value, defaults included.
+        """
+        opts, quote = model._meta, connection.ops.quote_name
+        missing = [
+            field.name for field in opts.local_concrete_fields
+            if field is not opts.auto_field and not field.null and field.db_default is NOT_PROVIDED
+            and field.name not in fields
+        ]
+        if missing:
+            # Django fills these in, the database won't
+            raise CommandError(f"{opts.label} rows need a value for {', '.join(missing)}.")
+        columns = ", ".join(quote(opts.get_field(name).column) for name in fields)
+        placeholders = ", ".join(["%s"] * len(fields))
+        sql = f"INSERT INTO {quote(opts.db_table)} ({columns}) VALUES ({placeholders})"
+        started = time.monotonic()
+        count = 0
+        for chunk in chunked(rows, self.chunk_size):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, chunk)
+            count += len(chunk)
+        self.report(model, count, started)
+
+    @contextmanager
+    def deferred_indexes(self, *models, enabled=True):
+        """
+        Drop the models' Meta.indexes for the block and rebuild them after,
+        which is much faster than updating them row by row. Unique
+        constraints stay, they keep the generated data valid.
+        """
+        indexes = [(model, index) for model in models for index in model._meta.indexes] if enabled else []
+        if indexes:
+            with connection.schema_editor() as editor:
+                for model, index in indexes:
+                    editor.remove_index(model, index)
+        try:
+            yield
+        finally:
+            if indexes:
+                def rebuild():
+                    with connection.schema_editor() as editor:
+                        for model, index in indexes:
+                            editor.add_index(model, index)
+                self.step(f"rebuilt {len(indexes)} indexes", rebuild)
+
+    def create_users(self, count, password):
+        # hashing is deliberately slow, so hash once and share it
+        password = make_password(password)
+        prefix = f"{self.prefix}-user-"
+        self.bulk_create(User, (
+            User(username=f"{prefix}{i}", email=f"{prefix}{i}@example.com", password=password)
+            for i in range(count)
+        ))
+        return list(User.objects.filter(username__startswith=prefix).order_by("pk").values_list("pk", flat=True))
+
+    def create_companies(self, count, user_ids):
+        prefix = f"{self.prefix}-company-"
+        owners = [self.random.choice(user_ids) for _ in range(count)]
+        self.bulk_create(Company, (
+            Company(name=f"{prefix}{i}", owner_id=owner, creator_id=owner)
+            for i, owner in enumerate(owners)
+        ))
+        # (pk, owner_id), biggest company first
+        return list(Company.objects.filter(name__startswith=prefix).order_by("pk").values_list("pk", "owner_id"))
+
+    def create_memberships(self, companies, sizes, user_ids):
+        owner_role, admin_role, member_role = registry.get_id(OWNER), registry.get_id(ADMIN), registry.get_id(MEMBER)
+        now = timezone.now()
+        adapt = connection.ops.adapt_datetimefield_value
+
+        def rows():
+            for (company_id, owner_id), size in zip(companies, sizes):
+                founded = now - self.random.random() * MEMBERSHIP_SPAN
+                yield owner_id, company_id, owner_role, adapt(founded), ""
+                for user_id in self.random.sample(user_ids, min(size, len(user_ids))):
+                    if user_id != owner_id:
+                        role = admin_role if self.random.random() < ADMIN_SHARE else member_role
+                        joined = founded + self.random.random() * (now - founded)
+                        yield user_id, company_id, role, adapt(joined), ""
+
+        self.insert(Membership, ("user", "company", "role", "date_joined", "invite_reason"), rows())
+
+    def create_invitations(self, companies, sizes):
+        now = timezone.now()
+        expired = datetime.timedelta(days=app_settings.INVITATION_EXPIRY + 1)
+        valid = datetime.timedelta(days=app_settings.INVITATION_EXPIRY)
+        states = [state for state, _ in INVITATION_STATES]
+        weights = [weight for _, weight in INVITATION_STATES]
+        number = itertools.count()
+        adapt = connection.ops.adapt_datetimefield_value
+
+        def rows():
+            for (company_id, owner_id), size in zip(companies, sizes):
+                for state in self.random.choices(states, weights, k=size):
+                    n = next(number)
+                    sent = None
+                    if state == "expired":
+                        sent = now - expired - self.random.random() * expired
+                    elif state != "unsent":
+                        sent = now - self.random.random() * valid
+                    yield (
+                        company_id, owner_id, f"{self.prefix}-invite-{n}@example.com", f"{self.key_prefix}_{n}",
+                        state == "accepted", adapt(sent), adapt(sent or now),
+                    )
+
+        fields = ("company", "inviter", "email", "key", "accepted", "sent", "created")
+        self.insert(CompanyInvitation, fields, rows())
+
+    def create_invitees(self, count, password, companies):
+        """Users invited to the companies in turn, with a pending invitation each."""
+        if not count:
+            return
+        password = make_password(password)
+        prefix = f"{self.prefix}-invitee-"
+        self.bulk_create(User, (
+            User(username=f"{prefix}{i}", email=f"{prefix}{i}@example.com", password=password)
+            for i in range(count)
+        ))
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+        def rows():
+            for i, (company_id, owner_id) in zip(range(count), itertools.cycle(companies)):
+                yield company_id, owner_id, f"{prefix}{i}@example.com", f"{self.key_prefix}_accept_{i}", False, now, now
+
+        fields = ("company", "inviter", "email", "key", "accepted", "sent", "created")
+        self.insert(CompanyInvitation, fields, rows())
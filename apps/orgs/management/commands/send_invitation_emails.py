@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.orgs.mail import process_outbox
+
+
+class Command(BaseCommand):
+    help = "Deliver queued invitation e-mails from the outbox, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling the outbox instead of exiting once it is drained.",
+        )
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds to sleep when idle in --loop mode.")
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = process_outbox(batch_size=options["batch_size"])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+        self.stdout.write(f"Sent {total_sent} invitation e-mails, {total_failed} failed.")
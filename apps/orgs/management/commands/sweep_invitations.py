@@ -0,0 +1,88 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q
+from django.utils import timezone
+from invitations.app_settings import app_settings
+
+from apps.orgs import counters
+from apps.orgs.models import ArchivedInvitation, CompanyInvitation
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete (or archive) expired and long-accepted invitations in small "
+        "primary-key ranges, one short transaction per range."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Primary-key range handled per transaction.")
+        parser.add_argument(
+            "--accepted-days",
+            type=int,
+            default=30,
+            help="Remove accepted invitations sent more than this many days ago.",
+        )
+        parser.add_argument(
+            "--grace-days",
+            type=int,
+            default=0,
+            help="Keep unaccepted invitations this many days past their expiry.",
+        )
+        parser.add_argument("--archive", action="store_true", help="Copy rows to ArchivedInvitation before deleting.")
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches.")
+        parser.add_argument("--dry-run", action="store_true", help="Only count what would be removed.")
+        parser.add_argument("--loop", action="store_true", help="Run forever, sweeping every --interval seconds.")
+        parser.add_argument("--interval", type=float, default=3600.0)
+
+    def sweep_q(self, options, now):
+        expired_before = now - datetime.timedelta(days=app_settings.INVITATION_EXPIRY + options["grace_days"])
+        accepted_before = now - datetime.timedelta(days=options["accepted_days"])
+        return Q(accepted=False, sent__lt=expired_before) | Q(accepted=True, sent__lt=accepted_before)
+
+    def sweep(self, options):
+        condition = self.sweep_q(options, timezone.now())
+        bounds = CompanyInvitation.objects.filter(condition).aggregate(lo=Min("pk"), hi=Max("pk"))
+        if bounds["lo"] is None:
+            return 0
+        removed = 0
+        batch_size = options["batch_size"]
+        for start in range(bounds["lo"], bounds["hi"] + 1, batch_size):
+            batch = CompanyInvitation.objects.filter(condition, pk__gte=start, pk__lt=start + batch_size)
+            if options["dry_run"]:
+                removed += batch.count()
+                continue
+            with transaction.atomic():
+                if options["archive"]:
+                    ArchivedInvitation.objects.bulk_create(
+                        ArchivedInvitation(
+                            invitation_id=row["id"],
+                            company_id=row["company_id"],
+                            inviter_id=row["inviter_id"],
+                            email=row["email"],
+                            accepted=row["accepted"],
+                            created=row["created"],
+                            sent=row["sent"],
+                        )
+                        for row in batch.values("id", "company_id", "inviter_id", "email", "accepted", "created", "sent")
+                    )
+                pending = batch.filter(accepted=False).values_list("company_id").annotate(n=Count("pk")).order_by()
+                pending = {company_id: (0, -n) for company_id, n in pending}
+                with counters.suspended():
+                    removed += batch.delete()[1].get(CompanyInvitation._meta.label, 0)
+                counters.adjust(pending)
+            if options["pause"]:
+                time.sleep(options["pause"])
+        return removed
+
+    def handle(self, *args, **options):
+        verb = "Would remove" if options["dry_run"] else "Removed"
+        while True:
+            started = time.monotonic()
+            removed = self.sweep(options)
+            self.stdout.write(f"{verb} {removed} invitations in {time.monotonic() - started:.2f}s.")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
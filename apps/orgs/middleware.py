@@ -0,0 +1,81 @@
+from functools import cached_property
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from .models import Membership, Role
+
+WORKSPACE_SESSION_KEY = "orgs_workspace"
+
+
+class TenantContext:
+    """
+    The active workspace of the current request.
+
+    Built from the session and the cached membership role, so resolving it
+    doesn't hit the database once the caches are warm.
+    """
+
+    def __init__(self, company_id, company_name, role_id):
+        self.company_id = company_id
+        self.company_name = company_name
+        self.role_id = role_id
+
+    def __repr__(self):
+        return f"<TenantContext company={self.company_id} role={self.role_id}>"
+
+    @cached_property
+    def permissions(self):
+        if self.role_id is None:
+            return frozenset()
+        return Role.get_permission_set_for(self.role_id)
+
+    def has_perm(self, perm):
+        return perm in self.permissions
+
+
+def get_tenant(request):
+    workspace = request.session.get(WORKSPACE_SESSION_KEY)
+    if not workspace or not request.user.is_authenticated:
+        return None
+    is_member, role_id = Membership.get_cached_role(request.user.pk, workspace["id"])
+    if not is_member:
+        # membership was revoked since the workspace was chosen
+        del request.session[WORKSPACE_SESSION_KEY]
+        return None
+    return TenantContext(workspace["id"], workspace["name"], role_id)
+
+
+def set_workspace(request, company):
+    """Make `company` the active workspace, revalidating the membership."""
+    Membership.invalidate_role_cache_for(request.user.pk, company.pk)
+    request.session[WORKSPACE_SESSION_KEY] = {"id": company.pk, "name": company.name}
+    request.tenant = get_tenant(request)
+    return request.tenant
+
+
+def clear_workspace(request):
+    request.session.pop(WORKSPACE_SESSION_KEY, None)
+    request.tenant = None
+
+
+class TenantMiddleware:
+    """Expose the active workspace as ``request.tenant`` (None when public)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.tenant = get_tenant(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        # the session and request.user load lazily from the database
+        request.tenant = await sync_to_async(get_tenant)(request)
+        return await self.get_response(request)
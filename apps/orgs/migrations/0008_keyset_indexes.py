@@ -0,0 +1,31 @@
+# Generated by Django 5.0.1 on 2026-10-17 18:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgs', '0007_role_permissions_alter_companyinvitation_company_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='companyinvitation',
+            index=models.Index(fields=['company', 'created', 'id'], name='orgs_invite_company_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='companyinvitation',
+            index=models.Index(fields=['inviter', 'created', 'id'], name='orgs_invite_inviter_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='membership',
+            index=models.Index(fields=['company', 'date_joined', 'id'], name='orgs_member_company_keyset'),
+        ),
+        migrations.AddIndex(
+            model_name='membership',
+            index=models.Index(fields=['user', 'date_joined', 'id'], name='orgs_member_user_keyset'),
+        ),
+    ]
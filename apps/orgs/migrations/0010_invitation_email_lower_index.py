@@ -0,0 +1,20 @@
+# Generated by Django 5.0.1 on 2026-10-17 18:32
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgs', '0009_invitation_outbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='companyinvitation',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='orgs_invite_email_lower'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.1 on 2026-10-17 18:34
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgs', '0010_invitation_email_lower_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='companyinvitation',
+            name='email',
+            field=models.EmailField(max_length=254, verbose_name='e-mail address'),
+        ),
+        migrations.AddConstraint(
+            model_name='companyinvitation',
+            constraint=models.UniqueConstraint(models.F('company'), django.db.models.functions.text.Lower('email'), name='orgs_invite_company_email_unique', violation_error_message='This e-mail address has already been invited to this company.'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-17 18:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgs', '0011_invitation_unique_per_company'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedInvitation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('invitation_id', models.BigIntegerField()),
+                ('company_id', models.BigIntegerField()),
+                ('inviter_id', models.BigIntegerField(null=True)),
+                ('email', models.EmailField(max_length=254)),
+                ('accepted', models.BooleanField()),
+                ('created', models.DateTimeField()),
+                ('sent', models.DateTimeField(null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='companyinvitation',
+            index=models.Index(fields=['sent'], name='orgs_invite_sent'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+from django.db import migrations, models
+from django.utils.text import slugify
+
+SYSTEM_ROLES = {
+    "owner": "Owner",
+    "admin": "Admin",
+    "member": "Member",
+}
+
+
+def seed_system_roles(apps, schema_editor):
+    Role = apps.get_model("orgs", "Role")
+    taken = set()
+    # existing roles keep their name; duplicates get the pk appended
+    for role in Role.objects.order_by("pk"):
+        slug = slugify(role.name) or "role"
+        if slug in taken:
+            slug = f"{slug}-{role.pk}"
+        taken.add(slug)
+        role.slug = slug
+        role.is_system = slug in SYSTEM_ROLES
+        role.save(update_fields=["slug", "is_system"])
+    for slug, name in SYSTEM_ROLES.items():
+        if slug not in taken:
+            Role.objects.create(name=name, slug=slug, is_system=True)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("orgs", "0012_invitation_sweeper"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="role",
+            name="slug",
+            field=models.SlugField(max_length=100, null=True, db_index=False),
+        ),
+        migrations.AddField(
+            model_name="role",
+            name="is_system",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(seed_system_roles, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="role",
+            name="slug",
+            field=models.SlugField(max_length=100, unique=True),
+        ),
+    ]
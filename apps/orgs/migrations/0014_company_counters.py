@@ -0,0 +1,41 @@
+# Generated by Django 5.0.1 on 2026-10-17 18:41
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Company = apps.get_model("orgs", "Company")
+    Membership = apps.get_model("orgs", "Membership")
+    CompanyInvitation = apps.get_model("orgs", "CompanyInvitation")
+
+    def count(queryset):
+        counted = queryset.filter(company=OuterRef("pk")).order_by().values("company").annotate(n=Count("pk")).values("n")
+        return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+    Company.objects.update(
+        member_count=count(Membership.objects.all()),
+        pending_invitation_count=count(CompanyInvitation.objects.filter(accepted=False)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgs', '0013_system_roles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='pending_invitation_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
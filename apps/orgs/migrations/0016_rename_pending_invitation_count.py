@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orgs', '0015_companyownership'),
+    ]
+
+    operations = [
+        # the counter never excluded expired invitations, so say what it counts
+        migrations.RenameField(
+            model_name='company',
+            old_name='pending_invitation_count',
+            new_name='unaccepted_invitation_count',
+        ),
+    ]
@@ -1,21 +1,28 @@
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, models
 from django.conf import settings
 # Create your models here.
 import datetime
 from invitations.base_invitation import AbstractBaseInvitation
+from invitations.managers import BaseInvitationManager
 from invitations.app_settings import app_settings
-from django.utils import timezone
+from django.utils import timezone, translation
 from django.utils.crypto import get_random_string
+from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 from django.contrib.sites.shortcuts import get_current_site
 from django.urls import reverse
-from invitations import signals
-from invitations.adapters import get_invitations_adapter
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.db.models import DEFERRED, Q
+from django.db.models.functions import Lower
 
 User = get_user_model()
 
+# Bump when the shape of cached permission data changes.
+PERMISSIONS_CACHE_VERSION = 1
+PERMISSIONS_CACHE_TIMEOUT = 60 * 15
+
 
 class Company(models.Model):
     name = models.CharField(max_length=200,unique=True)
@@ -25,6 +32,11 @@ class Company(models.Model):
     creator = models.ForeignKey(User, related_name='created_companies', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # denormalised for the company list, kept up to date by apps/orgs/counters.py
+    # (run `manage.py recount` to repair drift)
+    member_count = models.PositiveIntegerField(default=0, editable=False)
+    # includes expired invitations until sweep_invitations removes them
+    unaccepted_invitation_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         unique_together = ('name', 'owner')
@@ -78,6 +90,11 @@ class Membership(models.Model):
 
     class Meta:
         unique_together = ('user', 'company')
+        indexes = [
+            # keyset pagination of member lists, see pagination.py
+            models.Index(fields=['company', 'date_joined', 'id'], name='orgs_member_company_keyset'),
+            models.Index(fields=['user', 'date_joined', 'id'], name='orgs_member_user_keyset'),
+        ]
         # permissions = [
         #     ("invite_to_company", "Can invite to company"),
         #     ("remove_from_company", "Can remove from company"),
@@ -88,25 +105,177 @@ class Membership(models.Model):
     def __str__(self):
         return f"{self.user} as {self.role} in {self.company} since {self.date_joined}"
 
+    @staticmethod
+    def role_cache_key(user_id, company_id):
+        return f"orgs:membership:{user_id}:{company_id}:role"
+
+    @classmethod
+    def get_cached_role(cls, user_id, company_id):
+        """
+        Cached ``(is_member, role_id)`` for the user in the company.
+
+        Misses are cached too, so repeated checks for non-members are free.
+        """
+        key = cls.role_cache_key(user_id, company_id)
+        cached = cache.get(key, version=PERMISSIONS_CACHE_VERSION)
+        if cached is None:
+            # read the primary: a lagging replica's answer would stay cached
+            role_ids = list(
+                cls.objects.using(DEFAULT_DB_ALIAS)
+                .filter(user_id=user_id, company_id=company_id)
+                .values_list('role_id', flat=True)[:1]
+            )
+            cached = (True, role_ids[0]) if role_ids else (False, None)
+            cache.set(key, cached, PERMISSIONS_CACHE_TIMEOUT, version=PERMISSIONS_CACHE_VERSION)
+        return cached
+
+    @classmethod
+    def get_role_id(cls, user_id, company_id):
+        """Cached id of the user's role in the company, or None."""
+        return cls.get_cached_role(user_id, company_id)[1]
+
+    @classmethod
+    def invalidate_role_cache_for(cls, user_id, company_id):
+        cache.delete(cls.role_cache_key(user_id, company_id), version=PERMISSIONS_CACHE_VERSION)
+
+    @classmethod
+    def invalidate_role_caches(cls, pairs):
+        """Invalidate many (user_id, company_id) entries, e.g. after bulk_create."""
+        cache.delete_many([cls.role_cache_key(*pair) for pair in pairs], version=PERMISSIONS_CACHE_VERSION)
+
+    def invalidate_role_cache(self):
+        self.invalidate_role_cache_for(self.user_id, self.company_id)
+
 
 class Role(models.Model):
     name = models.CharField(max_length=100)
+    # stable identifier used in code, see roles.py for the system roles
+    slug = models.SlugField(max_length=100, unique=True)
+    is_system = models.BooleanField(default=False)
     permissions = models.ManyToManyField(Permission)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = self.unique_slug(self.name)
+        super().save(*args, **kwargs)
+
+    def unique_slug(self, name):
+        """slugify(name), suffixed with -2, -3... if another role has it."""
+        # room for the suffix within max_length
+        base = slugify(name)[:90] or 'role'
+        # the primary: a lagging replica could miss a slug just taken
+        taken = set(
+            Role.objects.using(DEFAULT_DB_ALIAS)
+            .filter(slug__startswith=base)
+            .exclude(pk=self.pk)
+            .values_list('slug', flat=True)
+        )
+        slug, n = base, 1
+        while slug in taken:
+            n += 1
+            slug = f"{base}-{n}"
+        return slug
+
+    @staticmethod
+    def permissions_cache_key(role_id):
+        return f"orgs:role:{role_id}:permissions"
+
+    @classmethod
+    def get_permission_set_for(cls, role_id):
+        """
+        Frozenset of "app_label.codename" strings granted to the role.
+
+        Built once and kept in the cache until the role or its permissions
+        change (see signals.py).
+        """
+        key = cls.permissions_cache_key(role_id)
+        permissions = cache.get(key, version=PERMISSIONS_CACHE_VERSION)
+        if permissions is None:
+            permissions = frozenset(
+                f"{app_label}.{codename}"
+                for app_label, codename in Permission.objects.filter(role__id=role_id).values_list(
+                    'content_type__app_label', 'codename'
+                )
+            )
+            cache.set(key, permissions, PERMISSIONS_CACHE_TIMEOUT, version=PERMISSIONS_CACHE_VERSION)
+        return permissions
+
+    def get_permission_set(self):
+        return self.get_permission_set_for(self.pk)
+
+    @classmethod
+    def invalidate_permission_cache(cls, *role_ids):
+        cache.delete_many(
+            [cls.permissions_cache_key(role_id) for role_id in role_ids],
+            version=PERMISSIONS_CACHE_VERSION,
+        )
+
+
+
+class CompanyInvitationQuerySet(models.QuerySet):
+    """
+    Case-insensitive address lookups.
+
+    They compare ``LOWER(email)`` so the functional index on it is used;
+    ``email__iexact`` compiles to ``UPPER()``/``LIKE`` and can't use it.
+    """
+
+    def for_email(self, email):
+        return self.alias(email_lower=Lower('email')).filter(email_lower=email.lower())
+
+    def for_emails(self, emails):
+        return self.alias(email_lower=Lower('email')).filter(email_lower__in=[e.lower() for e in emails])
+
+    def pending_for(self, email, include=None, include_accepted=False):
+        """
+        Unaccepted, unexpired invitations for the address across all
+        companies, plus the invitation `include` (usually the one just
+        accepted) if given, and every accepted one with `include_accepted`.
+        """
+        sent_threshold = timezone.now() - datetime.timedelta(days=app_settings.INVITATION_EXPIRY)
+        pending = Q(accepted=False) & (Q(sent__isnull=True) | Q(sent__gte=sent_threshold))
+        if include is not None:
+            pending |= Q(pk=include.pk)
+        if include_accepted:
+            pending |= Q(accepted=True)
+        return self.for_email(email).filter(pending)
+
+
+class CompanyInvitationManager(BaseInvitationManager.from_queryset(CompanyInvitationQuerySet)):
+    pass
 
 
 class CompanyInvitation(AbstractBaseInvitation):
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="invitations")
     email = models.EmailField(
-        unique=True,
         verbose_name=_("e-mail address"),
         max_length=app_settings.EMAIL_MAX_LENGTH,
     )
     created = models.DateTimeField(verbose_name=_("created"), default=timezone.now)
 
+    objects = CompanyInvitationManager()
+
+    class Meta:
+        constraints = [
+            # an address can be invited to many companies, once per company
+            models.UniqueConstraint(
+                'company', Lower('email'),
+                name='orgs_invite_company_email_unique',
+                violation_error_message=_("This e-mail address has already been invited to this company."),
+            ),
+        ]
+        indexes = [
+            models.Index(Lower('email'), name='orgs_invite_email_lower'),
+            # all_valid()/all_expired() and the sweeper range-scan on sent
+            models.Index(fields=['sent'], name='orgs_invite_sent'),
+            # keyset pagination of invitation lists, see pagination.py
+            models.Index(fields=['company', 'created', 'id'], name='orgs_invite_company_keyset'),
+            models.Index(fields=['inviter', 'created', 'id'], name='orgs_invite_inviter_keyset'),
+        ]
+
     @classmethod
     def create(cls, email, company,inviter=None, **kwargs):
         key = get_random_string(64).lower()
@@ -116,13 +285,25 @@ class CompanyInvitation(AbstractBaseInvitation):
         )
         return instance
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # lets the pending-count signal tell when `accepted` flips; DEFERRED
+        # when it wasn't loaded
+        instance._loaded_accepted = instance.__dict__.get('accepted', DEFERRED)
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_accepted = self.__dict__.get('accepted', DEFERRED)
+
     def key_expired(self):
         expiration_date = self.sent + datetime.timedelta(
             days=app_settings.INVITATION_EXPIRY,
         )
         return expiration_date <= timezone.now()
 
-    def send_invitation(self, request, **kwargs):
+    def get_email_context(self, request, **kwargs):
         current_site = get_current_site(request)
         invite_url = reverse(app_settings.CONFIRMATION_URL_NAME, args=[self.key])
         invite_url = request.build_absolute_uri(invite_url)
@@ -133,22 +314,77 @@ class CompanyInvitation(AbstractBaseInvitation):
                 "site_name": current_site.name,
                 "email": self.email,
                 "key": self.key,
-                "inviter": self.inviter,
             },
         )
+        return ctx
 
-        email_template = "invitations/email/email_invite"
-
-        get_invitations_adapter().send_mail(email_template, self.email, ctx)
-        self.sent = timezone.now()
-        self.save()
+    def send_invitation(self, request, **kwargs):
+        """
+        Queue the invitation e-mail; `send_invitation_emails` delivers it.
 
-        signals.invite_url_sent.send(
-            sender=self.__class__,
-            instance=self,
-            invite_url_sent=invite_url,
-            inviter=self.inviter,
+        Only JSON-serialisable context is stored, the inviter is reattached
+        from the invitation at delivery time.
+        """
+        ctx = self.get_email_context(request, **kwargs)
+        InvitationOutbox.objects.create(
+            invitation=self,
+            context=ctx,
+            language=translation.get_language() or settings.LANGUAGE_CODE,
         )
+        self.sent = timezone.now()
+        self.save(update_fields=['sent'])
 
     def __str__(self):
         return f"Invited: {self.email} Accepted: {self.accepted} "
+
+
+class ArchivedInvitation(models.Model):
+    """
+    Expired or accepted invitations moved out of CompanyInvitation by
+    `sweep_invitations --archive`. Plain ids rather than foreign keys, so
+    the archive never blocks or cascades deletes of users and companies.
+    """
+
+    invitation_id = models.BigIntegerField()
+    company_id = models.BigIntegerField()
+    inviter_id = models.BigIntegerField(null=True)
+    email = models.EmailField(max_length=app_settings.EMAIL_MAX_LENGTH)
+    accepted = models.BooleanField()
+    created = models.DateTimeField()
+    sent = models.DateTimeField(null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived: {self.email} Accepted: {self.accepted}"
+
+
+class InvitationOutbox(models.Model):
+    """
+    Invitation e-mails waiting to be delivered.
+
+    Requests only insert a row here; the `send_invitation_emails` management
+    command sends them with retries and exponential backoff.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('Pending')
+        SENT = 'sent', _('Sent')
+        FAILED = 'failed', _('Failed')
+
+    invitation = models.ForeignKey(CompanyInvitation, on_delete=models.CASCADE, related_name='outbox')
+    context = models.JSONField(default=dict)
+    language = models.CharField(max_length=16)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='orgs_outbox_due'),
+        ]
+
+    def __str__(self):
+        return f"{self.invitation_id} {self.status} ({self.attempts} attempts)"
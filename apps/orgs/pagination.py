@@ -0,0 +1,158 @@
+import base64
+import datetime
+import json
+
+from django.core.exceptions import BadRequest, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Field, Func, Q, Value
+from django.db.models.lookups import GreaterThan, LessThan
+from django.http import JsonResponse
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder rounds datetimes to milliseconds, which would make the
+    # cursor miss the row it was taken from.
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class Row(Func):
+    """A row value, ``(a, b, ...)``, for comparing several columns at once."""
+
+    template = '(%(expressions)s)'
+
+    def __init__(self, *expressions):
+        super().__init__(*expressions, output_field=Field())
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+        # query string of the next page's URL, set by paginate_keyset()
+        self.next_query = None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Cursor pagination over a unique ordering such as ``('date_joined', 'id')``.
+
+    Each page is fetched with a ``WHERE (a, b) > (x, y)`` row comparison
+    on the ordering columns instead of an OFFSET, plus a redundant
+    ``a >= x``, so a matching composite index is scanned from the cursor
+    on and every page costs the same as the first one. Orderings that mix
+    directions can't be a row comparison and use the equivalent ``OR``
+    terms instead. Only forward ("next") navigation is supported.
+    """
+
+    def __init__(self, queryset, ordering, per_page=PAGE_SIZE):
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = per_page
+        self.fields = [name.lstrip('-') for name in ordering]
+
+    def encode_cursor(self, obj):
+        values = [getattr(obj, name) for name in self.fields]
+        data = json.dumps(values, cls=CursorEncoder).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            values = json.loads(data)
+            if len(values) != len(self.fields):
+                raise ValueError
+            opts = self.queryset.model._meta
+            return [opts.get_field(name).to_python(value) for name, value in zip(self.fields, values)]
+        except (ValueError, TypeError, ValidationError):
+            raise BadRequest('Invalid cursor')
+
+    def after(self, values):
+        opts = self.queryset.model._meta
+        descending = [name.startswith('-') for name in self.ordering]
+        # bounds the leading index column, which the OR form alone doesn't
+        condition = Q(**{f'{self.fields[0]}__{"lte" if descending[0] else "gte"}': values[0]})
+        if len(set(descending)) == 1:
+            columns = Row(*self.fields)
+            cursor = Row(*(Value(value, output_field=opts.get_field(name)) for name, value in zip(self.fields, values)))
+            return condition & Q((LessThan if descending[0] else GreaterThan)(columns, cursor))
+        # (a > x) OR (a = x AND b > y) ..., honouring each field's direction
+        terms = Q()
+        for i, field in enumerate(self.fields):
+            term = Q(**{f'{field}__{"lt" if descending[i] else "gt"}': values[i]})
+            for prev_field, prev_value in zip(self.fields[:i], values[:i]):
+                term &= Q(**{prev_field: prev_value})
+            terms |= term
+        return condition & terms
+
+    def page_queryset(self, cursor=None):
+        queryset = self.queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode_cursor(cursor)))
+        return queryset[:self.per_page + 1]
+
+    def get_page(self, cursor=None):
+        return self.make_page(list(self.page_queryset(cursor)))
+
+    async def aget_page(self, cursor=None):
+        return self.make_page([obj async for obj in self.page_queryset(cursor)])
+
+    def make_page(self, items):
+        next_cursor = None
+        if len(items) > self.per_page:
+            items = items[:self.per_page]
+            next_cursor = self.encode_cursor(items[-1])
+        return KeysetPage(items, next_cursor)
+
+
+def _paginator(request, queryset, ordering):
+    try:
+        per_page = min(int(request.GET.get('per_page', PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        per_page = PAGE_SIZE
+    return KeysetPaginator(queryset, ordering, per_page=max(per_page, 1))
+
+
+def _with_next_query(request, page, cursor_param):
+    # keep the other parameters (per_page, another list's cursor) in the link
+    if page.has_next:
+        query = request.GET.copy()
+        query[cursor_param] = page.next_cursor
+        page.next_query = query.urlencode()
+    return page
+
+
+def paginate_keyset(request, queryset, ordering, cursor_param='after'):
+    page = _paginator(request, queryset, ordering).get_page(request.GET.get(cursor_param))
+    return _with_next_query(request, page, cursor_param)
+
+
+async def apaginate_keyset(request, queryset, ordering, cursor_param='after'):
+    page = await _paginator(request, queryset, ordering).aget_page(request.GET.get(cursor_param))
+    return _with_next_query(request, page, cursor_param)
+
+
+def wants_json(request):
+    return request.GET.get('format') == 'json'
+
+
+def keyset_json_response(page, serialize):
+    return JsonResponse({
+        'results': [serialize(obj) for obj in page],
+        'next': page.next_cursor,
+    })
@@ -0,0 +1,73 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Role
+
+OWNER = "owner"
+ADMIN = "admin"
+MEMBER = "member"
+
+# slug -> display name, seeded by migration 0013_system_roles
+SYSTEM_ROLES = {
+    OWNER: "Owner",
+    ADMIN: "Admin",
+    MEMBER: "Member",
+}
+
+VERSION_KEY = "orgs:roles:version"
+# how often a process checks whether another process changed the roles
+CHECK_INTERVAL = 30
+
+
+class RoleRegistry:
+    """
+    Process-wide ``slug -> Role`` map.
+
+    Loaded with one query on first use and kept for the life of the process,
+    so code paths like company creation resolve roles without touching the
+    database. Role changes clear it locally (see signals.py) and bump a
+    version in the shared cache, which other processes notice within
+    CHECK_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self._roles = None
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            self._version = cache.get(VERSION_KEY)
+            # from the primary, the result is kept for the life of the process
+            self._roles = {role.slug: role for role in Role.objects.using(DEFAULT_DB_ALIAS)}
+            self._checked_at = time.monotonic()
+        return self._roles
+
+    def clear(self, broadcast=True):
+        self._roles = None
+        if broadcast:
+            cache.set(VERSION_KEY, time.time_ns(), None)
+
+    def roles(self):
+        roles = self._roles
+        if roles is not None and time.monotonic() - self._checked_at > CHECK_INTERVAL:
+            self._checked_at = time.monotonic()
+            if cache.get(VERSION_KEY) != self._version:
+                roles = None
+        if roles is None:
+            roles = self.load()
+        return roles
+
+    def get(self, slug):
+        return self.roles().get(slug)
+
+    def get_id(self, slug):
+        role = self.get(slug)
+        return role.pk if role else None
+
+
+registry = RoleRegistry()
@@ -0,0 +1,105 @@
+import logging
+
+from allauth.account.models import EmailAddress
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from invitations.utils import get_invitation_model
+
+from . import counters, viewcache
+from .models import Membership
+from .roles import MEMBER, registry as role_registry
+
+logger = logging.getLogger(__name__)
+
+Invitation = get_invitation_model()
+
+# slug of the role given to members who join through an invitation
+DEFAULT_ROLE = getattr(settings, 'ORGS_DEFAULT_ROLE', MEMBER)
+# session key for the invitation key followed before signing up
+SESSION_KEY = 'orgs_invitation_key'
+
+
+def stash_invitation(request, invitation):
+    request.session[SESSION_KEY] = invitation.key
+
+
+def unstash_invitation(request, email):
+    """
+    The invitation for `email` whose key was followed in this session, or
+    None. The key is removed from the session either way.
+    """
+    key = request.session.pop(SESSION_KEY, None) if hasattr(request, 'session') else None
+    if key is None:
+        return None
+    return Invitation.objects.for_email(email).filter(key=key).first()
+
+
+def address_verified(user, email):
+    return EmailAddress.objects.filter(user=user, email__iexact=email, verified=True).exists()
+
+
+def accept_invitations(user, email, accepted=None, include_accepted=False, only=False):
+    """
+    Join `user` to every company with a pending invitation for `email`.
+
+    Only call this once the user is known to control the address: it is
+    verified, or they followed the key mailed to it. In the latter case pass
+    that invitation as `accepted` with `only`, which joins just its company.
+
+    Runs in one transaction of three queries: find and lock the invitations
+    (pending ones plus `accepted`, the one being accepted) on the
+    LOWER(email) index, with their companies' owners and whether the user is
+    already a member; insert the new memberships with the default role (from
+    the in-process role registry) using ON CONFLICT DO NOTHING; and adjust
+    the company counters. Invitations still pending take one more UPDATE to
+    mark them accepted; the accept view's has already been marked by the
+    invitations app.
+    Calling it again for the same address is a no-op, so the accept view and
+    signal receivers can't create duplicates. `include_accepted` also picks
+    up invitations accepted before the user had an account.
+
+    Returns the ids of the companies joined.
+    """
+    role_id = role_registry.get_id(DEFAULT_ROLE)
+    with transaction.atomic():
+        if only:
+            invitations = Invitation.objects.for_email(email).filter(pk=accepted.pk)
+        else:
+            invitations = Invitation.objects.pending_for(email, include=accepted, include_accepted=include_accepted)
+        # Concurrent acceptances of the same invitations queue on the row
+        # locks instead of both counting the same new memberships. SQLite
+        # ignores FOR UPDATE; there the transaction took the write lock when
+        # it began (django_project/sqlite3).
+        is_member = Exists(Membership.objects.filter(user=user, company=OuterRef('company_id')))
+        invitations = list(
+            invitations.select_for_update(of=('self',))
+            .annotate(is_member=is_member)
+            .values_list('pk', 'company_id', 'accepted', 'company__owner_id', 'is_member')
+        )
+        if not invitations:
+            logger.info("invitations.accept email=%s user=%s companies=[]", email, user.pk)
+            return []
+        company_ids = sorted({row[1] for row in invitations})
+        joined = {company_id for _, company_id, _, _, member in invitations if not member}
+        Membership.objects.bulk_create(
+            [Membership(user=user, company_id=company_id, role_id=role_id) for company_id in sorted(joined)],
+            ignore_conflicts=True,
+        )
+        pending = [(pk, company_id) for pk, company_id, is_accepted, _, _ in invitations if not is_accepted]
+        if pending:
+            Invitation.objects.filter(pk__in=[pk for pk, _ in pending]).update(accepted=True)
+        # neither bulk_create nor update() send signals, so count here
+        deltas = {company_id: (int(company_id in joined), 0) for company_id in company_ids}
+        for _, company_id in pending:
+            deltas[company_id] = (deltas[company_id][0], -1)
+        counters.adjust(deltas, owner_ids={owner_id for _, _, _, owner_id, _ in invitations})
+    # bulk_create sends no post_save, so drop cached "not a member" entries
+    Membership.invalidate_role_caches((user.pk, company_id) for company_id in company_ids)
+    viewcache.invalidate_users(user.pk)
+    logger.info(
+        "invitations.accept email=%s user=%s companies=%s",
+        email, user.pk, company_ids,
+        extra={'email': email, 'user_id': user.pk, 'company_ids': company_ids},
+    )
+    return company_ids
@@ -1,24 +1,150 @@
+import logging
+
 from django.dispatch import receiver
-from django.contrib.auth.models import User
+from django.db.models import DEFERRED
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from allauth.account.signals import email_confirmed, user_signed_up
 from invitations.signals import invite_accepted
 from invitations.utils import get_invitation_model
 from django.contrib.auth import get_user_model
-from .models import Membership
+from . import counters, viewcache
+from .models import Company, CompanyInvitation, Membership, Role
+from .roles import registry as role_registry
+from .services import accept_invitations, address_verified, stash_invitation, unstash_invitation
+
+logger = logging.getLogger(__name__)
 User = get_user_model()
 Invitation = get_invitation_model()
 
 @receiver(invite_accepted)
-def create_membership(sender, **kwargs):
-    email = kwargs.get('email')
-    print(f"Signal received for email: {email}")
+def create_membership(sender, email, request=None, invitation=None, **kwargs):
+    user = getattr(request, 'user', None)
+    if user and user.is_authenticated and user.email.lower() == email.lower():
+        # following the key proves the mailbox for this invitation; the
+        # address's other invitations wait until it is verified
+        accept_invitations(user, email, accepted=invitation, only=not address_verified(user, email))
+        return
+    user = User.objects.filter(email__iexact=email).first()
+    if user is not None and address_verified(user, email):
+        accept_invitations(user, email, accepted=invitation)
+        return
+    # an account that hasn't verified the address may not be its owner's;
+    # signing up in this session or confirming the address completes it
+    if request is not None and hasattr(request, 'session'):
+        stash_invitation(request, invitation)
+    logger.info("invitations.accept.deferred email=%s", email, extra={'email': email})
+
+
+@receiver(user_signed_up)
+def join_invited_companies(sender, request, user, **kwargs):
+    invitation = unstash_invitation(request, user.email)
+    if address_verified(user, user.email):
+        # invitations are accepted before signup, so include accepted ones
+        accept_invitations(user, user.email, accepted=invitation, include_accepted=True)
+    elif invitation is not None:
+        accept_invitations(user, user.email, accepted=invitation, only=True)
+    # otherwise nothing until the address is confirmed, see below
+
+
+@receiver(email_confirmed)
+def join_companies_on_confirmation(sender, request, email_address, **kwargs):
+    accept_invitations(email_address.user, email_address.email, include_accepted=True)
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def invalidate_role_permissions(sender, instance, **kwargs):
+    Role.invalidate_permission_cache(instance.pk)
+    role_registry.clear()
+    viewcache.invalidate_all()
+
+
+@receiver(m2m_changed, sender=Role.permissions.through)
+def invalidate_role_permissions_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    if not reverse:
+        Role.invalidate_permission_cache(instance.pk)
+    elif pk_set:
+        Role.invalidate_permission_cache(*pk_set)
+    else:
+        # clearing from the permission side: pk_set is None, so look the roles up
+        Role.invalidate_permission_cache(*instance.role_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Membership)
+@receiver(post_delete, sender=Membership)
+def invalidate_membership_role(sender, instance, **kwargs):
+    instance.invalidate_role_cache()
+    viewcache.invalidate_users(instance.user_id)
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+def invalidate_company_pages(sender, instance, created=False, **kwargs):
+    user_ids = [instance.owner_id]
+    if not created and kwargs['signal'] is post_save:
+        # the name shows on every member's membership list
+        user_ids += instance.membership_set.values_list('user_id', flat=True)
+    viewcache.invalidate_users(*user_ids)
+
+
+@receiver(post_save, sender=Membership)
+def count_membership_created(sender, instance, created, **kwargs):
+    if created:
+        counters.adjust_one(instance.company_id, members=1)
+
+
+@receiver(post_delete, sender=Membership)
+def count_membership_deleted(sender, instance, **kwargs):
+    counters.adjust_one(instance.company_id, members=-1)
+
+
+@receiver(pre_save, sender=CompanyInvitation)
+def load_invitation_accepted(sender, instance, update_fields=None, **kwargs):
+    # an instance loaded without `accepted` doesn't know what it was before
+    # it was set, so read that from the row it is about to overwrite
+    if getattr(instance, '_loaded_accepted', None) is DEFERRED and 'accepted' in instance.__dict__:
+        instance._loaded_accepted = sender.objects.filter(pk=instance.pk).values_list('accepted', flat=True).first()
+
+
+@receiver(post_save, sender=CompanyInvitation)
+def count_invitation_saved(sender, instance, created, update_fields=None, **kwargs):
+    accepted = instance.__dict__.get('accepted', DEFERRED)
+    if accepted is DEFERRED or (update_fields is not None and 'accepted' not in update_fields):
+        # `accepted` wasn't saved
+        return
+    if created:
+        pending = 0 if accepted else 1
+    else:
+        was_accepted = getattr(instance, '_loaded_accepted', accepted)
+        pending = int(bool(was_accepted)) - int(accepted)
+    instance._loaded_accepted = accepted
+    if pending:
+        counters.adjust_one(instance.company_id, pending=pending)
+
+
+@receiver(post_delete, sender=CompanyInvitation)
+def count_invitation_deleted(sender, instance, **kwargs):
+    if not instance.accepted:
+        counters.adjust_one(instance.company_id, pending=-1)
+
 
-    invitation = Invitation.objects.filter(email=email).first()
-    print(f"Invitation found: {invitation}")
+# Connected after the counting receivers above: a row's post_delete has to
+# count it into the batch before end_cascade() may apply the batch.
+@receiver(pre_delete, sender=User)
+@receiver(pre_delete, sender=Company)
+@receiver(pre_delete, sender=Membership)
+@receiver(pre_delete, sender=CompanyInvitation)
+def batch_cascaded_counts(sender, instance, **kwargs):
+    # a user's memberships span many companies, and a queryset delete sends
+    # one post_delete per row; count them in one go
+    counters.begin_cascade(instance, company_id=instance.pk if sender is Company else None)
 
-    if invitation:
-        user = User.objects.get(email=email)
-        print(f"User found: {user}")
 
-        if user:
-            membership = Membership.objects.create(user=user, company=invitation.company)
-            print(f"Membership created: {membership}")
\ No newline at end of file
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Company)
+@receiver(post_delete, sender=Membership)
+@receiver(post_delete, sender=CompanyInvitation)
+def apply_cascaded_counts(sender, instance, **kwargs):
+    counters.end_cascade(instance)
@@ -0,0 +1,32 @@
+from django import template
+
+from apps.orgs import viewcache
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def company_perms(context, company):
+    """
+    Usage::
+
+        {% company_perms company as cperms %}
+        {% if "orgs.change_company" in cperms %}...{% endif %}
+    """
+    user = context.get("user")
+    if user is None:
+        return set()
+    return user.get_all_permissions(company)
+
+
+@register.simple_tag(takes_context=True)
+def view_cache_generation(context):
+    """
+    The current user's view-cache generation, for ``{% cache %}`` fragments
+    that should be dropped along with the user's cached pages::
+
+        {% view_cache_generation as gen %}
+        {% cache 300 company_table user.pk gen LANGUAGE_CODE %}...{% endcache %}
+    """
+    user = context.get("user")
+    return "-".join(str(g) for g in viewcache.generations(user.pk if user else "anon"))
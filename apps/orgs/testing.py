@@ -0,0 +1,163 @@
+"""
+Query-budget harness for the test suite.
+
+:func:`seed_company` builds realistic fixtures with bulk inserts (a company
+with N members and N pending invitations, its owner a member of N other
+companies), and :class:`QueryBudgetMixin` checks that a view's query count
+stays within a declared budget and doesn't grow with N, which is what an
+N+1 (a lazy FK load per row) looks like::
+
+    BUDGETS = {'orgs_company_detail': Budget(6, kwargs=lambda f: {'company_id': f.company.pk})}
+
+    def test_budgets(self):
+        self.assertViewBudgets(BUDGETS, self.fixtures)
+"""
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+
+from . import counters
+from .models import Company, CompanyInvitation, Membership
+from .roles import MEMBER, OWNER, registry
+
+User = get_user_model()
+
+# members (and invitations, and memberships of the owner) per fixture
+FIXTURE_SIZES = (1, 100, 10_000)
+
+# The manifest storage needs collectstatic, which the test run doesn't do.
+TEST_STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+@dataclass
+class Fixture:
+    size: int
+    owner: User
+    company: Company
+    invitation: CompanyInvitation
+
+
+@dataclass
+class Budget:
+    """
+    At most `queries` queries for one request to a URL, whatever the
+    fixture size. `kwargs` and `data` take the :class:`Fixture` and return
+    the URL kwargs and POST data.
+
+    Cascading deletes can't be constant: Django's deletion collector removes
+    related rows in batches of 100. `per_100_rows` allows that many extra
+    queries per 100 rows of fixture instead of requiring a constant count.
+    """
+
+    queries: int
+    per_100_rows: int = 0
+    method: str = "get"
+    kwargs: Optional[Callable] = None
+    data: Optional[Callable] = None
+    anonymous: bool = False
+    setup: Optional[Callable] = field(default=None, repr=False)
+
+
+def seed_company(size, prefix=None):
+    """
+    A company with `size` members besides its owner and `size` pending
+    invitations; the owner is also a member of `size` other companies.
+    Everything is inserted with bulk_create, so counters are recounted at
+    the end.
+    """
+    prefix = prefix or f"seed{size}"
+    owner = User.objects.create_user(username=f"{prefix}-owner", email=f"{prefix}-owner@example.com", password="pass")
+    other = User.objects.create_user(username=f"{prefix}-other", email=f"{prefix}-other@example.com")
+    company = Company.objects.create(name=f"{prefix} company", owner=owner, creator=owner)
+    Membership.objects.create(user=owner, company=company, role=registry.get(OWNER))
+
+    member_role = registry.get(MEMBER)
+    users = User.objects.bulk_create(
+        User(username=f"{prefix}-m{i}", email=f"{prefix}-m{i}@example.com", password="!") for i in range(size)
+    )
+    Membership.objects.bulk_create(Membership(user=user, company=company, role=member_role) for user in users)
+    now = timezone.now()
+    CompanyInvitation.objects.bulk_create(
+        CompanyInvitation(company=company, inviter=owner, email=f"{prefix}-i{i}@example.com", key=f"{prefix}-i{i}", sent=now)
+        for i in range(size)
+    )
+    others = Company.objects.bulk_create(
+        Company(name=f"{prefix} other {i}", owner=other, creator=other) for i in range(size)
+    )
+    Membership.objects.bulk_create(Membership(user=owner, company=c, role=member_role) for c in others)
+    counters.recount(Company.objects.filter(pk__in=[company.pk] + [c.pk for c in others]))
+    company.refresh_from_db()
+    invitation = CompanyInvitation.objects.filter(company=company).first()
+    return Fixture(size, owner, company, invitation)
+
+
+def url_names(*urlconfs):
+    """Names of the URL patterns in the given urlconf modules."""
+    names = []
+    for urlconf in urlconfs:
+        for pattern in get_resolver(urlconf).url_patterns:
+            if not isinstance(pattern, URLResolver) and pattern.name:
+                names.append(pattern.name)
+    return names
+
+
+class QueryBudgetMixin:
+    """TestCase mixin; see the module docstring."""
+
+    def count_queries(self, func, using=DEFAULT_DB_ALIAS):
+        with CaptureQueriesContext(connections[using]) as context:
+            func()
+        return context
+
+    def assertQueryBudget(self, budget, func, msg=None):
+        context = self.count_queries(func)
+        if len(context) > budget:
+            queries = "\n".join(f"{i}. {q['sql']}" for i, q in enumerate(context.captured_queries, 1))
+            self.fail(msg or f"{len(context)} queries, budget is {budget}:\n{queries}")
+        return len(context)
+
+    def request_for(self, name, budget, fixture):
+        """Prepare the client for one request and return it, unsent."""
+        # measure the full view, not the view cache
+        cache.clear()
+        if budget.setup:
+            budget.setup(self, fixture)
+        if budget.anonymous:
+            self.client.logout()
+        else:
+            self.client.force_login(fixture.owner)
+        url = reverse(name, kwargs=budget.kwargs(fixture) if budget.kwargs else None)
+        data = budget.data(fixture) if budget.data else None
+
+        def request():
+            response = getattr(self.client, budget.method)(url, data)
+            self.assertLess(response.status_code, 400, f"{name}: {response.status_code}")
+
+        return request
+
+    def assertViewBudgets(self, budgets, fixtures, names=()):
+        """
+        Request every URL in `budgets` once per fixture. Fails if a URL in
+        `names` has no budget, goes over its budget, or needs more queries
+        for a bigger fixture.
+        """
+        missing = sorted(set(names) - set(budgets))
+        self.assertFalse(missing, f"no query budget declared for {missing}")
+        for name, budget in budgets.items():
+            counts = {}
+            for fixture in fixtures:
+                allowed = budget.queries + budget.per_100_rows * -(-fixture.size // 100)
+                with self.subTest(url=name, size=fixture.size):
+                    counts[fixture.size] = self.assertQueryBudget(allowed, self.request_for(name, budget, fixture))
+            if not budget.per_100_rows:
+                with self.subTest(url=name):
+                    self.assertEqual(len(set(counts.values())), 1, f"{name}: query count grows with rows, {counts}")
@@ -1,3 +1,1126 @@
-from django.test import TestCase
+import datetime
+import os
+import sqlite3
+import time
+import tempfile
+from io import StringIO
+from types import SimpleNamespace
+from smtplib import SMTPException
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from allauth.account.models import EmailAddress, EmailConfirmationHMAC
+from allauth.account.signals import email_confirmed
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.template import Context, Template, engines
+from django.template.response import TemplateResponse
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import OuterRef, Subquery
+from django.http import HttpResponse, QueryDict
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from invitations.exceptions import AlreadyAccepted, AlreadyInvited
+from django.utils import timezone
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django_project.db import configure_sqlite
+from django_project.sqlite3.base import DatabaseWrapper as SQLiteTunedWrapper
+from django_project.routers import PIN_COOKIE, PrimaryPinMiddleware, PrimaryReplicaRouter, pin_to_primary
+
+from . import counters
+from .bulk import bulk_invite
+from .mail import OUTBOX_MAX_ATTEMPTS, InvitationMailer, InvitationRenderer, backoff_delay, process_outbox, render_message
+from .models import ArchivedInvitation, Company, CompanyInvitation, InvitationOutbox, Membership, Role
+from .forms import CompanyInvitationForm
+from .pagination import KeysetPaginator
+from .roles import MEMBER, OWNER, registry as role_registry
+from .services import accept_invitations
+from .testing import FIXTURE_SIZES, TEST_STORAGES, Budget, QueryBudgetMixin, seed_company, url_names
+from .viewcache import cache_per_user
+from .views import has_permission
+
+User = get_user_model()
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class OrgsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # system roles are seeded by migration 0013_system_roles
+        cls.owner_role = Role.objects.get(slug=OWNER)
+        cls.member_role = Role.objects.get(slug=MEMBER)
+        cls.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pass')
+        cls.member = User.objects.create_user(username='member', email='member@example.com', password='pass')
+        cls.outsider = User.objects.create_user(username='outsider', email='outsider@example.com', password='pass')
+        cls.company = Company.objects.create(name='Acme', owner=cls.owner, creator=cls.owner)
+        Membership.objects.create(user=cls.owner, company=cls.company, role=cls.owner_role)
+        Membership.objects.create(user=cls.member, company=cls.company, role=cls.member_role)
+
+
+class GuardedViewQueryBudgetTests(OrgsTestCase):
+    # session + user lookups done by the auth middleware on every request
+    AUTH_QUERIES = 2
+
+    def test_company_detail_query_budget(self):
+        self.client.force_login(self.member)
+        url = reverse('orgs_company_detail', args=[self.company.id])
+        with self.assertNumQueries(self.AUTH_QUERIES + 4):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['membership'].role, self.member_role)
+
+    def test_company_update_query_budget(self):
+        self.client.force_login(self.owner)
+        url = reverse('orgs_company_update', args=[self.company.id])
+        with self.assertNumQueries(self.AUTH_QUERIES + 1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_company_update_requires_owner_role(self):
+        self.client.force_login(self.member)
+        url = reverse('orgs_company_update', args=[self.company.id])
+        with self.assertNumQueries(self.AUTH_QUERIES + 1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 403)
+
+    def test_company_detail_forbidden_for_outsider(self):
+        self.client.force_login(self.outsider)
+        url = reverse('orgs_company_detail', args=[self.company.id])
+        with self.assertNumQueries(self.AUTH_QUERIES + 1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 403)
+
+    def test_membership_resolved_once_per_request(self):
+        from .decorators import resolve_membership
+        from django.test import RequestFactory
+
+        request = RequestFactory().get('/')
+        request.user = self.owner
+        with self.assertNumQueries(1):
+            first = resolve_membership(request, self.company.id)
+            second = resolve_membership(request, str(self.company.id))
+        self.assertIs(first, second)
+        self.assertIs(request.membership, first)
+
+
+class CompanyDetailQueryCountTests(OrgsTestCase):
+    def get_detail_queries(self, company):
+        self.client.force_login(self.owner)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('orgs_company_detail', args=[company.id]))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def add_members(self, company, count):
+        users = User.objects.bulk_create(
+            User(username=f'{company.pk}-{i}', email=f'{company.pk}-{i}@example.com') for i in range(count)
+        )
+        Membership.objects.bulk_create(
+            Membership(user=user, company=company, role=self.member_role) for user in users
+        )
+        CompanyInvitation.objects.bulk_create(
+            CompanyInvitation(company=company, email=f'invite-{company.pk}-{i}@example.com', key=f'{company.pk}-{i}', inviter=self.owner)
+            for i in range(count)
+        )
+
+    def test_query_count_is_independent_of_member_count(self):
+        small = Company.objects.create(name='Small', owner=self.owner, creator=self.owner)
+        Membership.objects.create(user=self.owner, company=small, role=self.owner_role)
+        large = Company.objects.create(name='Large', owner=self.owner, creator=self.owner)
+        Membership.objects.create(user=self.owner, company=large, role=self.owner_role)
+        self.add_members(large, 999)
+
+        self.assertEqual(self.get_detail_queries(small), self.get_detail_queries(large))
+
+
+class PermissionCacheTests(OrgsTestCase):
+    def setUp(self):
+        cache.clear()
+        self.change_company = Permission.objects.get(codename='change_company')
+        self.owner_role.permissions.add(self.change_company)
+
+    def test_permission_checks_are_cached(self):
+        self.assertTrue(has_permission(self.owner, self.company, 'orgs.change_company'))
+        self.assertFalse(has_permission(self.outsider, self.company, 'orgs.change_company'))
+        with self.assertNumQueries(0):
+            for _ in range(10):
+                self.assertTrue(has_permission(self.owner, self.company, 'change_company'))
+                self.assertFalse(has_permission(self.owner, self.company, 'orgs.delete_company'))
+                self.assertFalse(has_permission(self.outsider, self.company, 'orgs.change_company'))
+        self.assertFalse(has_permission(self.member, self.company, 'orgs.change_company'))
+
+    def test_m2m_change_invalidates_permission_set(self):
+        self.assertTrue(has_permission(self.owner, self.company, 'orgs.change_company'))
+        self.owner_role.permissions.remove(self.change_company)
+        self.assertFalse(has_permission(self.owner, self.company, 'orgs.change_company'))
+        self.change_company.role_set.add(self.owner_role)
+        self.assertTrue(has_permission(self.owner, self.company, 'orgs.change_company'))
+
+    def test_membership_change_invalidates_role(self):
+        self.assertFalse(has_permission(self.member, self.company, 'orgs.change_company'))
+        membership = Membership.objects.get(user=self.member, company=self.company)
+        membership.role = self.owner_role
+        membership.save()
+        self.assertTrue(has_permission(self.member, self.company, 'orgs.change_company'))
+        membership.delete()
+        self.assertFalse(has_permission(self.member, self.company, 'orgs.change_company'))
+
+
+class RoleRegistryTests(OrgsTestCase):
+    def setUp(self):
+        role_registry.clear()
+        # the rollback after each test does not fire post_save
+        self.addCleanup(role_registry.clear)
+
+    def test_system_roles_are_seeded(self):
+        self.assertEqual(Role.objects.filter(slug__in=[OWNER, MEMBER, 'admin'], is_system=True).count(), 3)
+
+    def test_names_that_slugify_alike_get_unique_slugs(self):
+        # the system "Admin" role has the slug "admin" already
+        slugs = [Role.objects.create(name=name).slug for name in ('admin!', 'Admin', 'ADMIN ')]
+        self.assertEqual(slugs, ['admin-2', 'admin-3', 'admin-4'])
+        self.assertEqual(Role.objects.create(name='!!!').slug, 'role')
+
+    def test_company_create_does_not_query_roles(self):
+        role_registry.get(OWNER)
+        self.client.force_login(self.owner)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('orgs_company_create'), {'name': 'Initech'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse([q for q in ctx.captured_queries if 'FROM "orgs_role"' in q['sql']])
+        membership = Membership.objects.get(company__name='Initech')
+        self.assertEqual((membership.user, membership.role), (self.owner, self.owner_role))
+
+    def test_role_change_clears_registry(self):
+        self.assertEqual(role_registry.get(OWNER).name, 'Owner')
+        self.owner_role.name = 'Proprietor'
+        self.owner_role.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(role_registry.get(OWNER).name, 'Proprietor')
+        with self.assertNumQueries(0):
+            role_registry.get(MEMBER)
+
+
+class CompanyPermissionBackendTests(OrgsTestCase):
+    def setUp(self):
+        self.other = Company.objects.create(name='Globex', owner=self.member, creator=self.member)
+        Membership.objects.create(user=self.member, company=self.other, role=self.owner_role)
+        self.owner_role.permissions.add(
+            Permission.objects.get(codename='change_company'),
+            Permission.objects.get(codename='delete_company'),
+        )
+        self.member_role.permissions.add(Permission.objects.get(codename='view_company'))
+
+    def test_permissions_are_scoped_per_company(self):
+        user = User.objects.get(pk=self.member.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(user.has_perm('orgs.view_company', self.company))
+            self.assertFalse(user.has_perm('orgs.change_company', self.company))
+            self.assertTrue(user.has_perm('orgs.change_company', self.other))
+            self.assertTrue(user.has_perms(['orgs.change_company', 'orgs.delete_company'], self.other))
+            self.assertEqual(user.get_all_permissions(self.company), {'orgs.view_company'})
+
+    def test_non_members_have_no_company_permissions(self):
+        user = User.objects.get(pk=self.outsider.pk)
+        self.assertFalse(user.has_perm('orgs.view_company', self.company))
+        self.assertEqual(user.get_all_permissions(self.company), set())
+
+    def test_company_perms_template_tag(self):
+        template = Template(
+            '{% load orgs_tags %}{% company_perms company as cperms %}'
+            '{% if "orgs.change_company" in cperms %}edit{% else %}view{% endif %}'
+        )
+        owner = User.objects.get(pk=self.owner.pk)
+        member = User.objects.get(pk=self.member.pk)
+        self.assertEqual(template.render(Context({'user': owner, 'company': self.company})), 'edit')
+        self.assertEqual(template.render(Context({'user': member, 'company': self.company})), 'view')
+
+
+class TenantMiddlewareTests(OrgsTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_switch_and_clear_workspace(self):
+        self.client.force_login(self.member)
+        response = self.client.post(reverse('orgs_workspace_switch', args=[self.company.id]))
+        self.assertRedirects(response, reverse('orgs_company_detail', args=[self.company.id]))
+
+        # session + user; the tenant context comes from the session and cache
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('profile'))
+        tenant = response.wsgi_request.tenant
+        self.assertEqual(tenant.company_id, self.company.id)
+        self.assertEqual(tenant.role_id, self.member_role.id)
+        self.assertContains(response, 'Workspace:')
+
+        self.client.post(reverse('orgs_workspace_clear'))
+        response = self.client.get(reverse('profile'))
+        self.assertIsNone(response.wsgi_request.tenant)
+
+    def test_cannot_switch_to_foreign_workspace(self):
+        self.client.force_login(self.outsider)
+        response = self.client.post(reverse('orgs_workspace_switch', args=[self.company.id]))
+        self.assertEqual(response.status_code, 403)
+        self.assertIsNone(response.wsgi_request.tenant)
+
+    def test_revoked_membership_drops_workspace(self):
+        self.client.force_login(self.member)
+        self.client.post(reverse('orgs_workspace_switch', args=[self.company.id]))
+        Membership.objects.filter(user=self.member, company=self.company).get().delete()
+        response = self.client.get(reverse('profile'))
+        self.assertIsNone(response.wsgi_request.tenant)
+        self.assertNotIn('orgs_workspace', self.client.session)
+
+
+class KeysetPaginationTests(OrgsTestCase):
+    def setUp(self):
+        users = User.objects.bulk_create(
+            User(username=f'page-{i}', email=f'page-{i}@example.com') for i in range(25)
+        )
+        Membership.objects.bulk_create(Membership(user=user, company=self.company) for user in users)
+        # ties on the first ordering column must be broken by id
+        Membership.objects.filter(company=self.company).update(date_joined=timezone.now())
+
+    def walk(self, ordering):
+        queryset = Membership.objects.filter(company=self.company)
+        seen, cursor = [], None
+        while True:
+            page = KeysetPaginator(queryset, ordering, per_page=4).get_page(cursor)
+            seen.extend(m.pk for m in page)
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_walks_every_row_once_in_order(self):
+        expected = list(Membership.objects.filter(company=self.company).order_by('date_joined', 'id').values_list('pk', flat=True))
+        self.assertEqual(self.walk(('date_joined', 'id')), expected)
+        self.assertEqual(self.walk(('-date_joined', '-id')), expected[::-1])
+        # all date_joined are equal, so mixed directions order by -id alone
+        self.assertEqual(self.walk(('date_joined', '-id')), expected[::-1])
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite query plan')
+    def test_cursor_bounds_the_index_range(self):
+        first = Membership.objects.filter(company=self.company).order_by('date_joined', 'id').first()
+        for ordering, bound in ((('date_joined', 'id'), 'date_joined>?'), (('-date_joined', '-id'), 'date_joined<?')):
+            with self.subTest(ordering=ordering):
+                paginator = KeysetPaginator(Membership.objects.filter(company=self.company), ordering)
+                queryset = paginator.page_queryset(paginator.encode_cursor(first))
+                self.assertIn(f'orgs_member_company_keyset (company_id=? AND {bound})', queryset.explain())
+
+    def test_invalid_cursor_is_a_bad_request(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('orgs_company_detail', args=[self.company.id]), {'members_after': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_company_detail_pages_members(self):
+        self.client.force_login(self.owner)
+        url = reverse('orgs_company_detail', args=[self.company.id])
+        response = self.client.get(url, {'per_page': 10})
+        self.assertEqual(len(response.context['members']), 10)
+        cursor = response.context['members'].next_cursor
+        response = self.client.get(url, {'per_page': 10, 'members_after': cursor})
+        self.assertEqual(len(response.context['members']), 10)
+
+    def test_next_links_keep_other_parameters(self):
+        CompanyInvitation.objects.bulk_create(
+            CompanyInvitation(company=self.company, email=f'link-{i}@example.com', key=f'link-{i}', inviter=self.owner)
+            for i in range(3)
+        )
+        self.client.force_login(self.owner)
+        url = reverse('orgs_company_detail', args=[self.company.id])
+        invitations_after = self.client.get(url, {'per_page': 2}).context['invitations'].next_cursor
+        response = self.client.get(url, {'per_page': 2, 'invitations_after': invitations_after})
+        members = response.context['members']
+        self.assertEqual(QueryDict(members.next_query).dict(), {
+            'per_page': '2', 'invitations_after': invitations_after, 'members_after': members.next_cursor,
+        })
+        self.assertContains(response, f'href="?{escape(members.next_query)}"')
+
+    def test_invitations_list_json(self):
+        CompanyInvitation.objects.bulk_create(
+            CompanyInvitation(company=self.company, email=f'json-{i}@example.com', key=f'json-{i}', inviter=self.owner)
+            for i in range(3)
+        )
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('orgs_company_invitations_list'), {'format': 'json', 'per_page': 2})
+        data = response.json()
+        self.assertEqual(len(data['results']), 2)
+        response = self.client.get(reverse('orgs_company_invitations_list'), {'format': 'json', 'after': data['next']})
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertIsNone(response.json()['next'])
+
+
+class InvitationOutboxTests(OrgsTestCase):
+    def invite(self, email='new@example.com'):
+        self.client.force_login(self.owner)
+        return self.client.post(reverse('invite_to_company'), {
+            'email': email, 'company': self.company.id, 'inviter': self.owner.id,
+        })
+
+    def test_invite_request_only_enqueues(self):
+        response = self.invite()
+        self.assertRedirects(response, reverse('invite-success-url'))
+        self.assertEqual(len(mail.outbox), 0)
+        row = InvitationOutbox.objects.get()
+        self.assertEqual(row.status, InvitationOutbox.Status.PENDING)
+        self.assertTrue(row.context['invite_url'].startswith('http://testserver/'))
+        self.assertIsNotNone(row.invitation.sent)
+
+    def test_worker_sends_queued_mail(self):
+        self.invite()
+        call_command('send_invitation_emails', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['new@example.com'])
+        row = InvitationOutbox.objects.get()
+        self.assertEqual(row.status, InvitationOutbox.Status.SENT)
+        self.assertEqual(row.attempts, 1)
+
+    def test_failures_back_off_then_give_up(self):
+        self.invite()
+        now = timezone.now()
+        with mock.patch('apps.orgs.mail.deliver', side_effect=SMTPException('down')):
+            for attempt in range(1, OUTBOX_MAX_ATTEMPTS + 1):
+                process_outbox(now=now)
+                row = InvitationOutbox.objects.get()
+                self.assertEqual(row.attempts, attempt)
+                self.assertIn('down', row.last_error)
+                if attempt < OUTBOX_MAX_ATTEMPTS:
+                    self.assertEqual(row.next_attempt_at, now + datetime.timedelta(seconds=backoff_delay(attempt)))
+                    # not due again until the backoff has passed
+                    self.assertEqual(process_outbox(now=now), (0, 0))
+                    now = row.next_attempt_at
+        self.assertEqual(row.status, InvitationOutbox.Status.FAILED)
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class BulkInviteTests(OrgsTestCase):
+    def test_bulk_invite_view_reports_per_row_status(self):
+        CompanyInvitation.objects.create(company=self.company, email='pending@example.com', key='pending')
+        CompanyInvitation.objects.create(company=self.company, email='done@example.com', key='done', accepted=True)
+        self.client.force_login(self.owner)
+        upload = SimpleUploadedFile('emails.csv', b'name,email\nA,csv@example.com\nB,not-an-email\n')
+        response = self.client.post(reverse('invite_to_company_bulk'), {
+            'company': self.company.id,
+            'emails': 'One@Example.com, one@example.com;pending@example.com\ndone@example.com',
+            'csv_file': upload,
+        })
+        self.assertEqual(response.context['result'].rows, [
+            ('one@example.com', 'invited'),
+            ('one@example.com', 'duplicate'),
+            ('pending@example.com', 'already_invited'),
+            ('done@example.com', 'already_accepted'),
+            ('csv@example.com', 'invited'),
+            ('not-an-email', 'invalid'),
+        ])
+        self.assertEqual(InvitationOutbox.objects.count(), 2)
+        self.assertEqual(len(mail.outbox), 0)
+        # the page lists only the rows that weren't invited
+        self.assertContains(response, 'not-an-email')
+        self.assertContains(response, 'pending@example.com')
+        self.assertNotContains(response, 'csv@example.com')
+
+    @mock.patch('apps.orgs.forms.INLINE_MAX_ROWS', 3)
+    def test_bulk_invite_view_sends_big_lists_to_the_command(self):
+        self.client.force_login(self.owner)
+        response = self.client.post(reverse('invite_to_company_bulk'), {
+            'company': self.company.id,
+            'emails': 'a@example.com b@example.com c@example.com d@example.com',
+        })
+        self.assertIsNone(response.context['result'])
+        self.assertContains(response, '4 addresses is more than the 3 this page can invite at once')
+        self.assertContains(response, 'manage.py bulk_invite')
+        self.assertFalse(CompanyInvitation.objects.filter(email='a@example.com').exists())
+
+    def test_bulk_invite_query_count_is_per_chunk(self):
+        emails = [f'user{i}@example.com' for i in range(250)]
+        with self.assertNumQueries(3 * 7):
+            # per chunk: existing lookup, insert, key lookup, outbox insert,
+            # counter update, plus the savepoint pair around the inserts
+            result = bulk_invite(self.company, self.owner, emails, lambda path: 'http://testserver' + path, 'rokkad', chunk_size=100)
+        self.assertEqual(result.invited, 250)
+
+    def test_bulk_invite_command_and_single_connection_delivery(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            handle.write('email\n' + '\n'.join(f'cmd{i}@example.com' for i in range(5)))
+        self.addCleanup(os.remove, handle.name)
+        out = StringIO()
+        call_command('bulk_invite', self.company.id, handle.name, stdout=out, stderr=StringIO())
+        self.assertEqual(out.getvalue().splitlines()[1], 'cmd0@example.com,invited')
+
+        with mock.patch('apps.orgs.mail.get_connection', wraps=get_connection) as get_conn:
+            self.assertEqual(process_outbox(), (5, 0))
+        get_conn.assert_called_once()
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertTrue(mail.outbox[0].body.count('https://example.com/'))
+
+
+class InvitationMailerTests(TestCase):
+    def message(self, to='someone@example.com'):
+        return EmailMultiAlternatives('subject', 'body', 'from@example.com', [to])
+
+    def test_connection_is_recycled_after_max_messages(self):
+        with InvitationMailer(max_messages=2) as mailer:
+            for _ in range(5):
+                mailer.send(self.message())
+        self.assertEqual(mailer.connections_opened, 3)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertIsNone(mailer.connection)
+
+    def test_connection_is_dropped_after_an_error(self):
+        with InvitationMailer() as mailer:
+            mailer.send(self.message())
+            with mock.patch.object(mailer.connection, 'send_messages', side_effect=SMTPException('reset')):
+                with self.assertRaises(SMTPException):
+                    mailer.send(self.message())
+            self.assertIsNone(mailer.connection)
+            mailer.send(self.message())
+        self.assertEqual(mailer.connections_opened, 2)
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class InvitationRendererTests(OrgsTestCase):
+    def queue(self, count):
+        bulk_invite(self.company, self.owner, [f'r{i}@example.com' for i in range(count)], lambda path: 'http://testserver' + path, 'rokkad')
+        return list(InvitationOutbox.objects.select_related('invitation__inviter').order_by('id'))
+
+    def test_cached_render_matches_full_render(self):
+        rows = self.queue(3)
+        renderer = InvitationRenderer()
+        for row in rows:
+            cached, full = renderer.render(row), render_message(row)
+            self.assertEqual((cached.subject, cached.body, cached.to), (full.subject, full.body, full.to))
+            self.assertIn(row.context['invite_url'], cached.body)
+        self.assertEqual(len(renderer._cache), 1)
+
+    def test_cached_render_skips_template_rendering(self):
+        rows = self.queue(3)
+        renderer = InvitationRenderer()
+        renderer.render(rows[0])
+        with mock.patch('apps.orgs.mail.render_message') as render:
+            renderer.render(rows[1])
+            renderer.render(rows[2])
+        render.assert_not_called()
+
+    @override_settings(TEMPLATES=[{
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'OPTIONS': {'loaders': [('django.template.loaders.locmem.Loader', {
+            'invitations/email/email_invite_subject.txt': 'Join us',
+            'invitations/email/email_invite_message.txt': 'Hi {{ email|upper }} {{ invite_url }}',
+        })]},
+    }])
+    def test_templates_transforming_recipient_fields_are_rendered_in_full(self):
+        rows = self.queue(2)
+        renderer = InvitationRenderer()
+        for row in rows:
+            self.assertIn(row.invitation.email.upper(), renderer.render(row).body)
+        self.assertIs(next(iter(renderer._cache.values())), InvitationRenderer.UNCACHEABLE)
+
+    def queue_addresses(self, emails):
+        rows = []
+        for i, email in enumerate(emails):
+            invitation = CompanyInvitation.objects.create(company=self.company, inviter=self.owner, email=email, key=f'k{i}')
+            rows.append(InvitationOutbox.objects.create(invitation=invitation, language='en', context={
+                'invite_url': f'http://testserver/accept/k{i}/?a=1&b=2', 'site_name': 'rokkad', 'email': email, 'key': f'k{i}',
+            }))
+        return rows
+
+    def assertEveryRenderMatches(self, rows):
+        renderer = InvitationRenderer()
+        for row in rows:
+            cached, full = renderer.render(row), render_message(row)
+            self.assertEqual(
+                (cached.subject, cached.body, cached.alternatives, cached.to),
+                (full.subject, full.body, full.alternatives, full.to),
+            )
+        self.assertIsNot(next(iter(renderer._cache.values())), InvitationRenderer.UNCACHEABLE)
+
+    SPECIAL_ADDRESSES = ['plain@example.com', "o'brien@example.com", 'a&b@example.com', 'x<y>@example.com']
+
+    def test_special_characters_match_full_render(self):
+        # the bundled templates turn autoescape off
+        self.assertEveryRenderMatches(self.queue_addresses(self.SPECIAL_ADDRESSES))
+
+    @override_settings(TEMPLATES=[{
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'OPTIONS': {'loaders': [('django.template.loaders.locmem.Loader', {
+            'invitations/email/email_invite_subject.txt': 'Join us, {{ email }}',
+            'invitations/email/email_invite_message.txt': 'Hi {{ email }}, go to {{ invite_url }}',
+            'invitations/email/email_invite_message.html': '{% autoescape off %}<p>{{ email }}</p>{% endautoescape %}'
+                                                          '<a href="{{ invite_url }}">{{ key }}</a>',
+        })]},
+    }])
+    def test_special_characters_match_autoescaping_templates(self):
+        self.assertEveryRenderMatches(self.queue_addresses(self.SPECIAL_ADDRESSES))
+
+    def test_messages_do_not_share_containers(self):
+        first, second = self.queue_addresses(['one@example.com', 'two@example.com'])
+        renderer = InvitationRenderer()
+        renderer.render(first)
+        message = renderer.render(second)
+        message.cc.append('cc@example.com')
+        message.extra_headers['X-Test'] = '1'
+        message.attach('note.txt', 'hi')
+        again = renderer.render(second)
+        self.assertEqual((again.cc, again.extra_headers, again.attachments), ([], {}, []))
+
+
+class InvitationLookupTests(OrgsTestCase):
+    def test_validate_invitation_is_one_case_insensitive_query(self):
+        CompanyInvitation.objects.create(company=self.company, email='Pending@Example.com', key='p', sent=timezone.now())
+        CompanyInvitation.objects.create(company=self.company, email='accepted@example.com', key='a', accepted=True)
+        CompanyInvitation.objects.create(
+            company=self.company, email='expired@example.com', key='e',
+            sent=timezone.now() - datetime.timedelta(days=30),
+        )
+        form = CompanyInvitationForm(inviter=self.owner)
+        with self.assertNumQueries(1):
+            with self.assertRaises(AlreadyInvited):
+                form.validate_invitation('pending@EXAMPLE.com')
+        with self.assertRaises(AlreadyAccepted):
+            form.validate_invitation('Accepted@example.com')
+        self.assertTrue(form.validate_invitation('expired@example.com'))
+        self.assertTrue(form.validate_invitation('new@example.com'))
+
+    def test_lookup_uses_lower_email_index(self):
+        sql = str(CompanyInvitation.objects.for_email('A@B.com').query)
+        self.assertIn('LOWER("orgs_companyinvitation"."email")', sql)
+
+
+class MultiCompanyInvitationTests(OrgsTestCase):
+    def setUp(self):
+        self.globex = Company.objects.create(name='Globex', owner=self.member, creator=self.member)
+        Membership.objects.create(user=self.member, company=self.globex, role=self.owner_role)
+
+    def test_address_can_be_invited_to_several_companies_once_each(self):
+        CompanyInvitation.create('Guest@example.com', self.company, inviter=self.owner)
+        CompanyInvitation.create('guest@example.com', self.globex, inviter=self.member)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CompanyInvitation.create('GUEST@example.com', self.company)
+
+        form = CompanyInvitationForm(
+            {'email': 'guest@EXAMPLE.com', 'company': self.company.id, 'inviter': self.owner.id},
+            inviter=self.owner,
+        )
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['email'], ['This e-mail address has already been invited.'])
+
+    def test_accepting_joins_every_inviting_company(self):
+        invitation = CompanyInvitation.create('outsider@example.com', self.company, inviter=self.owner)
+        CompanyInvitation.create('Outsider@Example.com', self.globex, inviter=self.member)
+        for i in (invitation, CompanyInvitation.objects.get(company=self.globex)):
+            i.sent = timezone.now()
+            i.save()
+        EmailAddress.objects.create(user=self.outsider, email='outsider@example.com', verified=True, primary=True)
+        self.assertFalse(has_permission(self.outsider, self.company, 'orgs.view_company'))
+
+        response = self.client.get(reverse('accept-invite', args=[invitation.key]))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            set(self.outsider.memberships.values_list('company__name', flat=True)),
+            {'Acme', 'Globex'},
+        )
+        self.assertFalse(CompanyInvitation.objects.filter(accepted=False).exists())
+        self.assertEqual(Membership.get_cached_role(self.outsider.pk, self.company.pk), (True, self.member_role.pk))
+
+
+class AcceptInvitationTests(OrgsTestCase):
+    def setUp(self):
+        cache.clear()
+        self.invitation = CompanyInvitation.create('outsider@example.com', self.company, inviter=self.owner, sent=timezone.now())
+
+    def test_accept_is_bounded_and_idempotent(self):
+        role_registry.get(MEMBER)  # warm the registry
+        # as the accept view finds it: the invitations app marked it accepted
+        self.invitation.accepted = True
+        self.invitation.save()
+        # 3 statements plus the savepoint pair TestCase wraps atomic() in
+        with self.assertNumQueries(5) as ctx, self.assertLogs('apps.orgs.services', 'INFO') as logs:
+            self.assertEqual(
+                accept_invitations(self.outsider, 'Outsider@example.com', accepted=self.invitation, only=True),
+                [self.company.pk],
+            )
+        self.assertIn('invitations.accept email=Outsider@example.com', logs.output[0])
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', ctx.captured_queries[1]['sql'])
+        membership = Membership.objects.get(user=self.outsider, company=self.company)
+        self.assertEqual(membership.role, self.member_role)
+        self.company.refresh_from_db()
+        self.assertEqual(self.company.member_count, 3)
+
+        self.assertEqual(accept_invitations(self.outsider, 'outsider@example.com', accepted=self.invitation), [self.company.pk])
+        self.assertEqual(Membership.objects.filter(user=self.outsider).count(), 1)
+        self.company.refresh_from_db()
+        self.assertEqual(self.company.member_count, 3)
+
+    def test_accept_marks_pending_invitations_accepted(self):
+        role_registry.get(MEMBER)
+        # one more UPDATE marks the pending invitation accepted
+        with self.assertNumQueries(6):
+            self.assertEqual(accept_invitations(self.outsider, 'outsider@example.com'), [self.company.pk])
+        self.invitation.refresh_from_db()
+        self.assertTrue(self.invitation.accepted)
+        self.company.refresh_from_db()
+        self.assertEqual((self.company.member_count, self.company.unaccepted_invitation_count), (3, 0))
+
+    def test_accept_view_twice_creates_one_membership(self):
+        self.client.force_login(self.outsider)
+        url = reverse('accept-invite', args=[self.invitation.key])
+        self.client.get(url)
+        self.assertEqual(self.client.get(url).status_code, 410)
+        self.assertEqual(Membership.objects.filter(user=self.outsider).count(), 1)
+
+    def test_invitee_without_account_joins_after_signup(self):
+        self.invitation.email = 'newcomer@example.com'
+        self.invitation.save()
+        self.client.get(reverse('accept-invite', args=[self.invitation.key]))
+        self.client.post(reverse('account_signup'), {'email': 'newcomer@example.com', 'password1': 'a-Secret-123'})
+        user = User.objects.get(email='newcomer@example.com')
+        self.assertEqual(list(user.memberships.values_list('company', 'role')), [(self.company.pk, self.member_role.pk)])
+
+    def signup(self, email):
+        self.client.post(reverse('account_signup'), {'email': email, 'password1': 'a-Secret-123'})
+        return User.objects.get(email=email)
+
+    def test_signup_with_invited_address_does_not_join(self):
+        self.invitation.email = 'newcomer@example.com'
+        self.invitation.save()
+        # no key followed in this session, so nothing proves the address
+        stranger = self.signup('Newcomer@example.com')
+        self.assertFalse(stranger.memberships.exists())
+        self.invitation.refresh_from_db()
+        self.assertFalse(self.invitation.accepted)
+
+        address = EmailAddress.objects.get(user=stranger)
+        confirmation = EmailConfirmationHMAC(address)
+        self.client.post(reverse('account_confirm_email', args=[confirmation.key]))
+        self.assertEqual(list(stranger.memberships.values_list('company', flat=True)), [self.company.pk])
+
+    def test_followed_key_joins_only_its_company_until_verified(self):
+        globex = Company.objects.create(name='Globex', owner=self.member, creator=self.member)
+        CompanyInvitation.create('outsider@example.com', globex, inviter=self.member, sent=timezone.now())
+        self.client.force_login(self.outsider)
+        self.client.get(reverse('accept-invite', args=[self.invitation.key]))
+        self.assertEqual(list(self.outsider.memberships.values_list('company', flat=True)), [self.company.pk])
+
+        address = EmailAddress.objects.create(user=self.outsider, email='outsider@example.com')
+        address.set_verified()
+        email_confirmed.send(sender=EmailAddress, request=None, email_address=address)
+        self.assertEqual(
+            set(self.outsider.memberships.values_list('company', flat=True)), {self.company.pk, globex.pk},
+        )
+
+
+class SweepInvitationsTests(OrgsTestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.fresh = CompanyInvitation.create('fresh@example.com', self.company, sent=now)
+        self.unsent = CompanyInvitation.create('unsent@example.com', self.company)
+        self.recently_accepted = CompanyInvitation.create('recent@example.com', self.company, sent=now, accepted=True)
+        for i in range(5):
+            CompanyInvitation.create(f'old{i}@example.com', self.company, sent=now - datetime.timedelta(days=10))
+        CompanyInvitation.create('done@example.com', self.company, sent=now - datetime.timedelta(days=60), accepted=True)
+
+    def test_sweeps_in_batches_and_keeps_live_invitations(self):
+        out = StringIO()
+        call_command('sweep_invitations', '--batch-size', '2', '--dry-run', stdout=out)
+        self.assertIn('Would remove 6 invitations', out.getvalue())
+        self.assertEqual(CompanyInvitation.objects.count(), 9)
+
+        call_command('sweep_invitations', '--batch-size', '2', '--archive', stdout=out)
+        self.assertEqual(
+            set(CompanyInvitation.objects.values_list('pk', flat=True)),
+            {self.fresh.pk, self.unsent.pk, self.recently_accepted.pk},
+        )
+        self.assertEqual(ArchivedInvitation.objects.count(), 6)
+        self.assertTrue(ArchivedInvitation.objects.filter(email='done@example.com', accepted=True).exists())
+        self.company.refresh_from_db()
+        self.assertEqual(self.company.unaccepted_invitation_count, 2)
+
+
+class CompanyCounterTests(OrgsTestCase):
+    def assertCounts(self, members, pending):
+        self.company.refresh_from_db()
+        self.assertEqual((self.company.member_count, self.company.unaccepted_invitation_count), (members, pending))
+
+    def test_counters_follow_memberships_and_invitations(self):
+        self.assertCounts(2, 0)
+        invitation = CompanyInvitation.create('outsider@example.com', self.company, inviter=self.owner, sent=timezone.now())
+        bulk_invite(self.company, self.owner, ['a@example.com', 'b@example.com'], lambda path: path, 'rokkad')
+        self.assertCounts(2, 3)
+
+        accept_invitations(self.outsider, 'outsider@example.com')
+        self.assertCounts(3, 2)
+        invitation.refresh_from_db()
+        invitation.save()  # unchanged `accepted` leaves the counter alone
+        self.assertCounts(3, 2)
+
+        Membership.objects.get(user=self.outsider).delete()
+        CompanyInvitation.objects.get(email='a@example.com').delete()
+        self.assertCounts(2, 1)
+
+    def test_accept_view_counts_once(self):
+        invitation = CompanyInvitation.create('outsider@example.com', self.company, inviter=self.owner, sent=timezone.now())
+        self.client.force_login(self.outsider)
+        self.client.get(reverse('accept-invite', args=[invitation.key]))
+        self.assertCounts(3, 0)
+
+    def test_company_list_does_not_join_memberships(self):
+        self.client.force_login(self.owner)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('orgs_company_list'))
+        self.assertContains(response, 'Acme')
+        self.assertFalse([q for q in ctx.captured_queries if 'orgs_membership' in q['sql']])
+
+    def test_deleting_a_user_counts_their_memberships_in_one_update(self):
+        others = [Company.objects.create(name=f'Other {i}', owner=self.owner, creator=self.owner) for i in range(5)]
+        Membership.objects.bulk_create(Membership(user=self.member, company=c, role=self.member_role) for c in others)
+        counters.recount()
+        with CaptureQueriesContext(connection) as ctx:
+            self.member.delete()
+        counted = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "orgs_company"')]
+        self.assertEqual(len(counted), 1)
+        self.assertCounts(1, 0)
+        self.assertEqual({c.member_count for c in Company.objects.filter(pk__in=[c.pk for c in others])}, {0})
+
+    def test_deleting_a_company_skips_its_own_counters(self):
+        CompanyInvitation.create('outsider@example.com', self.company, inviter=self.owner, sent=timezone.now())
+        with CaptureQueriesContext(connection) as ctx:
+            self.company.delete()
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "orgs_company"')])
+
+    def test_queryset_deletes_count_in_one_update(self):
+        for i in range(3):
+            CompanyInvitation.create(f'queued{i}@example.com', self.company, inviter=self.owner, sent=timezone.now())
+        self.assertCounts(2, 3)
+        with CaptureQueriesContext(connection) as ctx:
+            CompanyInvitation.objects.filter(company=self.company).delete()
+            Membership.objects.filter(company=self.company).exclude(user=self.owner).delete()
+        counted = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "orgs_company"')]
+        self.assertEqual(len(counted), 2)
+        self.assertCounts(1, 0)
+
+    def test_saving_an_invitation_loaded_without_accepted(self):
+        invitation = CompanyInvitation.create('outsider@example.com', self.company, inviter=self.owner, sent=timezone.now())
+        deferred = CompanyInvitation.objects.only('email', 'company').get(pk=invitation.pk)
+        deferred.email = 'Outsider@example.com'
+        deferred.save()
+        self.assertCounts(2, 1)
+        deferred = CompanyInvitation.objects.only('email', 'company').get(pk=invitation.pk)
+        deferred.accepted = True
+        deferred.save()
+        self.assertCounts(2, 0)
+        deferred.save()
+        self.assertCounts(2, 0)
+
+    def test_failed_deletion_leaves_counting_on(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            with mock.patch.object(Membership, 'invalidate_role_cache', side_effect=RuntimeError):
+                self.member.delete()
+        Membership.objects.create(user=self.outsider, company=self.company, role=self.member_role)
+        self.assertCounts(3, 0)
+
+    def test_decrements_stop_at_zero(self):
+        Company.objects.filter(pk=self.company.pk).update(member_count=0)
+        Membership.objects.get(user=self.member).delete()
+        self.assertCounts(0, 0)
+
+    def test_recount_repairs_drift(self):
+        Company.objects.filter(pk=self.company.pk).update(member_count=40, unaccepted_invitation_count=7)
+        out = StringIO()
+        call_command('recount', stdout=out)
+        self.assertIn('fixed 1', out.getvalue())
+        self.assertCounts(2, 0)
+        call_command('recount', str(self.company.pk), stdout=out)
+        self.assertIn('fixed 0', out.getvalue())
+
+
+class SeedOrgsTests(TransactionTestCase):
+    # the command drops indexes, which SQLite can't do inside TestCase's transaction
+    serialized_rollback = True
+
+    def test_seeds_power_law_tenants_and_restores_indexes(self):
+        out = StringIO()
+        call_command(
+            'seed_orgs', '--users', '50', '--companies', '10', '--memberships', '120',
+            '--invitations', '200', '--invitees', '3', '--chunk-size', '7', '--seed', '1', stdout=out,
+        )
+        companies = list(Company.objects.order_by('pk'))
+        self.assertEqual(len(companies), 10)
+        sizes = [company.member_count for company in companies]
+        self.assertGreater(sizes[0], 5 * sizes[-1])
+        self.assertEqual(sum(sizes), Membership.objects.count())
+        self.assertEqual(Membership.objects.filter(role__slug=OWNER).count(), 10)
+        # keyset pages over date_joined need it spread out, members joining after the owner
+        self.assertGreater(Membership.objects.values('date_joined').distinct().count(), sum(sizes) // 2)
+        founded = Membership.objects.filter(company=OuterRef('company'), role__slug=OWNER).values('date_joined')
+        self.assertFalse(Membership.objects.filter(date_joined__lt=Subquery(founded)).exists())
+        self.assertEqual(
+            sum(company.unaccepted_invitation_count for company in companies),
+            CompanyInvitation.objects.filter(accepted=False).count(),
+        )
+        self.assertTrue(CompanyInvitation.objects.filter(accepted=True).exists())
+        self.assertTrue(CompanyInvitation.objects.filter(sent__isnull=True).exists())
+        self.assertTrue(any(i.key_expired() for i in CompanyInvitation.objects.filter(accepted=False, sent__isnull=False)))
+        invitee = CompanyInvitation.objects.get(email='seed-invitee-2@example.com')
+        self.assertFalse(invitee.accepted or invitee.key_expired())
+        self.assertTrue(User.objects.filter(email=invitee.email).exists())
+        # keys must fit the invitations app's accept URL
+        reverse('invitations:accept-invite', args=[invitee.key])
+        reverse('invitations:accept-invite', args=[CompanyInvitation.objects.first().key])
+
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Membership._meta.db_table)
+        self.assertIn('orgs_member_company_keyset', constraints)
+        with self.assertRaisesMessage(CommandError, "exists already"):
+            call_command('seed_orgs', '--users', '1', '--companies', '1', stdout=out)
+
+    def test_insert_requires_columns_without_a_database_default(self):
+        from .management.commands.seed_orgs import Command
+
+        with self.assertRaisesMessage(CommandError, "orgs.Membership rows need a value for date_joined, invite_reason."):
+            Command().insert(Membership, ('user', 'company', 'role'), [])
+
+
+class ViewCacheTests(OrgsTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.owner)
+        self.url = reverse('orgs_company_list')
+        self.client.get(self.url)  # sets the CSRF cookie, which isn't cached
+
+    def test_second_request_is_served_from_cache(self):
+        self.client.get(self.url)
+        # only the session and user lookups remain
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'Acme')
+        self.assertEqual(response.templates, [])
+
+    def test_membership_change_drops_owner_pages(self):
+        self.client.get(self.url)
+        Membership.objects.create(user=self.outsider, company=self.company, role=self.member_role)
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['companies'][0].member_count, 3)
+
+    def test_company_rename_drops_member_pages(self):
+        self.client.force_login(self.member)
+        url = reverse('orgs_membership_list')
+        self.client.get(url)
+        self.assertContains(self.client.get(url), 'Acme')
+        self.company.name = 'Acme Corp'
+        self.company.save()
+        self.assertContains(self.client.get(url), 'Acme Corp')
+
+    def test_pages_are_per_user(self):
+        self.client.get(self.url)
+        self.client.force_login(self.member)
+        self.client.get(self.url)
+        self.assertNotContains(self.client.get(self.url), 'Acme')
+
+    def test_pages_with_messages_are_not_cached(self):
+        rendered = []
+
+        @cache_per_user(namespace='messages-test')
+        def view(request):
+            rendered.append(request)
+            if 'flash' in request.GET:
+                messages.info(request, 'Welcome.')
+            return HttpResponse(''.join(str(message) for message in messages.get_messages(request)))
+
+        def get(*flashed, path='/'):
+            request = RequestFactory().get(path)
+            request.user = self.owner
+            request._messages = CookieStorage(request)
+            for message in flashed:
+                messages.info(request, message)
+            return view(request)
+
+        # waiting messages bypass the cache, and pages showing them aren't stored
+        self.assertContains(get('Saved.'), 'Saved.')
+        self.assertContains(get(path='/?flash'), 'Welcome.')
+        self.assertContains(get(path='/?flash'), 'Welcome.')
+        self.assertNotContains(get(), 'Saved.')
+        self.assertNotContains(get(), 'Saved.')
+        self.assertEqual(len(rendered), 4)
+        # a page cached without messages doesn't hide later ones
+        self.assertContains(get('Deleted.'), 'Deleted.')
+
+    def test_pages_are_per_language(self):
+        self.client.get(self.url)
+        self.client.cookies.load({settings.LANGUAGE_COOKIE_NAME: 'hi'})
+        # a miss runs the company query again
+        with self.assertNumQueries(3):
+            self.client.get(self.url)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+class SQLitePragmaTests(TestCase):
+    def busy_timeout(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_are_opt_in(self):
+        before = self.busy_timeout()
+        with override_settings(SQLITE_PRAGMAS={}):
+            configure_sqlite(sender=None, connection=connection)
+        self.assertEqual(self.busy_timeout(), before)
+
+    def test_pragmas_are_applied(self):
+        self.addCleanup(connection.cursor().execute, f'PRAGMA busy_timeout = {self.busy_timeout()}')
+        with override_settings(SQLITE_PRAGMAS={'busy_timeout': 1234}):
+            configure_sqlite(sender=None, connection=connection)
+        self.assertEqual(self.busy_timeout(), 1234)
+
+    def test_new_connections_are_configured(self):
+        other = connection.copy()
+        self.addCleanup(other.close)
+        with override_settings(SQLITE_PRAGMAS={'cache_size': -1234}):
+            with other.cursor() as cursor:
+                cursor.execute('PRAGMA cache_size')
+                self.assertEqual(cursor.fetchone()[0], -1234)
+
+    def test_tuned_transactions_take_the_write_lock_first(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'db.sqlite3')
+        tuned = SQLiteTunedWrapper({**connection.settings_dict, 'NAME': path}, alias='tuned')
+        self.addCleanup(tuned.close)
+        tuned._start_transaction_under_autocommit()
+        # another writer can't get in, even though nothing was written yet
+        other = sqlite3.connect(path, timeout=0)
+        self.addCleanup(other.close)
+        with self.assertRaisesMessage(sqlite3.OperationalError, 'database is locked'):
+            other.execute('BEGIN IMMEDIATE')
+
+
+@mock.patch.dict(settings.DATABASES, {'replica': {}})
+class ReplicaRouterTests(SimpleTestCase):
+    # a SimpleTestCase, so no test transaction keeps reads on the primary
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def read_alias(self, request):
+        return PrimaryPinMiddleware(lambda request: HttpResponse(self.router.db_for_read(Company)))(request)
+
+    def test_org_reads_go_to_the_replica(self):
+        self.assertEqual(self.router.db_for_read(Membership), 'replica')
+        self.assertIsNone(self.router.db_for_read(User))
+        with pin_to_primary():
+            self.assertEqual(self.router.db_for_read(Membership), 'default')
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self.router.db_for_read(Membership), 'default')
+
+    def test_cached_pages_are_built_from_the_primary(self):
+        template = engines.all()[0].from_string('{{ alias }}')
+        alias = lambda: self.router.db_for_read(Company)  # noqa: E731
+
+        @cache_per_user(namespace='replica-test')
+        def view(request):
+            return TemplateResponse(request, template, {'alias': alias})
+
+        @cache_per_user(namespace='replica-test-async')
+        async def async_view(request):
+            return TemplateResponse(request, template, {'alias': alias})
+
+        request = RequestFactory().get('/')
+        request.user = SimpleNamespace(pk=-1, is_authenticated=True)
+        self.addCleanup(cache.clear)
+        self.assertEqual(view(request).render().content, b'default')
+        self.assertEqual(async_to_sync(async_view)(request).render().content, b'default')
+        self.assertEqual(self.router.db_for_read(Company), 'replica')
+
+    def test_write_pins_user_to_primary(self):
+        def write(request):
+            self.router.db_for_write(Company)
+            return HttpResponse(self.router.db_for_read(Company))
+
+        response = PrimaryPinMiddleware(write)(RequestFactory().post('/'))
+        self.assertEqual(response.content, b'default')
+        cookie = response.cookies[PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+
+        request = RequestFactory().get('/')
+        request.COOKIES[PIN_COOKIE] = cookie.value
+        self.assertEqual(self.read_alias(request).content, b'default')
+        request.COOKIES[PIN_COOKIE] = str(time.time() - 1)
+        self.assertEqual(self.read_alias(request).content, b'replica')
+        self.assertNotIn(PIN_COOKIE, self.read_alias(RequestFactory().get('/')).cookies)
+
+
+class PrimaryPinTests(OrgsTestCase):
+    def test_company_create_pins_to_primary(self):
+        self.client.force_login(self.owner)
+        response = self.client.post(reverse('orgs_company_create'), {'name': 'Initech'})
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertNotIn(PIN_COOKIE, self.client.get(reverse('orgs_company_list')).cookies)
+
+
+class AsyncViewTests(OrgsTestCase):
+    """The async views through AsyncClient, i.e. Django's async handler."""
+
+    def test_middleware_is_async_capable(self):
+        # a sync-only middleware would put every ASGI request in a thread;
+        # the debug toolbar is development only
+        for path in settings.MIDDLEWARE:
+            if not path.startswith('debug_toolbar.'):
+                self.assertTrue(getattr(import_string(path), 'async_capable', False), path)
+
+    async def test_company_pages(self):
+        await self.async_client.aforce_login(self.owner)
+        response = await self.async_client.get(reverse('orgs_company_list'))
+        self.assertContains(response, 'Acme')
+        response = await self.async_client.get(reverse('orgs_company_detail', args=[self.company.pk]))
+        self.assertContains(response, 'member@example.com')
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+        response = await self.async_client.get(reverse('orgs_membership_list'), {'format': 'json'})
+        self.assertEqual([m['company']['name'] for m in response.json()['results']], ['Acme'])
+
+    async def test_login_and_membership_required(self):
+        response = await self.async_client.get(reverse('orgs_company_detail', args=[self.company.pk]))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(settings.LOGIN_URL, response['Location'])
+        await self.async_client.aforce_login(self.outsider)
+        response = await self.async_client.get(reverse('orgs_company_detail', args=[self.company.pk]))
+        self.assertEqual(response.status_code, 403)
+
+
+def company_kwargs(fixture):
+    return {'company_id': fixture.company.pk}
+
+
+# one request each, whatever the fixture size; company_delete goes last
+ORGS_QUERY_BUDGETS = {
+    'invite_to_company': Budget(3),
+    'invite_to_company_bulk': Budget(3),
+    'invite-success-url': Budget(2),
+    'accept-invite': Budget(9, kwargs=lambda f: {'key': f.invitation.key}, anonymous=True),
+    'orgs_company_create': Budget(2),
+    'orgs_company_list': Budget(3),
+    'orgs_company_detail': Budget(6, kwargs=company_kwargs),
+    'orgs_company_update': Budget(3, kwargs=company_kwargs),
+    'orgs_company_invitations_list': Budget(3),
+    'orgs_workspace_switch': Budget(7, method='post', kwargs=company_kwargs),
+    'orgs_workspace_clear': Budget(2, method='post'),
+    'orgs_company_delete': Budget(10, per_100_rows=3, kwargs=company_kwargs),
+}
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixtures = [seed_company(size) for size in FIXTURE_SIZES]
+
+    def test_every_orgs_url_is_within_budget(self):
+        self.assertViewBudgets(ORGS_QUERY_BUDGETS, self.fixtures, names=url_names('apps.orgs.urls'))
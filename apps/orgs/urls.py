@@ -4,6 +4,7 @@ from . import views
 urlpatterns = [
     # other urls...
     path('invite/', views.create_invite, name='invite_to_company'),
+    path('invite/bulk/', views.bulk_invite_view, name='invite_to_company_bulk'),
     path('invite/success/', views.invite_success, name='invite-success-url'),
     path('invitations/accept-invite/<str:key>/', views.CustomAcceptInvite.as_view(), name='accept-invite'),
     path('company/create/', views.company_create, name='orgs_company_create'),
@@ -12,5 +13,7 @@ urlpatterns = [
     path('company/update/<int:company_id>/', views.company_update, name='orgs_company_update'),
     path('company/delete/<int:company_id>/', views.company_delete, name='orgs_company_delete'),
     path('company/invitations/', views.companyinvitations_list, name='orgs_company_invitations_list'),
+    path('workspace/switch/<int:company_id>/', views.workspace_switch, name='orgs_workspace_switch'),
+    path('workspace/clear/', views.workspace_clear, name='orgs_workspace_clear'),
 
 ]
\ No newline at end of file
@@ -0,0 +1,148 @@
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from django_project.routers import pin_to_primary
+
+VIEW_CACHE_TIMEOUT = getattr(settings, 'VIEW_CACHE_TIMEOUT', 300)
+
+# bumped on role changes, which show up on every user's pages
+GLOBAL_GENERATION_KEY = 'orgs:view:gen'
+
+
+def _user_generation_key(user_id):
+    return f'orgs:view:gen:{user_id}'
+
+
+def generations(user_id):
+    """
+    Return the (global, user) generation pair cached pages of `user_id`
+    are keyed on; bumping either one orphans the old entries.
+    """
+    keys = [GLOBAL_GENERATION_KEY, _user_generation_key(user_id)]
+    found = cache.get_many(keys)
+    return tuple(found.get(key, 0) for key in keys)
+
+
+def invalidate_users(*user_ids):
+    stamp = time.time_ns()
+    cache.set_many({_user_generation_key(user_id): stamp for user_id in set(user_ids) if user_id}, None)
+
+
+def invalidate_all():
+    cache.set(GLOBAL_GENERATION_KEY, time.time_ns(), None)
+
+
+def _digest(value):
+    return hashlib.md5(value.encode(), usedforsecurity=False).hexdigest()
+
+
+def view_cache_key(request, namespace):
+    user_id = request.user.pk if request.user.is_authenticated else 'anon'
+    tenant = getattr(request, 'tenant', None)
+    parts = [
+        namespace,
+        user_id,
+        *generations(user_id),
+        getattr(request, 'LANGUAGE_CODE', settings.LANGUAGE_CODE),
+        tenant.company_id if tenant else '',
+        # pages embed a CSRF token, which is only valid with the cookie it
+        # was derived from
+        _digest(request.META.get('CSRF_COOKIE', '')),
+        _digest(request.get_full_path()),
+    ]
+    return 'orgs:view:' + ':'.join(str(part) for part in parts)
+
+
+def _has_messages(request):
+    # loads the message storage, which may read the session
+    storage = getattr(request, '_messages', None)
+    return storage is not None and len(storage) > 0
+
+
+def _is_template_response(response):
+    return hasattr(response, 'render') and callable(response.render)
+
+
+def _store_after_render(request, response, key, timeout, had_csrf_cookie):
+    def store(response):
+        # a CSRF cookie minted while rendering goes out with this response
+        # only, so the page can't be served to anyone else
+        minted_csrf_cookie = not had_csrf_cookie and 'CSRF_COOKIE' in request.META
+        # nor can flash messages shown on it, which are gone once displayed
+        storage = getattr(request, '_messages', None)
+        showed_messages = storage is not None and storage.used and len(storage) > 0
+        if response.status_code == 200 and not response.streaming and not response.cookies \
+                and not minted_csrf_cookie and not showed_messages:
+            cache.set(key, response, timeout)
+        return response
+
+    if _is_template_response(response):
+        response.add_post_render_callback(store)
+    else:
+        store(response)
+    return response
+
+
+def cache_per_user(timeout=None, namespace=None):
+    """
+    Cache a view's GET responses per user, language, active workspace and
+    CSRF cookie. Entries are dropped by bumping the user's generation (see
+    the receivers in signals.py) rather than deleted, so stale ones simply
+    expire. Anonymous visitors are keyed on their CSRF cookie as well, and
+    a first visit that mints the cookie is never stored. Requests with flash
+    messages waiting bypass the cache, and pages that displayed messages
+    aren't stored. A miss reads from the primary, as a page built from a
+    lagging replica would stay cached after the writes that invalidated it.
+    Works on sync and async views.
+
+    Usage::
+
+        @login_required
+        @cache_per_user()
+        def company_list(request): ...
+    """
+    timeout = VIEW_CACHE_TIMEOUT if timeout is None else timeout
+
+    def decorator(view_func):
+        prefix = namespace or f'{view_func.__module__}.{view_func.__qualname__}'
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not timeout or _has_messages(request):
+                return view_func(request, *args, **kwargs)
+            key = view_cache_key(request, prefix)
+            response = cache.get(key)
+            if response is not None:
+                return response
+            had_csrf_cookie = 'CSRF_COOKIE' in request.META
+            with pin_to_primary():
+                response = view_func(request, *args, **kwargs)
+                if _is_template_response(response):
+                    response.render()
+            return _store_after_render(request, response, key, timeout, had_csrf_cookie)
+
+        @wraps(view_func)
+        async def _async_wrapped_view(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not timeout \
+                    or await sync_to_async(_has_messages)(request):
+                return await view_func(request, *args, **kwargs)
+            # the cache backend may be a network round trip (redis)
+            key = await sync_to_async(view_cache_key)(request, prefix)
+            response = await cache.aget(key)
+            if response is not None:
+                return response
+            had_csrf_cookie = 'CSRF_COOKIE' in request.META
+            with pin_to_primary():
+                response = await view_func(request, *args, **kwargs)
+                if _is_template_response(response):
+                    await sync_to_async(response.render)()
+            return await sync_to_async(_store_after_render)(request, response, key, timeout, had_csrf_cookie)
+
+        return _async_wrapped_view if iscoroutinefunction(view_func) else _wrapped_view
+
+    return decorator
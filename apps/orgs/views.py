@@ -1,40 +1,52 @@
-from django.shortcuts import render,redirect,get_object_or_404
-from django.contrib.auth.decorators import login_required
+from django.shortcuts import render,redirect
 from django.contrib.auth import get_user_model
+from django.contrib.sites.shortcuts import get_current_site
 from invitations.views import AcceptInvite
-from .models import Membership,Role,Company,CompanyInvitation
-from .forms import CompanyInvitationForm,CompanyForm
-from .decorators import role_required,company_member_required
-from django.db.models import Count
+from .models import Membership,Role,CompanyInvitation
+from .forms import CompanyInvitationForm,CompanyForm,BulkInvitationForm
+from .bulk import bulk_invite
+from .roles import OWNER, registry as role_registry
+from . import viewcache
+from .viewcache import cache_per_user
+from .decorators import login_required,role_required,company_member_required
+from django.db import transaction
+from django.views.decorators.http import require_POST
+from django.utils.http import url_has_allowed_host_and_scheme
+from .middleware import set_workspace, clear_workspace
+from .pagination import apaginate_keyset, paginate_keyset, wants_json, keyset_json_response
+from asgiref.sync import sync_to_async
 
 #
 # Create your views here.
 
 User = get_user_model()
 
-def has_permission(user, tenant, permission_codename):
-    try:
-        # Get the user's role in the tenant
-        membership = Membership.objects.get(user=user, tenant=tenant)
-        role = membership.role
-    except Membership.DoesNotExist:
-        # The user does not have a role in the tenant
+def has_permission(user, company, permission):
+    """
+    Check `permission` ("app_label.codename" or a bare codename) against the
+    user's role in `company`, using the cached role and permission set.
+    """
+    company_id = getattr(company, 'pk', company)
+    role_id = Membership.get_role_id(user.pk, company_id)
+    if role_id is None:
+        # The user does not have a role in the company
         return False
 
-    # Check if the role has the permission
-    return role.permissions.filter(codename=permission_codename).exists()
+    permissions = Role.get_permission_set_for(role_id)
+    if '.' in permission:
+        return permission in permissions
+    return any(perm.split('.', 1)[1] == permission for perm in permissions)
 
-def has_role(user, tenant, role_name):
+def has_role(user, company, role_name):
     try:
-        # Get the user's role in the tenant
-        membership = Membership.objects.get(user=user, tenant=tenant)
+        # Get the user's role in the company
+        membership = Membership.objects.select_related('role').get(user=user, company=company)
         role = membership.role
     except Membership.DoesNotExist:
-        # The user does not have a role in the tenant
+        # The user does not have a role in the company
         return False
 
-    # Check if the role has the permission
-    return role.name == role_name
+    return role is not None and role.name == role_name
 
 # def my_view(request, tenant_id):
 #     tenant = get_object_or_404(Tenant, id=tenant_id)
@@ -54,30 +66,55 @@ def company_create(request):
             company = form.save(commit=False)
             company.creator = request.user
             company.owner = request.user
-            company.save()
-            Membership.objects.create(user=request.user, company=company, role=Role.objects.get(name='Owner'))
+            with transaction.atomic():
+                company.save()
+                Membership.objects.create(user=request.user, company=company, role=role_registry.get(OWNER))
             return redirect('orgs_company_list')
     else:
         form = CompanyForm()
     return render(request, 'company/company_form.html', {'form': form})
 
+# The read-heavy views are async: under ASGI (see django_project/asgi.py) a
+# slow query waits without holding a worker. Their data is fetched up front,
+# and templates render in a thread in case they touch a lazy relation.
+
 @login_required
-def company_list(request):
-    companies = request.user.owned_companies.annotate(num_members=Count('membership'))
-    
+@cache_per_user()
+async def company_list(request):
+    # member_count is a counter column, no join over memberships. Left lazy
+    # for the template's {% cache %} fragment, which skips the query on a hit.
+    companies = request.user.owned_companies.all()
+
     form = CompanyForm()
-    return render(request, 'company/company_list.html', {'companies': companies,'form': form})
+    return await sync_to_async(render)(request, 'company/company_list.html', {'companies': companies,'form': form})
 
 @login_required
 @company_member_required
-def company_detail(request, company_id):
-    company = Company.objects.get(id=company_id)
-    return render(request, 'company/company_detail.html', {'company': company})
-
-
-@role_required('Owner')
+async def company_detail(request, company_id):
+    membership = request.membership
+    company = membership.company
+    # owner and creator in one query instead of two lazy loads
+    users = await User.objects.ain_bulk({company.owner_id, company.creator_id})
+    company.owner, company.creator = users[company.owner_id], users[company.creator_id]
+    members = await apaginate_keyset(
+        request, company.membership_set.select_related('user', 'role'),
+        ('date_joined', 'id'), cursor_param='members_after',
+    )
+    invitations = await apaginate_keyset(
+        request, company.invitations.select_related('inviter'),
+        ('-created', '-id'), cursor_param='invitations_after',
+    )
+    return await sync_to_async(render)(request, 'company/company_detail.html', {
+        'company': company,
+        'membership': membership,
+        'members': members,
+        'invitations': invitations,
+    })
+
+
+@role_required(OWNER)
 def company_update(request, company_id):
-    company = Company.objects.get(id=company_id)
+    company = request.membership.company
     if request.method == 'POST':
         form = CompanyForm(request.POST, instance=company)
         if form.is_valid():
@@ -88,24 +125,56 @@ def company_update(request, company_id):
     return render(request, 'company/company_form.html', {'form': form})
 
 
-@role_required('Owner')
+@role_required(OWNER)
 def company_delete(request, company_id):
-    company = get_object_or_404(Company, id=company_id)
+    company = request.membership.company
 
     # Check if the user has the permission to delete the company
-    if request.user != company.owner:
+    if request.user.id != company.owner_id:
         return redirect('error_page')  # Redirect to an error page
 
     company.delete()
+    viewcache.invalidate_users(request.user.id)
     return redirect('orgs_company_list')  # Redirect to the list of companies
 
+def _redirect_back(request, default, **kwargs):
+    next_url = request.POST.get('next')
+    if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        return redirect(next_url)
+    return redirect(default, **kwargs)
+
+@require_POST
+@company_member_required
+def workspace_switch(request, company_id):
+    set_workspace(request, request.membership.company)
+    return _redirect_back(request, 'orgs_company_detail', company_id=company_id)
+
+@require_POST
+@login_required
+def workspace_clear(request):
+    clear_workspace(request)
+    return _redirect_back(request, 'orgs_company_list')
+
 @login_required
 def companyinvitations_list(request):
-    invitations = CompanyInvitation.objects.filter(inviter=request.user.id)
+    invitations = paginate_keyset(
+        request,
+        CompanyInvitation.objects.filter(inviter=request.user.id).select_related('company', 'inviter'),
+        ('-created', '-id'),
+    )
+    if wants_json(request):
+        return keyset_json_response(invitations, lambda i: {
+            'id': i.id,
+            'created': i.created,
+            'company': i.company.name,
+            'email': i.email,
+            'accepted': i.accepted,
+            'sent': i.sent,
+        })
     return render(request, 'company/company_invitations_list.html', {'invitations': invitations})
     
 
-# @role_required('Owner')
+# @role_required(OWNER)
 def create_invite(request):
     if request.method == 'POST':
         form = CompanyInvitationForm(request.POST, inviter=request.user,request=request)
@@ -116,18 +185,27 @@ def create_invite(request):
         form = CompanyInvitationForm(inviter=request.user)
     return render(request, 'company/invitation_form.html', {'form': form})
 
+@login_required
+def bulk_invite_view(request):
+    result = None
+    if request.method == 'POST':
+        form = BulkInvitationForm(request.POST, request.FILES, inviter=request.user)
+        if form.is_valid():
+            result = bulk_invite(
+                form.cleaned_data['company'], request.user, form.get_emails(),
+                absolute_url=request.build_absolute_uri,
+                site_name=get_current_site(request).name,
+            )
+    else:
+        form = BulkInvitationForm(inviter=request.user)
+    return render(request, 'company/bulk_invite.html', {'form': form, 'result': result})
+
 @login_required
 def invite_success(request):
     return render(request, 'company/invite_success.html')
 
 class CustomAcceptInvite(AcceptInvite):
-    def get(self, *args, **kwargs):
-        invite = self.get_object()
-        email = invite.email
-        user = User.objects.filter(email=email).first()
-
-        if user:
-            # If the user is already registered, create a Membership instance
-            Membership.objects.create(user=user, company=invite.company)
-
-        return super().get(*args, **kwargs)
+    # Memberships are created by the invite_accepted receiver in signals.py
+    # once the key has been validated, for every company that invited the
+    # address. Creating them here as well raced with it.
+    pass
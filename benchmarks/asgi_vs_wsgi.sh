@@ -0,0 +1,23 @@
+#!/bin/sh
+# Throughput of the read-heavy org pages under slow I/O, WSGI (sync gunicorn
+# workers, as in the Dockerfile) against ASGI (uvicorn workers, async
+# views). Each query is delayed by SLOW_QUERY_MS; the view cache is off so
+# every request reaches the database.
+#
+#   benchmarks/asgi_vs_wsgi.sh                  # 50 ms per query, 32 clients
+#   SLOW_QUERY_MS=200 benchmarks/asgi_vs_wsgi.sh --concurrency 64
+set -eu
+
+cd "$(dirname "$0")/.."
+export DJANGO_SETTINGS_MODULE=benchmarks.slow_io
+export SLOW_QUERY_MS=${SLOW_QUERY_MS:-50}
+export VIEW_CACHE_TIMEOUT=0
+export GENERATE_ARGS=${GENERATE_ARGS:---companies 160 --invitees 0}
+REPORTS=benchmarks/reports
+
+for server in wsgi asgi; do
+    SERVER=$server REPORT=$REPORTS/slow-io-$server.json benchmarks/run.sh \
+        --scenario company_list --scenario company_detail --scenario membership_list \
+        --concurrency 32 --duration 15 "$@"
+done
+python benchmarks/compare.py $REPORTS/slow-io-wsgi.json $REPORTS/slow-io-asgi.json
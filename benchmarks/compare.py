@@ -0,0 +1,45 @@
+"""
+Compare two loadtest.py reports, e.g. before and after a change:
+
+    python benchmarks/compare.py benchmarks/reports/main.json benchmarks/reports/HEAD.json
+
+Changes are shown as a percentage of the first report. Reports are only
+comparable when taken on the same machine with the same data sizes,
+concurrency and duration; differences in those are printed first.
+"""
+import argparse
+import json
+from pathlib import Path
+
+METRICS = ("rps", "p50_ms", "p95_ms", "p99_ms", "errors")
+
+
+def change(old, new):
+    if not old:
+        return ""
+    return f"{(new - old) / old * 100:+.0f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base", type=Path)
+    parser.add_argument("head", type=Path)
+    args = parser.parse_args()
+
+    base, head = json.loads(args.base.read_text()), json.loads(args.head.read_text())
+    for key in ("concurrency", "duration", "data"):
+        if base.get(key) != head.get(key):
+            print(f"warning: {key} differs: {base.get(key)} vs {head.get(key)}")
+
+    print(f"{base.get('revision')} -> {head.get('revision')}")
+    print(f"{'scenario':<16}" + "".join(f"{metric:>24}" for metric in METRICS))
+    for name in head["results"]:
+        if name not in base["results"]:
+            continue
+        old, new = base["results"][name], head["results"][name]
+        cells = [f"{old[m]} -> {new[m]} {change(old[m], new[m])}" for m in METRICS]
+        print(f"{name:<16}" + "".join(f"{cell:>24}" for cell in cells))
+
+
+if __name__ == "__main__":
+    main()
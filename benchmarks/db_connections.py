@@ -0,0 +1,132 @@
+"""
+Latency of company_list under different database connection settings.
+
+Requests go through Django's real WSGI handler, so connections are opened
+and closed exactly as under gunicorn: with CONN_MAX_AGE=0 every request
+reconnects, with CONN_MAX_AGE>0 each thread keeps its connection. Compare
+runs against the same database:
+
+    DATABASE_URL=postgres://postgres@localhost/rokkad CONN_MAX_AGE=0 python benchmarks/db_connections.py
+    DATABASE_URL=postgres://postgres@localhost/rokkad CONN_MAX_AGE=60 python benchmarks/db_connections.py
+
+The database must be migrated. A `loadtest` user owning --companies
+companies is created on first run.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_project.settings")
+# measure the database, not the view cache
+os.environ["VIEW_CACHE_TIMEOUT"] = "0"
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.handlers.wsgi import WSGIHandler  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.test.client import RequestFactory  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from apps.orgs.models import Company, Membership  # noqa: E402
+from apps.orgs.roles import OWNER, registry  # noqa: E402
+
+User = get_user_model()
+
+
+def ensure_data(companies):
+    user, _ = User.objects.get_or_create(username="loadtest", defaults={"email": "loadtest@example.com"})
+    existing = user.owned_companies.count()
+    for i in range(existing, companies):
+        company = Company.objects.create(name=f"loadtest-{i}", owner=user, creator=user)
+        Membership.objects.create(user=user, company=company, role=registry.get(OWNER))
+    return user
+
+
+def session_cookie(user):
+    client = Client()
+    client.force_login(user)
+    return "; ".join(f"{name}={morsel.value}" for name, morsel in client.cookies.items())
+
+
+def run(path, cookie, requests, threads):
+    handler = WSGIHandler()
+    environ = RequestFactory()._base_environ(
+        PATH_INFO=path,
+        HTTP_COOKIE=cookie,
+        SERVER_NAME="localhost",
+        # outside INTERNAL_IPS, so the debug toolbar stays out of the way
+        REMOTE_ADDR="10.0.0.1",
+    )
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    per_thread = requests // threads
+
+    def worker():
+        local = []
+        for _ in range(per_thread):
+            started = time.perf_counter()
+            response = handler(dict(environ), lambda status, headers: None)
+            b"".join(response)
+            response.close()  # request_finished: close or keep the connection
+            local.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies, time.perf_counter() - started, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--companies", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=50)
+    args = parser.parse_args()
+
+    db = settings.DATABASES["default"]
+    opened = []
+    connection_created.connect(lambda sender, connection, **kwargs: opened.append(connection.alias), weak=False)
+
+    cookie = session_cookie(ensure_data(args.companies))
+    connection.close()
+    path = reverse("orgs_company_list")
+    # manifest storage needs collectstatic, which a benchmark shouldn't
+    with override_settings(STORAGES={**settings.STORAGES, "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    }}):
+        run(path, cookie, args.warmup, 1)
+        opened.clear()
+        latencies, elapsed, errors = run(path, cookie, args.requests, args.threads)
+
+    ms = [latency * 1000 for latency in latencies]
+    cuts = statistics.quantiles(ms, n=100)
+    print(
+        f"engine={db['ENGINE'].rsplit('.', 1)[-1]} conn_max_age={db['CONN_MAX_AGE']} "
+        f"health_checks={db['CONN_HEALTH_CHECKS']} "
+        f"threads={args.threads} requests={len(ms)} errors={len(errors)} connections={len(opened)} "
+        f"rps={len(ms) / elapsed:.0f} p50={cuts[49]:.2f}ms p95={cuts[94]:.2f}ms p99={cuts[98]:.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Seed a database for the load driver and write a manifest of what it made.
+
+    DATABASE_URL=sqlite:///benchmarks/.data/bench.sqlite3 python benchmarks/generate_data.py
+
+A thin wrapper over `manage.py seed_orgs`: --companies companies with
+--members members and --invitations invitations each (sizes are uniform
+unless --alpha is raised), drawn from --users users, plus --invitees users
+with one pending invitation per accept the driver may do. Every user has
+the password PASSWORD. The manifest lists the companies' owners, whom the
+driver logs in as, and the invitees with their keys.
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_project.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.management import CommandError, call_command  # noqa: E402
+
+from apps.orgs.models import Company, CompanyInvitation  # noqa: E402
+
+User = get_user_model()
+
+PASSWORD = "bench-Pass-123"
+PREFIX = "bench"
+DEFAULT_MANIFEST = Path(__file__).resolve().parent / ".data" / "manifest.json"
+
+
+def manifest(args):
+    by_owner = {}
+    for pk, owner_id in Company.objects.filter(name__startswith=f"{PREFIX}-company-").values_list("pk", "owner_id"):
+        by_owner.setdefault(owner_id, []).append(pk)
+    owners = User.objects.filter(pk__in=by_owner).order_by("pk").values_list("pk", "email")
+    invitees = CompanyInvitation.objects.filter(email__startswith=f"{PREFIX}-invitee-").order_by("pk")
+    return {
+        "password": PASSWORD,
+        "owners": [{"id": pk, "email": email, "companies": sorted(by_owner[pk])} for pk, email in owners],
+        "invitees": [{"email": email, "key": key} for email, key in invitees.values_list("email", "key")],
+        "sizes": vars(args) | {"manifest": str(args.manifest)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000, help="Users the owners and members are drawn from.")
+    parser.add_argument("--companies", type=int, default=250)
+    parser.add_argument("--members", type=int, default=200, help="Members of every company besides its owner.")
+    parser.add_argument("--invitations", type=int, default=200, help="Invitations per company, about half of them pending.")
+    parser.add_argument("--invitees", type=int, default=2000, help="Users with an invitation to accept.")
+    parser.add_argument("--alpha", type=float, default=0.0, help="Power-law exponent of company sizes.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--manifest", type=Path, default=DEFAULT_MANIFEST)
+    args = parser.parse_args()
+
+    try:
+        call_command(
+            "seed_orgs",
+            users=args.users,
+            companies=args.companies,
+            memberships=args.companies * (args.members + 1),
+            invitations=args.companies * args.invitations,
+            invitees=args.invitees,
+            alpha=args.alpha,
+            prefix=PREFIX,
+            password=PASSWORD,
+            seed=args.seed,
+        )
+    except CommandError as error:
+        parser.error(str(error))
+    data = manifest(args)
+    args.manifest.parent.mkdir(parents=True, exist_ok=True)
+    args.manifest.write_text(json.dumps(data, indent=1))
+    print(
+        f"{len(data['owners'])} owners, {args.companies} companies, "
+        f"{len(data['invitees'])} invitees -> {args.manifest}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+validate_invitation() on a large invitations table: the two iexact queries
+it used to run against the single LOWER(email) lookup it runs now.
+
+    python benchmarks/invitation_lookups.py --invitations 1000000
+    python benchmarks/invitation_lookups.py --database-url postgres://postgres@localhost/rokkad
+
+Uses a fresh SQLite database in a temporary directory unless
+--database-url is given. The database is migrated, and if it has no
+invitations, `manage.py seed_orgs` fills it with --invitations of them.
+Tables are analyzed before timing, and the query plan of the new lookup is
+printed.
+"""
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def setup(database_url):
+    sys.path.insert(0, str(ROOT))
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_project.settings")
+    import django
+
+    django.setup()
+
+
+def old_validate_invitation(email):
+    """validate_invitation() before the LOWER(email) index."""
+    from invitations.exceptions import AlreadyAccepted, AlreadyInvited
+
+    from apps.orgs.models import CompanyInvitation
+
+    if CompanyInvitation.objects.all_valid().filter(email__iexact=email, accepted=False):
+        raise AlreadyInvited
+    elif CompanyInvitation.objects.filter(email__iexact=email, accepted=True):
+        raise AlreadyAccepted
+    return True
+
+
+def timed(name, validate, emails):
+    from invitations.exceptions import AlreadyAccepted, AlreadyInvited
+
+    latencies = []
+    for email in emails:
+        started = time.perf_counter()
+        try:
+            validate(email)
+        except (AlreadyAccepted, AlreadyInvited):
+            pass
+        latencies.append((time.perf_counter() - started) * 1000)
+    print(f"{name}: lookups={len(emails)} mean={statistics.mean(latencies):.2f}ms "
+          f"median={statistics.median(latencies):.2f}ms max={max(latencies):.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--invitations", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=20, help="Addresses looked up with each implementation.")
+    parser.add_argument("--database-url", help="Database to use (default: a temporary SQLite file).")
+    args = parser.parse_args()
+
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')}"
+    env = {**os.environ, "DATABASE_URL": database_url}
+    subprocess.run([sys.executable, str(ROOT / "manage.py"), "migrate", "-v0"], env=env, check=True)
+    setup(database_url)
+    from django.core.management import call_command
+    from django.db import connection
+
+    from apps.orgs.forms import CompanyInvitationForm
+    from apps.orgs.models import CompanyInvitation
+
+    if not CompanyInvitation.objects.exists():
+        call_command(
+            "seed_orgs", users=10_000, companies=1_000, memberships=10_000, invitations=args.invitations, seed=1,
+        )
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    total = CompanyInvitation.objects.count()
+
+    rng = random.Random(1)
+    ids = CompanyInvitation.objects.order_by("pk").values_list("pk", flat=True)
+    picked = [ids[rng.randrange(total)] for _ in range(args.lookups // 2)]
+    # half existing addresses in mixed case, half unknown ones
+    emails = [email.upper() for email in CompanyInvitation.objects.filter(pk__in=picked).values_list("email", flat=True)]
+    emails += [f"nobody{i}@example.com" for i in range(args.lookups - len(emails))]
+
+    print(f"vendor={connection.vendor} invitations={total}")
+    form = CompanyInvitationForm()
+    timed("old validate_invitation", old_validate_invitation, emails)
+    timed("new validate_invitation", form.validate_invitation, emails)
+    print("plan:", CompanyInvitation.objects.for_email(emails[0]).values("accepted", "sent").explain())
+
+
+if __name__ == "__main__":
+    main()
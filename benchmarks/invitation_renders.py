@@ -0,0 +1,85 @@
+"""
+Invitation e-mail renders per second: render_message() for every outbox
+row against InvitationRenderer's cached fragments.
+
+    python benchmarks/invitation_renders.py --renders 10000
+
+Uses a fresh SQLite database in a temporary directory unless --path is
+given. `manage.py seed_orgs` creates --renders invitations over
+--companies companies; each gets an outbox row, alternately in English and
+Hindi, as bulk_invite() would queue them.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def setup(path):
+    sys.path.insert(0, str(ROOT))
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_project.settings")
+    import django
+
+    django.setup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--renders", type=int, default=10_000)
+    parser.add_argument("--companies", type=int, default=10)
+    parser.add_argument("--path", help="SQLite file to use (migrated and seeded if needed).")
+    args = parser.parse_args()
+
+    path = args.path or os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{path}"}
+    subprocess.run([sys.executable, str(ROOT / "manage.py"), "migrate", "-v0"], env=env, check=True)
+    setup(path)
+    from django.core.management import call_command
+    from django.urls import reverse
+    from invitations.app_settings import app_settings
+
+    from apps.orgs.mail import InvitationRenderer, render_message
+    from apps.orgs.models import CompanyInvitation, InvitationOutbox
+
+    # as bulk_invite() builds them
+    url_template = "http://testserver" + reverse(app_settings.CONFIRMATION_URL_NAME, args=["__key__"])
+    if not InvitationOutbox.objects.exists():
+        call_command(
+            "seed_orgs", users=1000, companies=args.companies, memberships=args.companies,
+            invitations=args.renders, seed=1, stdout=open(os.devnull, "w"),
+        )
+        InvitationOutbox.objects.bulk_create(
+            InvitationOutbox(
+                invitation_id=pk,
+                language=("en", "hi")[i % 2],
+                context={
+                    "invite_url": url_template.replace("__key__", key),
+                    "site_name": "rokkad",
+                    "email": email,
+                    "key": key,
+                },
+            )
+            for i, (pk, email, key) in enumerate(CompanyInvitation.objects.values_list("pk", "email", "key"))
+        )
+    rows = list(InvitationOutbox.objects.select_related("invitation__inviter").order_by("pk")[: args.renders])
+    combinations = len({InvitationRenderer().cache_key(row) for row in rows})
+
+    for name, render in (("full render", render_message), ("cached render", InvitationRenderer().render)):
+        started = time.perf_counter()
+        for row in rows:
+            render(row)
+        elapsed = time.perf_counter() - started
+        print(
+            f"{name}: renders={len(rows)} combinations={combinations} "
+            f"seconds={elapsed:.2f} renders/s={len(rows) / elapsed:,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+HTTP load driver for the org and invitation workflows.
+
+    python benchmarks/loadtest.py --base-url http://127.0.0.1:8000 --out benchmarks/reports/HEAD.json
+
+Runs each scenario for --duration seconds with --concurrency threads. Every
+thread is a separate browser session (own cookies, logged in as its own
+owner from the manifest written by generate_data.py). One operation is the
+requests a user makes for that action, e.g. GET the form then POST it;
+redirects are not followed. A GET fails on a 4xx/5xx status, a POST
+unless it redirects: a form that doesn't validate re-renders with 200.
+Reports ops/s and p50/p95/p99 per scenario as
+a table and, with --out, as JSON for benchmarks/compare.py.
+
+Scenarios: signup, login, company_create, company_list, company_detail,
+membership_list, create_invite, accept_invite.
+"""
+import argparse
+import datetime
+import http.cookiejar
+import itertools
+import json
+import statistics
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+
+DEFAULT_MANIFEST = Path(__file__).resolve().parent / ".data" / "manifest.json"
+SCENARIOS = (
+    "signup", "login", "company_create", "company_list", "company_detail", "membership_list",
+    "create_invite", "accept_invite",
+)
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Session:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), NoRedirect)
+
+    def request(self, path, data=None):
+        url = self.base_url + path
+        body = None
+        if data is not None:
+            data = {"csrfmiddlewaretoken": self.csrf_token(), **data}
+            body = urllib.parse.urlencode(data).encode()
+        request = urllib.request.Request(url, data=body, headers={"Referer": url})
+        try:
+            with self.opener.open(request, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            # 3xx land here too, since redirects aren't followed
+            error.read()
+            return error.code
+
+    def get(self, path):
+        """Returns (status, ok)."""
+        status = self.request(path)
+        return status, status < 400
+
+    def post(self, path, data, expect=302):
+        status = self.request(path, data)
+        return status, status == expect
+
+    def csrf_token(self):
+        return next((c.value for c in self.cookies if c.name == "csrftoken"), "")
+
+    def login(self, email, password):
+        self.get("/accounts/login/")
+        return self.post("/accounts/login/", {"login": email, "password": password})
+
+
+class Scenarios:
+    """One method per scenario; each returns the (status, ok) of its requests."""
+
+    def __init__(self, manifest, base_url):
+        self.manifest = manifest
+        self.base_url = base_url
+        self.counter = itertools.count()
+        self.invitees = iter(manifest["invitees"])
+        self.lock = threading.Lock()
+
+    def next_id(self):
+        return f"{time.time_ns()}-{next(self.counter)}"
+
+    def session_for(self, worker):
+        owner = self.manifest["owners"][worker % len(self.manifest["owners"])]
+        session = Session(self.base_url)
+        session.login(owner["email"], self.manifest["password"])
+        session.owner = owner
+        return session
+
+    def signup(self, session):
+        email = f"signup-{self.next_id()}@bench.example.com"
+        anonymous = Session(self.base_url)
+        return [
+            anonymous.get("/accounts/signup/"),
+            anonymous.post("/accounts/signup/", {"email": email, "password1": self.manifest["password"]}),
+        ]
+
+    def login(self, session):
+        anonymous = Session(self.base_url)
+        return [anonymous.login(session.owner["email"], self.manifest["password"])]
+
+    def company_create(self, session):
+        return [
+            session.get("/orgs/company/create/"),
+            session.post("/orgs/company/create/", {"name": f"created-{self.next_id()}"}),
+        ]
+
+    def company_list(self, session):
+        return [session.get("/orgs/company/list/")]
+
+    def company_detail(self, session):
+        company = session.owner["companies"][next(self.counter) % len(session.owner["companies"])]
+        return [session.get(f"/orgs/company/{company}/")]
+
+    def membership_list(self, session):
+        return [session.get("/profile/membership/list/")]
+
+    def create_invite(self, session):
+        company = session.owner["companies"][0]
+        return [
+            session.get("/orgs/invite/"),
+            session.post("/orgs/invite/", {
+                "email": f"invite-{self.next_id()}@bench.example.com",
+                "company": company,
+                "inviter": session.owner["id"],
+            }),
+        ]
+
+    def accept_invite(self, session):
+        with self.lock:
+            invitee = next(self.invitees, None)
+        if invitee is None:
+            raise StopIteration("out of invitations, generate more with --invitees")
+        invited = Session(self.base_url)
+        invited.login(invitee["email"], self.manifest["password"])
+        started = time.perf_counter()
+        step = invited.get(f"/orgs/invitations/accept-invite/{invitee['key']}/")
+        # only the accept itself is timed, not the login before it
+        return [step], time.perf_counter() - started
+
+
+def percentile(cuts, p):
+    return cuts[p - 1] if cuts else 0.0
+
+
+def run_scenario(scenarios, name, concurrency, duration):
+    action = getattr(scenarios, name)
+    sessions = [scenarios.session_for(worker) for worker in range(concurrency)]
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(session):
+        local, failed = [], []
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                result = action(session)
+            except StopIteration:
+                break
+            elapsed = time.perf_counter() - started
+            if isinstance(result, tuple):
+                result, elapsed = result
+            local.append(elapsed)
+            failed += [status for status, ok in result if not ok]
+        with lock:
+            latencies.extend(local)
+            errors.extend(failed)
+
+    threads = [threading.Thread(target=worker, args=(session,)) for session in sessions]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    ms = [latency * 1000 for latency in latencies]
+    cuts = statistics.quantiles(ms, n=100) if len(ms) > 1 else []
+    return {
+        "ops": len(ms),
+        "rps": round(len(ms) / elapsed, 1),
+        "errors": len(errors),
+        "error_statuses": {str(status): errors.count(status) for status in sorted(set(errors))},
+        "p50_ms": round(percentile(cuts, 50), 2),
+        "p95_ms": round(percentile(cuts, 95), 2),
+        "p99_ms": round(percentile(cuts, 99), 2),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results):
+    print(f"{'scenario':<16}{'ops':>8}{'ops/s':>9}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<16}{r['ops']:>8}{r['rps']:>9}{r['errors']:>8}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--manifest", type=Path, default=DEFAULT_MANIFEST)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="Repeat to pick several (default: all).")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per scenario.")
+    parser.add_argument("--out", type=Path, help="Write the report as JSON here.")
+    args = parser.parse_args()
+
+    manifest = json.loads(args.manifest.read_text())
+    scenarios = Scenarios(manifest, args.base_url)
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        results[name] = run_scenario(scenarios, name, args.concurrency, args.duration)
+        print(f"{name}: {results[name]}", flush=True)
+    print_table(results)
+
+    if args.out:
+        report = {
+            "revision": git_revision(),
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "base_url": args.base_url,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "data": manifest["sizes"],
+            "results": results,
+        }
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps(report, indent=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Role permission checks per second, uncached (the queries has_permission()
+used to run on every check) against has_permission() with the cached role
+id and permission set.
+
+    python benchmarks/permission_checks.py --checks 3000
+
+Uses a fresh SQLite database seeded with `manage.py seed_orgs` in a
+temporary directory unless --path is given. Every role gets --permissions
+permissions; the checks cycle through --members members of the seeded
+companies and through granted and missing codenames.
+"""
+import argparse
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def setup(path):
+    sys.path.insert(0, str(ROOT))
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_project.settings")
+    import django
+
+    django.setup()
+
+
+def uncached_has_permission(user_id, company_id, codename):
+    """has_permission() before the cache: membership, role, then exists()."""
+    from apps.orgs.models import Membership
+
+    try:
+        role = Membership.objects.get(user_id=user_id, company_id=company_id).role
+    except Membership.DoesNotExist:
+        return False
+    return role is not None and role.permissions.filter(codename=codename).exists()
+
+
+def timed(name, func, checks):
+    from django.db import connection
+
+    queries = []
+
+    def count(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count):
+        started = time.perf_counter()
+        granted = sum(func(user_id, company_id, codename) for user_id, company_id, codename in checks)
+        elapsed = time.perf_counter() - started
+    print(
+        f"{name}: checks={len(checks)} granted={granted} checks/s={len(checks) / elapsed:,.0f} "
+        f"queries={len(queries)}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checks", type=int, default=3000)
+    parser.add_argument("--permissions", type=int, default=20, help="Permissions granted to every role.")
+    parser.add_argument(
+        "--members",
+        type=int,
+        default=200,
+        help="Distinct (user, company) pairs checked. Keep it under the cache's MAX_ENTRIES "
+        "(300 for locmem), or warm checks miss.",
+    )
+    parser.add_argument("--path", help="SQLite file to use (migrated and seeded if needed).")
+    args = parser.parse_args()
+
+    path = args.path or os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{path}"}
+    subprocess.run([sys.executable, str(ROOT / "manage.py"), "migrate", "-v0"], env=env, check=True)
+    setup(path)
+    from django.contrib.auth.models import Permission
+    from django.core.cache import cache
+    from django.core.management import call_command
+
+    from apps.orgs.models import Membership, Role
+    from apps.orgs.views import has_permission
+
+    if not Membership.objects.exists():
+        call_command(
+            "seed_orgs", users=200, companies=20, memberships=1000, invitations=0, seed=1, stdout=open(os.devnull, "w"),
+        )
+    permissions = list(Permission.objects.order_by("pk")[: args.permissions * 2])
+    for role in Role.objects.all():
+        role.permissions.set(permissions[: args.permissions])
+    codenames = [p.codename for p in permissions]
+
+    members = list(Membership.objects.values_list("user_id", "company_id")[: args.members])
+    pairs = zip(itertools.cycle(members), itertools.cycle(codenames))
+    checks = [(user_id, company_id, codename) for (user_id, company_id), codename in itertools.islice(pairs, args.checks)]
+
+    def cached(user_id, company_id, codename):
+        # has_permission() only reads the user's pk
+        return has_permission(SimpleNamespace(pk=user_id), company_id, codename)
+
+    cache.clear()
+    timed("uncached", uncached_has_permission, checks)
+    cache.clear()
+    timed("cached, cold", cached, checks)
+    timed("cached, warm", cached, checks)
+
+
+if __name__ == "__main__":
+    main()
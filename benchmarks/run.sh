@@ -0,0 +1,48 @@
+#!/bin/sh
+# Load-test the app under gunicorn, configured as in the Dockerfile, against
+# a fresh SQLite database seeded by generate_data.py. Offline; no services.
+#
+#   benchmarks/run.sh                         # report in benchmarks/reports/<sha>.json
+#   benchmarks/run.sh --duration 60 --concurrency 16
+#
+# Extra arguments go to loadtest.py. GENERATE_ARGS goes to generate_data.py,
+# GUNICORN_ARGS replaces the worker flags, SERVER=asgi serves
+# django_project.asgi with uvicorn workers, and DATABASE_URL, CACHE_URL and
+# any other settings variable can be overridden from the environment. Server
+# output (including the console email backend) goes to $DATA/gunicorn.log.
+set -eu
+
+cd "$(dirname "$0")/.."
+DATA=benchmarks/.data
+PORT=${PORT:-8765}
+REPORT=${REPORT:-benchmarks/reports/$(git rev-parse --short HEAD 2>/dev/null || echo local).json}
+
+export DEBUG=${DEBUG:-False}
+export SECRET_KEY=${SECRET_KEY:-benchmark-only-secret-key}
+export DATABASE_URL=${DATABASE_URL:-sqlite:///$DATA/bench.sqlite3}
+# without WAL and a longer lock timeout concurrent writers fail with "database is
+# locked"; set SQLITE_TUNED=0 to measure that
+export SQLITE_TUNED=${SQLITE_TUNED:-1}
+export METRICS_LOG_SAMPLE_RATE=${METRICS_LOG_SAMPLE_RATE:-0}
+
+mkdir -p "$DATA"
+rm -f "$DATA"/bench.sqlite3*
+python manage.py migrate --verbosity 0
+python manage.py collectstatic --noinput --verbosity 0
+python benchmarks/generate_data.py ${GENERATE_ARGS:-}
+
+case ${SERVER:-wsgi} in
+    asgi) APP="-k uvicorn.workers.UvicornWorker django_project.asgi" ;;
+    *) APP=django_project.wsgi ;;
+esac
+gunicorn --bind "127.0.0.1:$PORT" ${GUNICORN_ARGS:---workers 2} $APP > "$DATA/gunicorn.log" 2>&1 &
+GUNICORN=$!
+trap 'kill $GUNICORN 2>/dev/null' EXIT
+
+until python -c "import socket; socket.create_connection(('127.0.0.1', $PORT), 1)" 2>/dev/null; do
+    kill -0 $GUNICORN || exit 1
+    sleep 0.2
+done
+
+python benchmarks/loadtest.py --base-url "http://127.0.0.1:$PORT" --out "$REPORT" "$@"
+echo "report: $REPORT, server log: $DATA/gunicorn.log"
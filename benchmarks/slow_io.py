@@ -0,0 +1,31 @@
+"""
+Settings module for benchmarking under slow I/O: every query takes
+SLOW_QUERY_MS longer, as with a loaded or distant database. Used by
+benchmarks/asgi_vs_wsgi.sh:
+
+    DJANGO_SETTINGS_MODULE=benchmarks.slow_io SLOW_QUERY_MS=50 benchmarks/run.sh
+"""
+import time
+
+from django.db.backends.signals import connection_created
+
+from django_project.settings import *  # noqa: F401,F403
+from django_project.settings import env
+
+SLOW_QUERY_MS = env.int("SLOW_QUERY_MS", default=50)
+
+
+def delay(execute, sql, params, many, context):
+    # blocks the thread running the query, like waiting on the socket would
+    time.sleep(SLOW_QUERY_MS / 1000)
+    return execute(sql, params, many, context)
+
+
+def slow_down(sender, connection, **kwargs):
+    # per connection: under ASGI the queries run on the connections of
+    # sync_to_async threads, not on the ones a middleware would see
+    if delay not in connection.execute_wrappers:
+        connection.execute_wrappers.append(delay)
+
+
+connection_created.connect(slow_down, dispatch_uid="benchmarks.slow_io.slow_down")
@@ -0,0 +1,128 @@
+"""
+Invitation mail throughput: one SMTP connection per message (what the
+invitations adapter does) against InvitationMailer, which recycles one
+connection every ORGS_MAILER_MAX_MESSAGES messages.
+
+    python benchmarks/smtp_throughput.py --messages 2000
+    python benchmarks/smtp_throughput.py --host smtp.example.test --port 587 --tls
+
+Without --host the messages go to a sink SMTP server started in this
+process on 127.0.0.1, which accepts and discards everything. No database is
+needed.
+"""
+import argparse
+import os
+import socketserver
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_project.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.mail import EmailMultiAlternatives, get_connection  # noqa: E402
+
+from apps.orgs.mail import MAILER_MAX_MESSAGES, InvitationMailer  # noqa: E402
+
+BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    """The least of SMTP a client needs to deliver: every command is accepted."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 sink ESMTP")
+        while line := self.rfile.readline():
+            command = line[:4].upper()
+            if command == b"EHLO":
+                # one write: split replies hit delayed ACKs and measure those instead
+                self.reply("250-sink\r\n250 8BITMIME")
+            elif command == b"DATA":
+                self.reply("354 go ahead")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                self.server.messages += 1
+                self.reply("250 OK")
+            elif command == b"QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    connections = 0
+    messages = 0
+
+
+def messages(count):
+    for i in range(count):
+        message = EmailMultiAlternatives(
+            subject="You have been invited to Acme",
+            body=f"Accept your invitation: https://example.com/orgs/invitations/accept-invite/key{i}/\n" * 20,
+            from_email="webmaster@localhost",
+            to=[f"invitee{i}@example.com"],
+        )
+        message.attach_alternative(f"<p>{message.body}</p>", "text/html")
+        yield message
+
+
+def per_message(count, connection_kwargs):
+    for message in messages(count):
+        # a fresh connection per send, as send_mail() without a connection
+        message.connection = get_connection(**connection_kwargs)
+        message.send()
+    return count
+
+
+def shared(count, connection_kwargs, max_messages):
+    with InvitationMailer(max_messages=max_messages, **connection_kwargs) as mailer:
+        for message in messages(count):
+            mailer.send(message)
+    return mailer.connections_opened
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--max-messages", type=int, default=MAILER_MAX_MESSAGES, help="InvitationMailer recycling.")
+    parser.add_argument("--host", help="SMTP server to send to (default: a local sink).")
+    parser.add_argument("--port", type=int, default=25)
+    parser.add_argument("--tls", action="store_true", help="Use STARTTLS.")
+    args = parser.parse_args()
+
+    server = None
+    if args.host:
+        host, port = args.host, args.port
+    else:
+        server = SinkServer(("127.0.0.1", 0), SinkHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address
+    connection_kwargs = {"backend": BACKEND, "host": host, "port": port, "use_tls": args.tls, "timeout": 10}
+
+    for name, run in (
+        ("one connection per message", lambda: per_message(args.messages, connection_kwargs)),
+        (f"InvitationMailer ({args.max_messages}/conn)", lambda: shared(args.messages, connection_kwargs, args.max_messages)),
+    ):
+        started = time.perf_counter()
+        connections = run()
+        elapsed = time.perf_counter() - started
+        print(f"{name}: messages={args.messages} connections={connections} msg/s={args.messages / elapsed:,.0f}")
+    if server:
+        server.shutdown()
+        print(f"sink received {server.messages} messages over {server.connections} connections")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Concurrent writers (and readers) against one SQLite file, with and without
+SQLITE_TUNED. Each writer process repeats what company_create does (company
+plus owner membership in one transaction); readers page through the
+company table at the same time, as the list views would.
+
+    python benchmarks/sqlite_writers.py --writers 8 --readers 4
+    SQLITE_TUNED=1 python benchmarks/sqlite_writers.py --writers 8 --readers 4
+
+Uses a fresh database file in a temporary directory unless --path is given.
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def setup(path):
+    sys.path.insert(0, str(ROOT))
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_project.settings")
+    import django
+
+    django.setup()
+
+
+def writer(path, worker, seconds, results):
+    setup(path)
+    from django.contrib.auth import get_user_model
+    from django.db import OperationalError, transaction
+
+    from apps.orgs.models import Company, Membership
+    from apps.orgs.roles import OWNER, registry
+
+    user = get_user_model().objects.get(username="bench")
+    role = registry.get(OWNER)
+    latencies, errors, i = [], 0, 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        i += 1
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                company = Company.objects.create(name=f"bench-{worker}-{i}", owner=user, creator=user)
+                Membership.objects.create(user=user, company=company, role=role)
+        except OperationalError:  # database is locked
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    results.put(("write", latencies, errors))
+
+
+def reader(path, seconds, results):
+    setup(path)
+    from django.db import OperationalError
+
+    from apps.orgs.models import Company
+
+    latencies, errors = [], 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            list(Company.objects.order_by("-id").values("id", "name", "member_count")[:50])
+        except OperationalError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    results.put(("read", latencies, errors))
+
+
+def report(kind, latencies, errors, seconds):
+    ms = [latency * 1000 for latency in latencies]
+    cuts = statistics.quantiles(ms, n=100) if len(ms) > 1 else [0.0] * 99
+    print(
+        f"{kind}: ops={len(ms)} ops/s={len(ms) / seconds:.0f} errors={errors} "
+        f"p50={cuts[49]:.2f}ms p95={cuts[94]:.2f}ms p99={cuts[98]:.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--path", help="SQLite file to use (migrated if needed).")
+    args = parser.parse_args()
+
+    path = args.path or os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{path}"}
+    subprocess.run([sys.executable, str(ROOT / "manage.py"), "migrate", "-v0"], env=env, check=True)
+    setup(path)
+    from django.conf import settings
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+
+    get_user_model().objects.get_or_create(username="bench", defaults={"email": "bench@example.com"})
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode")
+        journal_mode = cursor.fetchone()[0]
+    connection.close()
+
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=writer, args=(path, n, args.seconds, results)) for n in range(args.writers)
+    ] + [multiprocessing.Process(target=reader, args=(path, args.seconds, results)) for _ in range(args.readers)]
+    for process in processes:
+        process.start()
+    collected = {"write": ([], 0), "read": ([], 0)}
+    for _ in processes:
+        kind, latencies, errors = results.get()
+        collected[kind] = (collected[kind][0] + latencies, collected[kind][1] + errors)
+    for process in processes:
+        process.join()
+
+    print(f"journal_mode={journal_mode} pragmas={settings.SQLITE_PRAGMAS or 'default'} "
+          f"writers={args.writers} readers={args.readers} seconds={args.seconds}")
+    for kind, (latencies, errors) in collected.items():
+        report(kind, latencies, errors, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
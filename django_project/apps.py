@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class ProjectConfig(AppConfig):
+    name = "django_project"
+    verbose_name = "Project"
+
+    def ready(self):
+        from .db import configure_sqlite
+        from .metrics import install_timing
+
+        # no-op unless SQLITE_PRAGMAS is set
+        connection_created.connect(configure_sqlite, dispatch_uid="django_project.db.configure_sqlite")
+        connection_created.connect(install_timing, dispatch_uid="django_project.metrics.install_timing")
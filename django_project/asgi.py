@@ -1,7 +1,19 @@
+"""
+ASGI entry point, for serving with uvicorn workers under gunicorn:
+
+    gunicorn --bind :8000 --workers 2 -k uvicorn.workers.UvicornWorker django_project.asgi
+
+The org pages (company list and detail, membership list) are async views,
+so a request waiting on the database doesn't hold up the worker.
+"""
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_project.settings")
+# Under ASGI each request gets its own connection, so a persistent one is
+# never reused and only stays open; Django advises against them there:
+# https://docs.djangoproject.com/en/5.0/ref/databases/#persistent-connections
+os.environ.setdefault("CONN_MAX_AGE", "0")
 
 application = get_asgi_application()
@@ -0,0 +1,15 @@
+from django.conf import settings
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    ``connection_created`` receiver applying settings.SQLITE_PRAGMAS to every
+    new SQLite connection. Django 5.0 has no ``init_command`` for SQLite, so
+    this is the only per-connection hook.
+    """
+    pragmas = getattr(settings, "SQLITE_PRAGMAS", None)
+    if connection.vendor != "sqlite" or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
@@ -0,0 +1,256 @@
+"""
+Per-request timing: query count, database time, template render time and
+total latency.
+
+MetricsMiddleware reports them in a ``Server-Timing`` header, a sampled
+``request.timing key=value`` log line and an in-process registry served in
+the Prometheus text format by :func:`metrics_view`. The registry is per
+process, so with several gunicorn workers each scrape sees one worker;
+label the target by worker or scrape them individually.
+"""
+import contextvars
+import hmac
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+# seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = contextvars.ContextVar("request_timing", default=None)
+
+
+class Timing:
+    __slots__ = ("queries", "db", "template")
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.template = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+
+def time_query(execute, sql, params, many, context):
+    """Execute wrapper timing the query for the current request, if any."""
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    return timing(execute, sql, params, many, context)
+
+
+def install_timing(sender, connection, **kwargs):
+    """
+    ``connection_created`` receiver adding :func:`time_query` to every new
+    connection. Connections belong to a thread, and under ASGI the ORM runs
+    in sync_to_async threads, so the middleware can't wrap the connections
+    a request will use; the wrapper finds the request's :class:`Timing`
+    through the context, which those threads inherit.
+    """
+    if time_query not in connection.execute_wrappers:
+        # outermost, so the other wrappers' time counts as database time
+        connection.execute_wrappers.insert(0, time_query)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timing = _current.get()
+        if timing is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timing.template += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing top-level renders for the current
+    request. Includes and ``{% extends %}`` render inside them, so nothing
+    is counted twice.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.requests = {}
+        self.durations = {}
+        self.db_queries = {}
+        self.db_seconds = {}
+        self.template_seconds = {}
+
+    def observe(self, view, method, status, duration, timing):
+        with self._lock:
+            key = (view, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            buckets, total, count = self.durations.get(view) or ([0] * len(BUCKETS), 0.0, 0)
+            index = bisect_left(BUCKETS, duration)
+            if index < len(BUCKETS):
+                buckets[index] += 1
+            self.durations[view] = (buckets, total + duration, count + 1)
+            self.db_queries[view] = self.db_queries.get(view, 0) + timing.queries
+            self.db_seconds[view] = self.db_seconds.get(view, 0.0) + timing.db
+            self.template_seconds[view] = self.template_seconds.get(view, 0.0) + timing.template
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def render(self):
+        with self._lock:
+            lines = [
+                "# HELP rokkad_http_requests_total Requests handled, by view, method and status.",
+                "# TYPE rokkad_http_requests_total counter",
+            ]
+            for (view, method, status), value in sorted(self.requests.items()):
+                lines.append(f'rokkad_http_requests_total{{view="{view}",method="{method}",status="{status}"}} {value}')
+            lines += [
+                "# HELP rokkad_http_request_duration_seconds Request latency, by view.",
+                "# TYPE rokkad_http_request_duration_seconds histogram",
+            ]
+            for view, (buckets, total, count) in sorted(self.durations.items()):
+                cumulative = 0
+                for bound, value in zip(BUCKETS, buckets):
+                    cumulative += value
+                    lines.append(f'rokkad_http_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                lines.append(f'rokkad_http_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {count}')
+                lines.append(f'rokkad_http_request_duration_seconds_sum{{view="{view}"}} {total:.6f}')
+                lines.append(f'rokkad_http_request_duration_seconds_count{{view="{view}"}} {count}')
+            for name, help_text, values in (
+                ("rokkad_db_queries_total", "Database queries, by view.", self.db_queries),
+                ("rokkad_db_duration_seconds_total", "Time spent in the database, by view.", self.db_seconds),
+                ("rokkad_template_duration_seconds_total", "Time spent rendering templates, by view.",
+                 self.template_seconds),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for view, value in sorted(values.items()):
+                    value = f"{value:.6f}" if isinstance(value, float) else value
+                    lines.append(f'{name}{{view="{view}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def view_label(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        # unresolved paths share one label to keep the series count bounded
+        return "<unresolved>"
+    if match.view_name:
+        return match.view_name
+    view = getattr(match.func, "view_class", match.func)
+    return f"{view.__module__}.{view.__qualname__}"
+
+
+class MetricsMiddleware:
+    """
+    Times every request. Goes first in MIDDLEWARE so the latency covers the
+    rest of the stack. Works under WSGI and ASGI; queries are timed by
+    :func:`install_timing`, connected in django_project/apps.py. Settings:
+
+    * ``METRICS_SERVER_TIMING``: add the ``Server-Timing`` header.
+    * ``METRICS_LOG_SAMPLE_RATE``: share of requests logged (0-1).
+    * ``METRICS_SLOW_REQUEST_MS``: always log requests slower than this.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, "METRICS_SERVER_TIMING", True)
+        self.sample_rate = getattr(settings, "METRICS_LOG_SAMPLE_RATE", 0.01)
+        self.slow_ms = getattr(settings, "METRICS_SLOW_REQUEST_MS", 1000)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timing = Timing()
+        token = _current.set(timing)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.record(request, response, timing, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        timing = Timing()
+        token = _current.set(timing)
+        started = time.perf_counter()
+        try:
+            # sync_to_async runs code in a copy of this context, so the
+            # threads the ORM runs in see _current too
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.record(request, response, timing, time.perf_counter() - started)
+
+    def record(self, request, response, timing, duration):
+        view = view_label(request)
+        registry.observe(view, request.method, response.status_code, duration, timing)
+        if self.server_timing:
+            response["Server-Timing"] = (
+                f'db;dur={timing.db * 1000:.1f};desc="{timing.queries} queries", '
+                f"tpl;dur={timing.template * 1000:.1f}, total;dur={duration * 1000:.1f}"
+            )
+        if duration * 1000 >= self.slow_ms or random.random() < self.sample_rate:
+            logger.info(
+                "request.timing method=%s view=%s status=%s duration_ms=%.1f db_queries=%s db_ms=%.1f template_ms=%.1f",
+                request.method, view, response.status_code, duration * 1000,
+                timing.queries, timing.db * 1000, timing.template * 1000,
+                extra={
+                    "method": request.method,
+                    "view": view,
+                    "status": response.status_code,
+                    "duration_ms": duration * 1000,
+                    "db_queries": timing.queries,
+                    "db_ms": timing.db * 1000,
+                    "template_ms": timing.template * 1000,
+                },
+            )
+        return response
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint, for staff users and scrapers sending
+    ``Authorization: Bearer <METRICS_TOKEN>``. The client address isn't
+    trusted: behind a proxy on the same host every request comes from it.
+    """
+    token = getattr(settings, "METRICS_TOKEN", "")
+    offered = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not (token and hmac.compare_digest(offered, token)) and not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,121 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = "replica"
+
+# models whose reads may be served by the replica
+REPLICA_MODELS = {
+    "orgs.company",
+    "orgs.membership",
+    "orgs.role",
+    "orgs.companyinvitation",
+}
+
+PIN_COOKIE = "orgs_primary_until"
+
+_pinned = contextvars.ContextVar("orgs_pinned_to_primary", default=False)
+# None outside PrimaryPinMiddleware, so writes only pin within a request
+_wrote = contextvars.ContextVar("orgs_wrote_to_primary", default=None)
+
+
+@contextmanager
+def pin_to_primary():
+    """Send every read in the block to the primary."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Reads of the org models go to the "replica" alias when one is
+    configured (REPLICA_DATABASE_URL), everything else to the primary.
+
+    Reads stay on the primary inside a transaction, inside
+    :func:`pin_to_primary` and, through :class:`PrimaryPinMiddleware`, for
+    REPLICA_PIN_SECONDS after the user last wrote one of these models, so
+    they see their own changes despite replication lag.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower not in REPLICA_MODELS or REPLICA_DB_ALIAS not in settings.DATABASES:
+            return None
+        if _pinned.get() or _wrote.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if model._meta.label_lower in REPLICA_MODELS and _wrote.get() is not None:
+            _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replica gets its schema through replication
+        return db != REPLICA_DB_ALIAS
+
+
+class PrimaryPinMiddleware:
+    """
+    Pins a user's reads to the primary for REPLICA_PIN_SECONDS after a
+    request that wrote an org model. The deadline travels in a cookie, so
+    pinning costs no session write and works for anonymous invitees too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = self.start(request)
+        try:
+            return self.finish(self.get_response(request))
+        finally:
+            self.reset(tokens)
+
+    async def __acall__(self, request):
+        # writes made in sync_to_async threads (the async ORM) set _wrote in
+        # a copy of this context, which asgiref copies back when they return
+        tokens = self.start(request)
+        try:
+            return self.finish(await self.get_response(request))
+        finally:
+            self.reset(tokens)
+
+    def start(self, request):
+        try:
+            pinned = float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        return _pinned.set(pinned), _wrote.set(False)
+
+    def finish(self, response):
+        seconds = getattr(settings, "REPLICA_PIN_SECONDS", 5)
+        if _wrote.get() and seconds:
+            response.set_cookie(
+                PIN_COOKIE, f"{time.time() + seconds:.3f}", max_age=seconds, httponly=True, samesite="Lax"
+            )
+        return response
+
+    def reset(self, tokens):
+        pinned_token, wrote_token = tokens
+        _wrote.reset(wrote_token)
+        _pinned.reset(pinned_token)
@@ -41,30 +41,38 @@ INSTALLED_APPS = [
     "allauth.account",
     "crispy_forms",
     "crispy_bootstrap5",
-    "debug_toolbar",
     # Local
     "accounts",
     "pages",
     "invitations",
     "apps.orgs",
+    "django_project.apps.ProjectConfig",
 ]
 
 # https://docs.djangoproject.com/en/dev/ref/settings/#middleware
 MIDDLEWARE = [
+    "django_project.metrics.MetricsMiddleware",  # query count and latency, see METRICS_* below
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",  # WhiteNoise
+    "django_project.staticfiles.WhiteNoiseMiddleware",  # WhiteNoise, async-capable
+    "django_project.routers.PrimaryPinMiddleware",  # read-your-writes with a replica
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.locale.LocaleMiddleware",
     "django.middleware.common.CommonMiddleware",
-    "debug_toolbar.middleware.DebugToolbarMiddleware",  # Django Debug Toolbar
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "allauth.account.middleware.AccountMiddleware",  # django-allauth
+    "apps.orgs.middleware.TenantMiddleware",  # active workspace -> request.tenant
     
 ]
 
+# django-debug-toolbar, development only
+if DEBUG:
+    INSTALLED_APPS.append("debug_toolbar")
+    MIDDLEWARE.insert(MIDDLEWARE.index("django.middleware.common.CommonMiddleware") + 1,
+                      "debug_toolbar.middleware.DebugToolbarMiddleware")
+
 # https://docs.djangoproject.com/en/dev/ref/settings/#root-urlconf
 ROOT_URLCONF = "django_project.urls"
 
@@ -74,7 +82,8 @@ WSGI_APPLICATION = "django_project.wsgi.application"
 # https://docs.djangoproject.com/en/dev/ref/settings/#templates
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates, timing renders for django_project.metrics
+        "BACKEND": "django_project.metrics.TimedDjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -89,24 +98,57 @@ TEMPLATES = [
 ]
 
 # https://docs.djangoproject.com/en/dev/ref/settings/#databases
+# DATABASE_URL selects the database, e.g.
+# postgres://postgres@db:5432/postgres (see docker-compose.yml); SQLite by default.
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+    "default": env.db("DATABASE_URL", default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}"),
 }
+# https://docs.djangoproject.com/en/dev/ref/databases/#persistent-connections
+# Keep each worker's connection open between requests instead of reconnecting
+# every time, and check it before reuse so a restarted database doesn't
+# surface as an error. CONN_MAX_AGE is in seconds; 0 closes after each request.
+DATABASES["default"]["CONN_MAX_AGE"] = env.int("CONN_MAX_AGE", default=60)
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = env.bool("CONN_HEALTH_CHECKS", default=True)
+# Optional read replica: django_project.routers sends reads of the org models
+# to it, pinning a user to the primary for REPLICA_PIN_SECONDS after they
+# write. Two local SQLite files work for trying it out, e.g.
+# REPLICA_DATABASE_URL=sqlite:////tmp/replica.sqlite3 (copy db.sqlite3 there).
+if env("REPLICA_DATABASE_URL", default=""):
+    DATABASES["replica"] = env.db("REPLICA_DATABASE_URL")
+    DATABASES["replica"]["CONN_MAX_AGE"] = DATABASES["default"]["CONN_MAX_AGE"]
+    DATABASES["replica"]["CONN_HEALTH_CHECKS"] = DATABASES["default"]["CONN_HEALTH_CHECKS"]
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+DATABASE_ROUTERS = ["django_project.routers.PrimaryReplicaRouter"]
+REPLICA_PIN_SECONDS = env.int("REPLICA_PIN_SECONDS", default=5)
 
-# For Docker/PostgreSQL usage uncomment this and comment the DATABASES config above
-# DATABASES = {
-#     "default": {
-#         "ENGINE": "django.db.backends.postgresql",
-#         "NAME": "postgres",
-#         "USER": "postgres",
-#         "PASSWORD": "postgres",
-#         "HOST": "db",  # set in docker-compose.yml
-#         "PORT": 5432,  # default postgres port
-#     }
-# }
+# Opt-in tuning for single-box SQLite installs (SQLITE_TUNED=1), applied to
+# each connection by django_project/db.py: WAL lets readers run alongside a
+# writer, and synchronous=NORMAL is safe under WAL.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 128 * 1024 * 1024,
+    "cache_size": -20000,  # KiB
+    "temp_store": "MEMORY",
+} if env.bool("SQLITE_TUNED", default=False) else {}
+# Transactions take the write lock when they begin (django_project/sqlite3),
+# and a blocked writer waits SQLITE_BUSY_TIMEOUT for it before failing with
+# "database is locked". sqlite3 waits 5 s by default, too little for a
+# burst of writers queued behind a long transaction.
+if SQLITE_PRAGMAS and DATABASES["default"]["ENGINE"].endswith("sqlite3"):
+    DATABASES["default"]["ENGINE"] = "django_project.sqlite3"
+    DATABASES["default"].setdefault("OPTIONS", {})["timeout"] = env.int("SQLITE_BUSY_TIMEOUT", default=20)  # s
+
+# https://docs.djangoproject.com/en/dev/topics/cache/
+# CACHE_URL picks the backend, e.g. locmemcache:// (default),
+# filecache:///var/tmp/rokkad_cache or redis://redis:6379/1 (needs the
+# `redis` package). locmem is per process: with several workers use a shared
+# backend, or cache invalidation only reaches the worker that made the change.
+CACHES = {
+    "default": env.cache("CACHE_URL", default="locmemcache://"),
+}
+# seconds a page stays in the per-user view cache (apps.orgs.viewcache), 0 disables it
+VIEW_CACHE_TIMEOUT = env.int("VIEW_CACHE_TIMEOUT", default=300)
 
 # https://docs.djangoproject.com/en/dev/ref/settings/#auth-password-validators
 AUTH_PASSWORD_VALIDATORS = [
@@ -195,6 +237,8 @@ ACCOUNT_LOGOUT_REDIRECT_URL = "home"
 AUTHENTICATION_BACKENDS = (
     "django.contrib.auth.backends.ModelBackend",
     "allauth.account.auth_backends.AuthenticationBackend",
+    # company scoped object permissions: user.has_perm(perm, company)
+    "apps.orgs.backends.CompanyPermissionBackend",
 )
 # https://django-allauth.readthedocs.io/en/latest/configuration.html
 ACCOUNT_SESSION_REMEMBER = True
@@ -210,3 +254,32 @@ INVITATIONS_INVITE_FORM = "apps.orgs.forms.CompanyInvitationForm"
 INVITATIONS_ADMIN_ADD_FORM = "apps.orgs.forms.InvitationAdminAddForm"
 ACCOUNT_ADAPTER="invitations.models.InvitationsAdapter"
 INVITATIONS_ADAPTER="invitations.models.InvitationsAdapter"
+
+# Request instrumentation (django_project.metrics): Server-Timing header,
+# sampled "request.timing" log lines and Prometheus metrics at /metrics.
+METRICS_SERVER_TIMING = env.bool("METRICS_SERVER_TIMING", default=True)
+METRICS_LOG_SAMPLE_RATE = env.float("METRICS_LOG_SAMPLE_RATE", default=0.01)
+METRICS_SLOW_REQUEST_MS = env.int("METRICS_SLOW_REQUEST_MS", default=1000)
+# bearer token for Prometheus (bearer_token in the scrape config); without
+# one, /metrics is for staff users only
+METRICS_TOKEN = env("METRICS_TOKEN", default="")
+
+# https://docs.djangoproject.com/en/dev/topics/logging/
+# Messages from our apps are "event key=value ..." lines; fields are also
+# passed as `extra` for handlers that emit JSON.
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "kv": {"format": "%(asctime)s level=%(levelname)s logger=%(name)s %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "kv"},
+    },
+    "loggers": {
+        "apps": {"handlers": ["console"], "level": env("LOG_LEVEL", default="INFO")},
+        "django_project": {"handlers": ["console"], "level": env("LOG_LEVEL", default="INFO")},
+        # Django only prints 5xx tracebacks to the console when DEBUG is on
+        "django.request": {"handlers": ["console"], "level": "ERROR"},
+    },
+}
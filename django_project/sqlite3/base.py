@@ -0,0 +1,14 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    SQLite backend whose transactions start with BEGIN IMMEDIATE, taking the
+    write lock up front. Under WAL a transaction that reads first and then
+    writes can't wait for the lock once another writer has committed: it
+    fails at once with "database is locked" instead of honouring the busy
+    timeout. Django 5.1 offers this as OPTIONS["transaction_mode"].
+    """
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute("BEGIN IMMEDIATE")
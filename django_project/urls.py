@@ -3,6 +3,8 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls import i18n
 
+from .metrics import metrics_view
+
 urlpatterns = [
     path('i18n/', include(i18n)),
     path("admin/", admin.site.urls),
@@ -11,6 +13,7 @@ urlpatterns = [
     path("invitations/", include("invitations.urls")),
     path("orgs/", include("apps.orgs.urls")),
     path("profile/", include("accounts.urls")),
+    path("metrics", metrics_view, name="metrics"),
 ]
 
 if settings.DEBUG:
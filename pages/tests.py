@@ -1,3 +1,114 @@
-from django.test import TestCase
+import asyncio
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import ResolverMatch, resolve, reverse
+from django.views.generic import TemplateView
+
+from apps.orgs.testing import TEST_STORAGES, QueryBudgetMixin
+from django_project.metrics import MetricsMiddleware, metrics_view, registry, view_label
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class HomePageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_first_visit_is_not_cached(self):
+        response = self.client.get(reverse("home"))
+        self.assertIn("csrftoken", response.cookies)
+        # the page embeds a token for the cookie just minted, so it must not
+        # be served to the next visitor without a cookie
+        client = self.client_class()
+        self.assertIn("csrftoken", client.get(reverse("home")).cookies)
+
+    def test_page_is_cached_per_csrf_cookie(self):
+        self.client.get(reverse("home"))
+        first = self.client.get(reverse("home"))
+        second = self.client.get(reverse("home"))
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(second.templates, [])
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class MetricsMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.clear()
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse("about"))
+        self.assertRegex(response["Server-Timing"], r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_queries_are_timed_under_asgi(self):
+        def query():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+
+        async def view(request):
+            # runs on the connection of an executor thread, as the async ORM does
+            await sync_to_async(query)()
+            await sync_to_async(query, thread_sensitive=False)()
+            return HttpResponse()
+
+        response = asyncio.run(MetricsMiddleware(view)(RequestFactory().get("/")))
+        self.assertIn('desc="2 queries"', response["Server-Timing"])
+
+    @override_settings(METRICS_LOG_SAMPLE_RATE=1)
+    def test_sampled_requests_are_logged(self):
+        with self.assertLogs("django_project.metrics", "INFO") as logs:
+            self.client.get(reverse("about"))
+        self.assertIn("request.timing method=GET view=about status=200", logs.output[0])
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse("about"))
+        self.client.get("/no-such-page/")
+        with override_settings(METRICS_TOKEN="s3cret"):
+            response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer s3cret")
+        body = response.content.decode()
+        self.assertIn('rokkad_http_requests_total{view="about",method="GET",status="200"} 1', body)
+        self.assertIn('rokkad_http_requests_total{view="<unresolved>",method="GET",status="404"} 1', body)
+        self.assertIn('rokkad_http_request_duration_seconds_count{view="about"} 1', body)
+        self.assertIn('rokkad_template_duration_seconds_total{view="about"}', body)
+
+    def test_metrics_endpoint_is_restricted(self):
+        # a proxy on the same host makes every request local
+        self.assertEqual(self.client.get(reverse("metrics"), REMOTE_ADDR="127.0.0.1").status_code, 403)
+        with override_settings(METRICS_TOKEN="s3cret"):
+            self.assertEqual(self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        # an empty token doesn't match an unset one
+        self.assertEqual(self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer ").status_code, 403)
+        staff = get_user_model().objects.create_user(username="staff", password="pass", is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 200)
+
+    def test_unnamed_views_are_labelled_by_import_path(self):
+        request = RequestFactory().get("/")
+        request.resolver_match = resolve(reverse("about"))
+        self.assertEqual(view_label(request), "about")
+        request.resolver_match = ResolverMatch(TemplateView.as_view(), (), {})
+        self.assertEqual(view_label(request), "django.views.generic.base.TemplateView")
+        request.resolver_match = ResolverMatch(metrics_view, (), {})
+        self.assertEqual(view_label(request), "django_project.metrics.metrics_view")
+
+
+@override_settings(STORAGES=TEST_STORAGES)
+class PagesQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def test_static_pages_need_no_queries(self):
+        for name in ("home", "about"):
+            with self.subTest(name=name):
+                cache.clear()
+                self.assertQueryBudget(0, lambda: self.client.get(reverse(name)))
+
+    def test_static_pages_for_a_user(self):
+        user = get_user_model().objects.create_user(username="user", password="pass")
+        self.client.force_login(user)
+        for name in ("home", "about"):
+            with self.subTest(name=name):
+                cache.clear()
+                # session and user
+                self.assertQueryBudget(2, lambda: self.client.get(reverse(name)))
@@ -1,9 +1,14 @@
+from django.utils.decorators import method_decorator
 from django.views.generic import TemplateView
 
+from apps.orgs.viewcache import cache_per_user
 
+
+@method_decorator(cache_per_user(), name="dispatch")
 class HomePageView(TemplateView):
     template_name = "pages/home.html"
 
 
+@method_decorator(cache_per_user(), name="dispatch")
 class AboutPageView(TemplateView):
     template_name = "pages/about.html"